@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from core.metrics import registry
+
+router = APIRouter(tags=["System"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Every registered metric in the Prometheus text exposition format."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
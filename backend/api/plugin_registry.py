@@ -1,6 +1,7 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 
-from core.plugin_loader import get_registry
+from core import plugin_loader
+from core.plugin_loader import get_registry, get_startup_profile
 
 router = APIRouter(prefix="/api", tags=["Plugin Registry"])
 
@@ -9,3 +10,42 @@ router = APIRouter(prefix="/api", tags=["Plugin Registry"])
 async def list_plugins():
     """Return all registered plugin manifests."""
     return list(get_registry().values())
+
+
+@router.get("/startup-profile")
+async def startup_profile():
+    """Time spent on each plugin's import, migrations, initialize, routes and tasks at startup (ms).
+
+    A plugin reloaded or enabled since shows the timings of its latest load.
+    """
+    return get_startup_profile()
+
+
+async def _change(operation, name: str) -> dict:
+    try:
+        status = await operation(name)
+    except plugin_loader.PluginNotFound:
+        raise HTTPException(status_code=404, detail=f"Plugin {name} not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if status["status"] == "failed":
+        raise HTTPException(status_code=500, detail=status)
+    return status
+
+
+@router.post("/plugins/{name}/reload")
+async def reload_plugin(name: str):
+    """Re-import a plugin and register its routes and tasks again without a restart."""
+    return await _change(plugin_loader.reload_plugin, name)
+
+
+@router.post("/plugins/{name}/enable")
+async def enable_plugin(name: str):
+    """Enable a plugin in its manifest and load it."""
+    return await _change(plugin_loader.enable_plugin, name)
+
+
+@router.post("/plugins/{name}/disable")
+async def disable_plugin(name: str):
+    """Disable a plugin in its manifest and unload it."""
+    return await _change(plugin_loader.disable_plugin, name)
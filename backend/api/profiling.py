@@ -0,0 +1,71 @@
+import json
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field
+
+from core.profiling import FORMATS, profiler
+
+router = APIRouter(prefix="/api/profiling", tags=["Profiling"])
+
+
+class ArmRequest(BaseModel):
+    # "scan" profiles the next scans; "request" the next requests under ``path``
+    target: Literal["scan", "request"]
+    count: int = Field(1, ge=1, le=100)
+    mode: Literal["sample", "cprofile"] = "sample"
+    path: str | None = None
+
+
+@router.get("")
+async def profiling_status():
+    """Armed captures, the capture running now, and stored profiles (newest first)."""
+    return {**profiler.status(), "profiles": profiler.list_profiles()}
+
+
+@router.post("")
+async def arm_profiling(body: ArmRequest):
+    """Profile the next ``count`` scans, or requests whose path starts with ``path``."""
+    try:
+        armed = profiler.arm(body.target, body.count, body.mode, body.path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return vars(armed)
+
+
+@router.delete("")
+async def disarm_profiling():
+    """Cancel every armed capture; a capture already running still completes."""
+    profiler.disarm()
+    return profiler.status()
+
+
+def _file(profile_id: str, suffix: str):
+    path = profiler.profile_path(profile_id, suffix)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} has no {suffix} file")
+    return path
+
+
+@router.get("/{profile_id}")
+async def get_profile(profile_id: str):
+    """A stored profile's metadata with its phase totals and spans."""
+    return FileResponse(_file(profile_id, ".json"), media_type="application/json")
+
+
+@router.get("/{profile_id}/download")
+async def download_profile(profile_id: str, format: Literal["pstats", "collapsed"] | None = None):
+    """The profile as cProfile ``pstats`` (``cprofile``) or flamegraph collapsed stacks (``sample``).
+
+    Each capture is stored in one format only, the default here.
+    """
+    metadata = json.loads(_file(profile_id, ".json").read_text(encoding="utf-8"))
+    captured = metadata["format"]
+    if format is not None and format != captured:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Profile {profile_id} was captured in {metadata['mode']} mode and has no {format} file; use format={captured}",
+        )
+    path = _file(profile_id, FORMATS[captured])
+    return FileResponse(path, filename=path.name, media_type="application/octet-stream")
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 
 from core.websocket_manager import ws_manager
+from core.workers import pool_stats
 
 router = APIRouter(prefix="/api", tags=["System"])
 
@@ -17,4 +18,6 @@ async def info():
         "description": "Network Management Platform",
         "version": "0.1.0",
         "websocket_clients": ws_manager.connection_count,
+        "websocket": ws_manager.stats(),
+        "worker_pools": pool_stats(),
     }
@@ -0,0 +1,148 @@
+"""Measure API latency while a full scan's parsing and enrichment runs.
+
+    python -m benchmarks.api_latency_bench
+    python -m benchmarks.api_latency_bench --devices 65536 --rounds 40 --mode process
+
+Requests go to ``/api/health`` and ``/api/info`` through the ASGI app in the
+same event loop the scan uses, so their latency is the loop's responsiveness.
+The scan is synthetic: one rtnetlink neighbour dump per ``SCAN_BATCH_SIZE``
+devices, parsed ``--rounds`` times to stand in for scapy's per-packet decoding,
+plus the batch's vendor lookups. ``inline`` does that work on the event loop,
+``thread`` in a thread pool (still under the GIL), ``process`` in a process
+pool as the scanner does.
+"""
+
+import argparse
+import asyncio
+import functools
+import socket
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from api.system import router as system_router
+from config import SCAN_BATCH_SIZE
+from core.workers import create_pool, shutdown_pools
+from plugins.lan_scanner.neighbours import (
+    NLMSG_DONE,
+    NDA_DST,
+    NDA_LLADDR,
+    RTM_NEWNEIGH,
+    _NDMSG,
+    _NLMSGHDR,
+    _RTATTR,
+    parse_neigh_messages,
+)
+from plugins.lan_scanner.workers import lookup_vendors
+
+_REACHABLE = 0x02
+
+
+def _dump(first: int, count: int) -> bytes:
+    """An RTM_NEWNEIGH dump for hosts ``first .. first + count`` of 10.0.0.0/8."""
+    parts = []
+    for i in range(first, first + count):
+        dst = socket.inet_aton(f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}")
+        mac = bytes((2, 0, i >> 24 & 255, i >> 16 & 255, i >> 8 & 255, i & 255))
+        attrs = _RTATTR.pack(_RTATTR.size + 4, NDA_DST) + dst + _RTATTR.pack(_RTATTR.size + 6, NDA_LLADDR) + mac + b"\0\0"
+        body = _NDMSG.pack(socket.AF_INET, 2, _REACHABLE, 0, 0) + attrs
+        parts.append(_NLMSGHDR.pack(_NLMSGHDR.size + len(body), RTM_NEWNEIGH, 0, 0, 0) + body)
+    parts.append(_NLMSGHDR.pack(_NLMSGHDR.size, NLMSG_DONE, 0, 0, 0))
+    return b"".join(parts)
+
+
+def parse_batch(data: bytes, rounds: int) -> dict[str, str | None]:
+    """One batch's parsing and vendor enrichment; module-level so process workers can run it."""
+    for _ in range(rounds):
+        table: dict[str, str] = {}
+        parse_neigh_messages(data, table)
+    vendors = lookup_vendors(list(table.values()))
+    return {ip: vendors[mac] for ip, mac in table.items()}
+
+
+async def _scan(batches: list[bytes], rounds: int, mode: str, saturation: list[float]) -> float:
+    start = time.perf_counter()
+    if mode == "inline":
+        for data in batches:
+            parse_batch(data, rounds)
+            await asyncio.sleep(0)
+    else:
+        pool = create_pool(f"bench.{mode}", mode)
+        # Results stream back as batches finish, with at most the pool's capacity in flight
+        async for _ in pool.stream(functools.partial(parse_batch, rounds=rounds), batches):
+            saturation.append(pool.stats()["saturation"])
+    return time.perf_counter() - start
+
+
+async def _request_loop(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list[float], interval: float) -> None:
+    """Issue requests on a fixed schedule, timing each from when it was due.
+
+    A request held up because the loop was busy counts the delay, so a blocked
+    loop shows up as latency rather than as fewer samples.
+    """
+    loop = asyncio.get_running_loop()
+    paths = ("/api/health", "/api/info")
+    due = loop.time()
+    i = 0
+    while not stop.is_set():
+        if due > loop.time():
+            await asyncio.sleep(due - loop.time())
+        response = await client.get(paths[i % len(paths)])
+        response.raise_for_status()
+        latencies.append(loop.time() - due)
+        due += interval
+        i += 1
+
+
+def _ms(values: list[float], q: int) -> str:
+    if len(values) < 2:
+        return f"{values[0] * 1000:.2f}ms" if values else "-"
+    return f"{statistics.quantiles(values, n=100, method='inclusive')[q - 1] * 1000:.2f}ms"
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=16384, help="devices discovered by the simulated scan")
+    parser.add_argument("--rounds", type=int, default=20, help="parse passes per batch, standing in for packet decoding")
+    parser.add_argument("--mode", choices=("all", "inline", "thread", "process"), default="all")
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between API requests")
+    args = parser.parse_args()
+
+    batches = [_dump(first, min(SCAN_BATCH_SIZE, args.devices - first)) for first in range(0, args.devices, SCAN_BATCH_SIZE)]
+    app = FastAPI()
+    app.include_router(system_router)
+    modes = ("inline", "thread", "process") if args.mode == "all" else (args.mode,)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for phase in ("idle", *modes):
+            stop = asyncio.Event()
+            latencies: list[float] = []
+            saturation: list[float] = []
+            if phase == "process":
+                # Start the workers outside the measurement; the app pays this once, on its first scan
+                pool = create_pool("bench.process", "process")
+                # Executors spawn workers on demand, so keep every one busy once
+                await asyncio.gather(*(pool.run(parse_batch, batches[0], 1) for _ in range(pool.workers)))
+            requests = asyncio.create_task(_request_loop(client, stop, latencies, args.interval))
+            if phase == "idle":
+                await asyncio.sleep(1)
+                scan_time = None
+            else:
+                scan_time = await _scan(batches, args.rounds, phase, saturation)
+            stop.set()
+            await requests
+
+            line = (f"{phase:>8}: {len(latencies)} requests, p50 {_ms(latencies, 50)}, "
+                    f"p99 {_ms(latencies, 99)}, max {max(latencies, default=0) * 1000:.2f}ms")
+            if scan_time is not None:
+                line += f" (scan {scan_time * 1000:.0f}ms"
+                line += f", peak pool saturation {max(saturation):.2f})" if saturation else ")"
+            print(line)
+
+    shutdown_pools("bench")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,40 @@
+"""Benchmark the native ARP engine against a replayed capture.
+
+    python -m benchmarks.arp_engine_bench 10.20.0.0/16
+    python -m benchmarks.arp_engine_bench 10.20.0.0/16 --pcap replies.pcap
+
+Without ``--pcap`` one synthetic reply per host is generated. No root or live
+LAN is needed.
+"""
+
+import argparse
+import asyncio
+import time
+
+from plugins.lan_scanner.arp_engine import ReplayTransport, sweep
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("subnet")
+    parser.add_argument("--pcap", help="replay frames from this capture instead of synthesizing them")
+    parser.add_argument("--write-pcap", help="save the synthesized capture to this path")
+    parser.add_argument("--rate", type=int, default=1_000_000, help="send rate in packets per second")
+    args = parser.parse_args()
+
+    if args.pcap:
+        transport = ReplayTransport.from_pcap(args.pcap)
+    else:
+        transport = ReplayTransport.synthesize(args.subnet)
+        if args.write_pcap:
+            transport.write_pcap(args.write_pcap)
+
+    start = time.perf_counter()
+    devices = await sweep(args.subnet, timeout=0, rate_pps=args.rate, transport=transport)
+    elapsed = time.perf_counter() - start
+    print(f"sent {transport.sent} requests, parsed {len(transport.frames)} frames, "
+          f"found {len(devices)} devices in {elapsed * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
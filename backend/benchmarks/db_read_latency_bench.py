@@ -0,0 +1,121 @@
+"""Measure API-style read latency while a scan-sized write transaction runs.
+
+    python -m benchmarks.db_read_latency_bench
+    python -m benchmarks.db_read_latency_bench --devices 20000 --readers 8
+    python -m benchmarks.db_read_latency_bench --journal-mode delete
+
+Uses a throwaway database with the same engine setup as the app: one writer
+connection and a read-only pool. ``--journal-mode delete`` shows the rollback
+journal behaviour the app used before WAL, where reads wait on (or fail
+behind) the writer.
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config import SQLITE_PRAGMAS
+from core.database import Base, create_engines
+from plugins.lan_scanner.models import Device
+from plugins.lan_scanner.reconcile import finalize_scan, upsert_devices
+
+
+def _devices(count: int) -> list[dict]:
+    return [
+        {
+            "ip_address": f"10.{20 + i // 65536}.{i // 256 % 256}.{i % 256}",
+            "mac_address": "02:00:%02x:%02x:%02x:%02x" % (i >> 24 & 255, i >> 16 & 255, i >> 8 & 255, i & 255),
+            "vendor": None,
+        }
+        for i in range(count)
+    ]
+
+
+async def _write(writer, devices: list[dict], hold: float) -> float:
+    """One scan's writes in a single transaction, held open for ``hold`` seconds."""
+    session_factory = async_sessionmaker(writer, class_=AsyncSession, expire_on_commit=False)
+    start = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    async with session_factory() as session:
+        await upsert_devices(session, devices, now, generation=1)
+        await finalize_scan(session, now, generation=1, complete_subnets=["10.0.0.0/8"])
+        await asyncio.sleep(hold)
+        await session.commit()
+    return time.perf_counter() - start
+
+
+async def _read_loop(reader, stop: asyncio.Event, latencies: list[float], errors: list[str]) -> None:
+    session_factory = async_sessionmaker(reader, class_=AsyncSession, expire_on_commit=False)
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            async with session_factory() as session:
+                await session.scalar(select(func.count(Device.id)).where(Device.status == "online"))
+                (await session.execute(select(Device).order_by(Device.ip_key).limit(100))).all()
+        except OperationalError as e:
+            errors.append(str(e.orig))
+        else:
+            latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0)
+
+
+def _ms(values: list[float], q: float) -> str:
+    if not values:
+        return "-"
+    return f"{statistics.quantiles(values, n=100)[int(q) - 1] * 1000:.2f}ms" if len(values) > 1 else f"{values[0] * 1000:.2f}ms"
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=5000, help="devices upserted by the simulated scan")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent read loops")
+    parser.add_argument("--hold", type=float, default=1.0, help="seconds the write transaction stays open")
+    parser.add_argument("--journal-mode", default=SQLITE_PRAGMAS["journal_mode"], help="wal or delete")
+    parser.add_argument("--busy-timeout", type=int, default=SQLITE_PRAGMAS["busy_timeout"], help="milliseconds")
+    args = parser.parse_args()
+
+    pragmas = {**SQLITE_PRAGMAS, "journal_mode": args.journal_mode, "busy_timeout": args.busy_timeout}
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}"
+        writer, reader = create_engines(url, pragmas)
+        async with writer.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        devices = _devices(args.devices)
+        # Seed so the scan is mostly updates, as in steady state
+        await _write(writer, devices, 0)
+
+        for phase in ("idle", "during scan"):
+            stop = asyncio.Event()
+            latencies: list[float] = []
+            errors: list[str] = []
+            readers = [asyncio.create_task(_read_loop(reader, stop, latencies, errors)) for _ in range(args.readers)]
+            if phase == "idle":
+                await asyncio.sleep(args.hold)
+                write_time = None
+            else:
+                write_time = await _write(writer, devices, args.hold)
+            stop.set()
+            await asyncio.gather(*readers)
+
+            line = (f"{phase:>12}: {len(latencies)} reads, p50 {_ms(latencies, 50)}, "
+                    f"p99 {_ms(latencies, 99)}, max {max(latencies, default=0) * 1000:.2f}ms, {len(errors)} errors")
+            if write_time is not None:
+                line += f" (write transaction {write_time * 1000:.0f}ms)"
+            print(line)
+            if errors:
+                print(f"{'':>14}first error: {errors[0]}")
+
+        await reader.dispose()
+        await writer.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""Resolve hostnames against fake local responders and check what comes back.
+
+    python -m benchmarks.hostname_resolver_bench
+    python -m benchmarks.hostname_resolver_bench --hosts 400 --silent 32
+
+Hosts are loopback addresses (127.20.x.y), so no network or root is needed. A
+quarter of them answer DNS PTR, a quarter mDNS, a quarter NetBIOS node status
+and the rest get NXDOMAIN; ``--silent`` more never get an answer, so only query
+timeouts and the deadline end their lookups. Then the cache is checked: a
+second pass must not query anything, and short TTLs, negative TTLs and LRU
+eviction must send the right lookups back to the network. Exits non-zero if a
+check fails.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from plugins.lan_scanner.resolver import HostnameResolver, LocalResponder
+
+
+def _host(i: int) -> str:
+    i += 1
+    return f"127.20.{i >> 8 & 255}.{i & 255}"
+
+
+class _Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def __call__(self, name: str, ok: bool, detail: str = "") -> None:
+        print(f"{'ok  ' if ok else 'FAIL'} {name}{f': {detail}' if detail else ''}")
+        self.failed += not ok
+
+
+async def _sweep(args, check: _Checks) -> None:
+    hosts = [_host(i) for i in range(args.hosts)]
+    silent = [_host(args.hosts + i) for i in range(args.silent)]
+    expected: dict[str, str | None] = {ip: None for ip in hosts + silent}
+    dns, mdns, netbios = {}, {}, {}
+    for i, ip in enumerate(hosts):
+        kind = i % 4
+        if kind == 0:
+            dns[ip] = expected[ip] = f"host-{i}.lan"
+        elif kind == 1:
+            mdns[ip] = expected[ip] = f"host-{i}.local"
+        elif kind == 2:
+            netbios[ip] = f"host-{i}"
+            # Node status names come back upper-case
+            expected[ip] = f"HOST-{i}"
+    # Everything DNS has no record for gets NXDOMAIN and falls through to mDNS and NetBIOS
+    nxdomain = set(hosts) - dns.keys()
+
+    responder = await LocalResponder(dns, nxdomain, mdns, netbios).start()
+    resolver = HostnameResolver(**responder.resolver_options(), query_timeout=args.timeout)
+    try:
+        start = time.perf_counter()
+        names = await resolver.resolve_many(list(expected), deadline=args.deadline)
+        elapsed = time.perf_counter() - start
+        wrong = {ip: names[ip] for ip in expected if names[ip] != expected[ip]}
+        check("first pass", not wrong, f"{len(expected)} hosts in {elapsed * 1000:.0f}ms, queries {responder.queries}"
+              + (f", wrong: {dict(list(wrong.items())[:5])}" if wrong else ""))
+
+        queries = dict(responder.queries)
+        start = time.perf_counter()
+        cached = await resolver.resolve_many(list(expected), deadline=args.deadline)
+        elapsed = time.perf_counter() - start
+        check("second pass from cache", cached == names and responder.queries == queries,
+              f"{elapsed * 1000:.1f}ms, {resolver.stats()}")
+
+        start = time.perf_counter()
+        late = await resolver.resolve_many([_host(args.hosts + args.silent + i) for i in range(8)], deadline=args.timeout / 2)
+        elapsed = time.perf_counter() - start
+        check("deadline", not any(late.values()) and elapsed < args.timeout,
+              f"8 unanswered hosts returned after {elapsed * 1000:.0f}ms")
+    finally:
+        await resolver.close()
+        responder.close()
+
+
+async def _expiry(args, check: _Checks) -> None:
+    named, missing = _host(0), _host(1)
+    responder = await LocalResponder({named: "short-lived.lan"}, {missing}, ttl=1).start()
+    resolver = HostnameResolver(**responder.resolver_options(), query_timeout=args.timeout, negative_ttl=1)
+    try:
+        for _ in range(2):
+            await resolver.resolve(named)
+            await resolver.resolve(missing)
+        check("positive and negative entries cached", responder.queries["dns"] == 2, str(responder.queries))
+        await asyncio.sleep(1.1)
+        name = await resolver.resolve(named)
+        await resolver.resolve(missing)
+        check("entries expire after their TTL", name == "short-lived.lan" and responder.queries["dns"] == 4,
+              str(responder.queries))
+    finally:
+        await resolver.close()
+        responder.close()
+
+
+async def _eviction(args, check: _Checks) -> None:
+    a, b, c = _host(0), _host(1), _host(2)
+    responder = await LocalResponder({a: "a.lan", b: "b.lan", c: "c.lan"}).start()
+    resolver = HostnameResolver(**responder.resolver_options(), query_timeout=args.timeout, cache_size=2)
+    try:
+        for ip in (a, b, a, c):
+            await resolver.resolve(ip)
+        # a was used after b, so c's entry pushed b out
+        evicted = [ip for ip in (a, b, c) if not resolver.cache.get(ip)[0]]
+        check("least recently used entry evicted", evicted == [b], f"evicted {evicted}, queries {responder.queries}")
+    finally:
+        await resolver.close()
+        responder.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hosts", type=int, default=256, help="hosts that resolve or get NXDOMAIN")
+    parser.add_argument("--silent", type=int, default=16, help="hosts whose queries are never answered")
+    parser.add_argument("--timeout", type=float, default=0.2, help="per-query timeout in seconds")
+    parser.add_argument("--deadline", type=float, default=10, help="resolve_many deadline in seconds")
+    args = parser.parse_args()
+
+    check = _Checks()
+    await _sweep(args, check)
+    await _expiry(args, check)
+    await _eviction(args, check)
+    sys.exit(1 if check.failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
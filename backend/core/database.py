@@ -1,25 +1,153 @@
+import time
+
+from sqlalchemy import event, inspect, make_url, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from config import (
+    DATABASE_URL,
+    DB_READ_POOL_OVERFLOW,
+    DB_READ_POOL_SIZE,
+    DB_WRITE_POOL_SIZE,
+    DB_WRITER_POOL_TIMEOUT,
+    SQLITE_PRAGMAS,
+)
+from core.metrics import registry
+from core.profiling import record_span
+
+db_query_seconds = registry.histogram(
+    "db_query_duration_seconds", "Database statement latency by engine and operation", ("engine", "operation"),
+)
+_OPERATIONS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE"))
+
+
+def apply_sqlite_pragmas(engine, pragmas: dict, query_only: bool = False) -> None:
+    """Run ``PRAGMA name=value`` for each entry on every new connection of ``engine``."""
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if query_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def instrument_engine(engine, role: str) -> None:
+    """Time every statement ``engine`` executes into ``db_query_duration_seconds``."""
+    children = {op: db_query_seconds.labels(role, op) for op in (*_OPERATIONS, "OTHER")}
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        # On the execution context rather than the connection, so a failed statement leaves nothing behind
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        end = time.perf_counter()
+        operation = statement.lstrip()[:6].upper()
+        if operation not in _OPERATIONS:
+            operation = "OTHER"
+        children[operation].observe(end - context._query_start)
+        record_span(f"db.{operation.lower()}", context._query_start, end)
+
 
-from config import DATABASE_URL
+def create_engines(url: str = DATABASE_URL, pragmas: dict = SQLITE_PRAGMAS):
+    """The writer engine and the read-only engine for ``url``.
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+    SQLite allows one writer at a time, so all writes share a single pooled
+    connection and queue for it in-process instead of failing with "database is
+    locked". In WAL mode readers never block on that writer, so API reads get
+    their own pool of ``query_only`` connections. A server database (PostgreSQL
+    via asyncpg) takes concurrent writers, so its writer pool is
+    ``DB_WRITE_POOL_SIZE`` wide and its readers run read-only transactions.
+    """
+    if make_url(url).get_backend_name() == "sqlite":
+        writer = create_async_engine(
+            url, echo=False, pool_size=1, max_overflow=0, pool_timeout=DB_WRITER_POOL_TIMEOUT,
+        )
+        reader = create_async_engine(
+            url, echo=False, pool_size=DB_READ_POOL_SIZE, max_overflow=DB_READ_POOL_OVERFLOW,
+        )
+        apply_sqlite_pragmas(writer, pragmas)
+        apply_sqlite_pragmas(reader, pragmas, query_only=True)
+    else:
+        writer = create_async_engine(
+            url, echo=False, pool_size=DB_WRITE_POOL_SIZE, max_overflow=0,
+            pool_timeout=DB_WRITER_POOL_TIMEOUT, pool_pre_ping=True,
+        )
+        reader = create_async_engine(
+            url, echo=False, pool_size=DB_READ_POOL_SIZE, max_overflow=DB_READ_POOL_OVERFLOW,
+            pool_pre_ping=True, execution_options={"postgresql_readonly": True},
+        )
+    instrument_engine(writer, "writer")
+    instrument_engine(reader, "reader")
+    return writer, reader
+
+
+engine, read_engine = create_engines()
 async_session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+read_session_factory = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
 
 
 class Base(DeclarativeBase):
     pass
 
 
-async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+def upsert(table):
+    """``INSERT`` supporting ``on_conflict_do_update`` and ``excluded`` on the configured backend.
+
+    SQLite and PostgreSQL spell the upsert the same way in SQLAlchemy but through
+    dialect-specific constructs; this picks the one matching ``engine``.
+    """
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def add_missing_columns(connection, tables=None) -> None:
+    """Add columns declared on existing tables but missing from the database.
+
+    ``create_all`` only creates missing tables, so columns added to a model later
+    would otherwise never reach databases created by an older version.
+    """
+    inspector = inspect(connection)
+    for table in tables or Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+
+def add_missing_indexes(connection, tables=None) -> None:
+    """Create indexes declared on existing tables but missing from the database."""
+    inspector = inspect(connection)
+    for table in tables or Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        for index in table.indexes:
+            # IF NOT EXISTS rather than the inspector, which skips expression indexes
+            connection.execute(CreateIndex(index, if_not_exists=True))
 
 
 async def close_db():
+    await read_engine.dispose()
     await engine.dispose()
 
 
 async def get_session() -> AsyncSession:
     async with async_session_factory() as session:
         yield session
+
+
+async def get_read_session() -> AsyncSession:
+    async with read_session_factory() as session:
+        yield session
@@ -0,0 +1,259 @@
+"""Process-wide metrics in the Prometheus text format, served on ``/metrics``.
+
+Counters, gauges and histograms are plain Python numbers updated without
+locks: almost every update happens on the event loop thread, and the rare
+update from a worker thread may at worst lose an increment, which is cheaper
+than taking a lock on every request and query. Bind label values once with
+``labels()`` on hot paths; a child's ``inc`` or ``observe`` is then a couple
+of attribute updates.
+
+Plugins reach the registry as ``PluginBase.metrics`` (or ``core.metrics.registry``)
+and should prefix their metric names with the plugin name.
+"""
+
+import time
+from bisect import bisect_left
+from typing import Callable
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Seconds; from sub-millisecond queries up to a slow scan phase
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        # One slot per bucket plus the +Inf overflow; made cumulative when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    kind = ""
+    child_class: type = _CounterChild
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+
+    def _new_child(self):
+        return self.child_class()
+
+    def labels(self, *values):
+        """The child for these label values, created on first use. Keep it for hot paths."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, or is read from ``fn`` at scrape time.
+
+    ``fn`` returns a number, or for a labelled gauge a ``{label values: number}`` dict.
+    """
+
+    kind = "gauge"
+    child_class = _GaugeChild
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), fn: Callable | None = None):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+
+    def _samples(self) -> list[str]:
+        if self.fn is None:
+            return super()._samples()
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key if isinstance(key, tuple) else (key,))} {_format_value(value)}"
+            for key, value in values.items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for values, child in list(self._children.items()):
+            counts = list(child.counts)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, values, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, cls: type, name: str, documentation: str, labelnames, **options) -> _Metric:
+        # Get-or-create, so a reloaded plugin keeps counting into the same series
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, documentation, tuple(labelnames), **options)
+        elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Metric {name} is already registered as a different {metric.kind}")
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames=(), fn: Callable | None = None) -> Gauge:
+        gauge = self._register(Gauge, name, documentation, labelnames)
+        if fn is not None:
+            # Replaced on re-registration so a reloaded module's callback wins
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status"),
+)
+
+
+def route_template(scope: Scope) -> str:
+    """The matched route's full path template, e.g. ``/api/plugins/lan_scanner/devices/{ip_address}``.
+
+    Routes of an included router report their path without the router's
+    prefix, so the prefix is taken from the request path: everything before
+    the template's own segments.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if not template:
+        return "unmatched"
+    return scope["path"].rsplit("/", template.count("/"))[0] + template
+
+
+class MetricsMiddleware:
+    """Time every HTTP request into ``http_request_duration_seconds``.
+
+    Labelled with the matched route's path template (``/devices/{mac}``), never
+    the raw path, so the series stay bounded. Plain ASGI rather than
+    ``BaseHTTPMiddleware`` so no extra task or body buffering is added per request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_seconds.labels(scope["method"], route_template(scope), str(status)).observe(
+                time.perf_counter() - start
+            )
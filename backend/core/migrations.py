@@ -0,0 +1,94 @@
+"""Versioned schema migrations, applied at startup before a plugin initializes.
+
+A plugin lists its migrations in version order; ``schema_migrations`` records
+which versions each plugin has applied, so every migration runs once per
+database rather than on every start. All pending migrations run in one
+transaction under a database-wide lock, so workers starting together against a
+shared database apply them exactly once.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import Column, Connection, DateTime, Integer, MetaData, String, Table, insert, select, text
+from sqlalchemy.sql import func
+
+from core.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_xact_lock, shared by every worker
+_PG_LOCK_KEY = 0x6B696C69
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("plugin", String, primary_key=True),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, server_default=func.now()),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    # Runs inside the migration transaction with a sync Connection
+    upgrade: Callable[[Connection], None]
+
+
+def _lock(connection: Connection) -> None:
+    """Serialize migrations across processes until the transaction ends."""
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _PG_LOCK_KEY})
+    elif connection.dialect.name == "sqlite":
+        # Take the write lock up front instead of at the first DML statement
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _apply_plugin(connection: Connection, plugin: str, migrations: list[Migration], applied: set) -> list[int]:
+    done = []
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if (plugin, migration.version) in applied:
+            continue
+        logger.info("Applying %s migration %d: %s", plugin, migration.version, migration.description)
+        migration.upgrade(connection)
+        connection.execute(insert(schema_migrations).values(
+            plugin=plugin, version=migration.version, description=migration.description,
+        ))
+        done.append(migration.version)
+    return done
+
+
+def _apply(connection: Connection, plan: dict[str, list[Migration]]) -> dict[str, dict]:
+    _lock(connection)
+    schema_migrations.create(connection, checkfirst=True)
+    applied = set(connection.execute(select(schema_migrations.c.plugin, schema_migrations.c.version)).tuples())
+    results = {}
+    for plugin, migrations in plan.items():
+        start = time.perf_counter()
+        result = results[plugin] = {"applied": [], "error": None}
+        try:
+            # A savepoint per plugin: one plugin's failed migration leaves the others applied
+            with connection.begin_nested():
+                result["applied"] = _apply_plugin(connection, plugin, migrations, applied)
+        except Exception as e:
+            logger.error("Migration failed for plugin %s: %s", plugin, e)
+            result["error"] = str(e)
+        result["ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return results
+
+
+async def run_migrations(plan: dict[str, list[Migration]]) -> dict[str, dict]:
+    """Apply every plugin's pending migrations in one transaction.
+
+    ``plan`` maps plugin name to its migrations. Returns, per plugin, the versions
+    applied, the time taken in ms and the error if its migrations failed.
+    """
+    if not any(plan.values()):
+        return {plugin: {"applied": [], "error": None, "ms": 0.0} for plugin in plan}
+    async with engine.begin() as conn:
+        return await conn.run_sync(_apply, plan)
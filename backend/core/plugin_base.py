@@ -6,6 +6,9 @@ from fastapi import APIRouter
 class PluginBase(ABC):
     """Abstract base class that every plugin must implement."""
 
+    # Parsed manifest.json, set by the plugin loader when it reads the manifest
+    manifest: dict | None = None
+
     @property
     @abstractmethod
     def name(self) -> str:
@@ -27,9 +30,31 @@ class PluginBase(ABC):
         """Register any periodic/scheduled tasks with the global scheduler."""
         ...
 
+    def get_migrations(self) -> list:
+        """Return the plugin's ``core.migrations.Migration`` list, applied before ``initialize``."""
+        return []
+
+    @property
+    def metrics(self):
+        """The shared ``core.metrics`` registry; prefix metric names with the plugin name."""
+        from core.metrics import registry
+        return registry
+
+    def worker_pool(self, name: str, kind: str = "thread", **options):
+        """Get or create the plugin's ``core.workers.WorkerPool`` ``<plugin>.<name>``.
+
+        ``options`` (``workers``, ``queue_size``, ``initializer``, ``initargs``)
+        give the defaults; sizes in the manifest's ``worker_pools.<name>`` win.
+        The loader shuts the plugin's pools down after ``on_shutdown``.
+        """
+        from core.workers import create_pool
+        overrides = (self.manifest or {}).get("worker_pools", {}).get(name, {})
+        options.update({k: overrides[k] for k in ("workers", "queue_size") if k in overrides})
+        return create_pool(f"{self.name}.{name}", kind, **options)
+
     @abstractmethod
     async def initialize(self, db_session_factory) -> None:
-        """Called once during startup -- create tables, seed data, etc."""
+        """Called once during startup, after migrations -- seed data, warm caches, etc."""
         ...
 
     @abstractmethod
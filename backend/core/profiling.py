@@ -0,0 +1,289 @@
+"""Opt-in profiles of scans and API requests, armed at runtime.
+
+``profiler.arm("scan", count=3)`` profiles the next three scans;
+``profiler.arm("request", path="/api/plugins/lan_scanner/devices")`` the next
+request under that path. Code that can be profiled wraps its work in
+``with profiler.capture(kind, label, ...)``; while nothing is armed that is a
+single check and the work runs untouched.
+
+A capture records one of:
+
+- ``sample``: a stack of the event loop thread every
+  ``PROFILE_SAMPLE_INTERVAL_MS``, saved as a collapsed-stack file that
+  flamegraph.pl, speedscope or inferno read directly;
+- ``cprofile``: deterministic cProfile stats of the loop thread, saved as a
+  ``.pstats`` file for ``pstats``/snakeviz.
+
+Both cover everything the loop runs during the capture, including other
+requests; work in worker processes is not included. Spans
+(``record_span``) made by the captured task and the tasks it starts, such
+as the scan phases and database statements, are saved alongside in the
+capture's JSON with its correlation ids (e.g. ``scan_id``).
+
+One capture runs at a time; a match while one is running is not profiled
+and does not use up the armed count.
+"""
+
+import contextvars
+import cProfile
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from config import PROFILE_MAX_KEPT, PROFILE_MAX_SPANS, PROFILE_SAMPLE_INTERVAL_MS, PROFILES_DIR
+
+logger = logging.getLogger(__name__)
+
+MODES = ("sample", "cprofile")
+FORMATS = {"pstats": ".pstats", "collapsed": ".collapsed"}
+
+_current: contextvars.ContextVar["Capture | None"] = contextvars.ContextVar("profile_capture", default=None)
+
+
+def record_span(name: str, start: float, end: float) -> None:
+    """Add a ``time.perf_counter()`` interval to the capture running in this context, if any."""
+    capture = _current.get()
+    if capture is not None:
+        capture.add_span(name, start, end)
+
+
+class _Sampler(threading.Thread):
+    """Collects the stacks of one thread, root first, as ``frame;frame;frame`` → sample count."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._labels: dict = {}
+        self._stop_event = threading.Event()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+        return label
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+class Capture:
+    def __init__(self, kind: str, label: str, mode: str, correlation: dict):
+        self.id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{re.sub(r'[^A-Za-z0-9_.-]+', '-', label).strip('-')}"
+        self.kind = kind
+        self.label = label
+        self.mode = mode
+        self.correlation = correlation
+        self.started_at = datetime.now(timezone.utc)
+        self.spans: list[tuple[str, float, float]] = []
+        self.dropped_spans = 0
+        self._start = 0.0
+        self._profile: cProfile.Profile | None = None
+        self._sampler: _Sampler | None = None
+
+    def add_span(self, name: str, start: float, end: float) -> None:
+        if len(self.spans) < PROFILE_MAX_SPANS:
+            self.spans.append((name, start, end))
+        else:
+            self.dropped_spans += 1
+
+    def start(self) -> None:
+        self._start = time.perf_counter()
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = _Sampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL_MS / 1000)
+            self._sampler.start()
+
+    def stop(self) -> dict:
+        """Stop profiling and write the capture's files; returns its metadata."""
+        duration = time.perf_counter() - self._start
+        PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+        base = PROFILES_DIR / self.id
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(f"{base}.pstats")
+        samples = 0
+        if self._sampler is not None:
+            self._sampler.stop()
+            samples = sum(self._sampler.stacks.values())
+            with open(f"{base}.collapsed", "w", encoding="utf-8") as f:
+                for stack, count in self._sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+        phases: dict[str, dict] = {}
+        for name, start, end in self.spans:
+            phase = phases.setdefault(name, {"count": 0, "total_ms": 0.0})
+            phase["count"] += 1
+            phase["total_ms"] += (end - start) * 1000
+        metadata = {
+            **self.summary(),
+            "duration_ms": round(duration * 1000, 3),
+            "samples": samples,
+            "format": "pstats" if self.mode == "cprofile" else "collapsed",
+            "phases": {name: {**p, "total_ms": round(p["total_ms"], 3)} for name, p in phases.items()},
+            "spans": [
+                {"name": name, "start_ms": round((start - self._start) * 1000, 3), "duration_ms": round((end - start) * 1000, 3)}
+                for name, start, end in self.spans
+            ],
+            "dropped_spans": self.dropped_spans,
+        }
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump(metadata, f)
+        return metadata
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "label": self.label,
+            "mode": self.mode,
+            "started_at": self.started_at.isoformat(),
+            **self.correlation,
+        }
+
+
+@dataclass
+class ArmedCapture:
+    kind: str
+    remaining: int
+    mode: str = "sample"
+    # Request path prefix, for kind "request"
+    path: str | None = None
+
+    def matches(self, kind: str, path: str | None) -> bool:
+        return self.kind == kind and (self.path is None or (path is not None and path.startswith(self.path)))
+
+
+class _CaptureContext:
+    def __init__(self, profiler: "Profiler", capture: Capture):
+        self.profiler = profiler
+        self.capture = capture
+        self._token = None
+
+    def __enter__(self) -> Capture:
+        self._token = _current.set(self.capture)
+        self.capture.start()
+        return self.capture
+
+    def __exit__(self, *exc) -> None:
+        _current.reset(self._token)
+        try:
+            metadata = self.capture.stop()
+            logger.info("Profile %s saved (%s, %.0fms)", self.capture.id, self.capture.mode, metadata["duration_ms"])
+        except OSError as e:
+            logger.error("Could not save profile %s: %s", self.capture.id, e)
+        finally:
+            self.profiler._active = None
+            self.profiler._prune()
+
+
+class Profiler:
+    def __init__(self):
+        self._armed: list[ArmedCapture] = []
+        self._active: Capture | None = None
+
+    def armed(self, kind: str) -> bool:
+        return bool(self._armed) and any(a.kind == kind for a in self._armed)
+
+    def arm(self, kind: str, count: int = 1, mode: str = "sample", path: str | None = None) -> ArmedCapture:
+        """Profile the next ``count`` captures of ``kind`` (for requests: under ``path``)."""
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        if kind == "request" and not path:
+            raise ValueError("Request profiling needs a path prefix")
+        armed = ArmedCapture(kind, count, mode, path)
+        self._armed.append(armed)
+        logger.info("Profiling armed: next %d %s capture(s)%s, %s", count, kind, f" under {path}" if path else "", mode)
+        return armed
+
+    def disarm(self) -> None:
+        self._armed.clear()
+
+    def capture(self, kind: str, label: str, path: str | None = None, **correlation):
+        """Context manager profiling the block if a capture of ``kind`` is armed, else a no-op."""
+        if not self._armed or self._active is not None:
+            return nullcontext()
+        for armed in self._armed:
+            if armed.matches(kind, path):
+                break
+        else:
+            return nullcontext()
+        armed.remaining -= 1
+        if armed.remaining <= 0:
+            self._armed.remove(armed)
+        self._active = Capture(kind, label, armed.mode, correlation)
+        return _CaptureContext(self, self._active)
+
+    def status(self) -> dict:
+        return {
+            "armed": [vars(a) for a in self._armed],
+            "active": self._active.summary() if self._active else None,
+        }
+
+    def list_profiles(self) -> list[dict]:
+        """Metadata of stored profiles, newest first, without their spans."""
+        profiles = []
+        for path in sorted(PROFILES_DIR.glob("*.json"), reverse=True):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                continue
+            metadata.pop("spans", None)
+            profiles.append(metadata)
+        return profiles
+
+    def profile_path(self, profile_id: str, suffix: str) -> Path | None:
+        path = PROFILES_DIR / f"{profile_id}{suffix}"
+        # Ids are generated from [A-Za-z0-9_.-]; anything else never names a stored profile
+        if not re.fullmatch(r"[A-Za-z0-9_.-]+", profile_id) or not path.is_file():
+            return None
+        return path
+
+    def _prune(self) -> None:
+        for stale in sorted(PROFILES_DIR.glob("*.json"), reverse=True)[PROFILE_MAX_KEPT:]:
+            for suffix in (".json", *FORMATS.values()):
+                stale.with_suffix(suffix).unlink(missing_ok=True)
+
+
+profiler = Profiler()
+
+
+class ProfilingMiddleware:
+    """Profile requests whose path matches an armed ``request`` capture."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not profiler.armed("request"):
+            await self.app(scope, receive, send)
+            return
+        with profiler.capture("request", f"{scope['method']} {scope['path']}", path=scope["path"]):
+            await self.app(scope, receive, send)
@@ -1,3 +1,226 @@
+"""The global scheduler, backed by a persistent job store, run by one elected process.
+
+Jobs are kept in ``SCHEDULER_DATABASE_URL`` so each task's next run time
+survives restarts. A run missed while the process was down is caught up once
+(coalesced) on startup if it is still within the task's misfire grace time.
+
+APScheduler cannot share a job store between processes, so every worker
+records the tasks its plugins register but only the one holding the
+``scheduler_lease`` row in the shared database starts the scheduler. The
+others stand by and take over once the leader stops renewing the lease; the
+new leader's job store decides the next run times on its node.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_SUBMITTED
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import Column, DateTime, MetaData, String, Table, delete, or_
+from sqlalchemy.schema import CreateTable
+
+from config import (
+    SCHEDULER_DATABASE_URL,
+    SCHEDULER_DRAIN_TIMEOUT_SECONDS,
+    SCHEDULER_LEASE_HEARTBEAT_SECONDS,
+    SCHEDULER_LEASE_TTL_SECONDS,
+)
+from core.database import engine, upsert
+
+logger = logging.getLogger(__name__)
+
+scheduler = AsyncIOScheduler(
+    jobstores={"default": SQLAlchemyJobStore(url=SCHEDULER_DATABASE_URL)},
+    job_defaults={"coalesce": True, "max_instances": 1},
+)
+
+# Jobs submitted to the executor and not yet finished, by job id
+_running: Counter = Counter()
+# Tasks registered by plugins, task id -> (func, task_def); anything else in the store is stale
+_registered: dict[str, tuple[Callable, dict]] = {}
+
+
+def _track(event) -> None:
+    if event.code == EVENT_JOB_SUBMITTED:
+        _running[event.job_id] += 1
+    else:
+        _running[event.job_id] -= 1
+        if _running[event.job_id] <= 0:
+            del _running[event.job_id]
+
+
+scheduler.add_listener(_track, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+
+
+def schedule_task(scheduler, func, task_def: dict) -> None:
+    """Add or update the interval job for a manifest ``scheduled_tasks`` entry.
+
+    Optional entry keys: ``coalesce`` (default true) runs a backlog of missed
+    runs once; ``misfire_grace_seconds`` (default one interval) is how late a
+    run may still start, null for no limit; ``jitter_seconds`` delays each run
+    by up to that many seconds. An existing job keeps its next run time unless
+    its interval or jitter changed. On a worker that is not the scheduler
+    leader the task is only recorded, to be applied if it takes over.
+    """
+    _registered[task_def["task_id"]] = (func, task_def)
+    if scheduler.running:
+        _apply(scheduler, func, task_def)
+
+
+def _apply(scheduler, func, task_def: dict) -> None:
+    task_id = task_def["task_id"]
+    interval = task_def["interval_seconds"]
+    trigger = IntervalTrigger(seconds=interval, jitter=task_def.get("jitter_seconds") or None)
+    options = {
+        "coalesce": task_def.get("coalesce", True),
+        "misfire_grace_time": task_def.get("misfire_grace_seconds", interval),
+    }
+
+    job = scheduler.get_job(task_id)
+    if job is None:
+        scheduler.add_job(func, trigger, id=task_id, name=task_id, **options)
+        return
+    scheduler.modify_job(task_id, func=func, **options)
+    if (job.trigger.interval, job.trigger.jitter) != (trigger.interval, trigger.jitter):
+        scheduler.reschedule_job(task_id, trigger=trigger)
+
+
+def registered_tasks() -> set[str]:
+    return set(_registered)
+
+
+def forget_task(task_id: str) -> None:
+    """Stop counting ``task_id`` as registered but keep its stored job, e.g. across a plugin reload."""
+    _registered.pop(task_id, None)
+
+
+def unschedule_task(scheduler, task_id: str) -> None:
+    """Remove a task's job from the store, e.g. when its plugin is disabled."""
+    _registered.pop(task_id, None)
+    if scheduler.running and scheduler.get_job(task_id):
+        scheduler.remove_job(task_id)
+
+
+def _remove_stale_jobs() -> None:
+    """Drop stored jobs no plugin registered this time, e.g. of a disabled plugin."""
+    for job in scheduler.get_jobs():
+        if job.id not in _registered:
+            logger.info("Removing stale scheduled job %s", job.id)
+            job.remove()
+
+
+async def drain(timeout: float = SCHEDULER_DRAIN_TIMEOUT_SECONDS) -> None:
+    """Stop starting jobs, wait up to ``timeout`` for running ones, then shut down.
+
+    Jobs still running at the deadline are cancelled; their open transactions
+    roll back rather than being cut off halfway.
+    """
+    if not scheduler.running:
+        return
+    scheduler.pause()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    if _running:
+        logger.info("Waiting up to %ss for running job(s): %s", timeout, ", ".join(_running))
+    while _running and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+    if _running:
+        logger.warning("Cancelling job(s) still running after %ss: %s", timeout, ", ".join(_running))
+    scheduler.shutdown(wait=False)
+    # Let the executor's cancellations reach the jobs before the loop moves on
+    await asyncio.sleep(0)
+
+
+scheduler_lease = Table(
+    "scheduler_lease",
+    MetaData(),
+    Column("name", String, primary_key=True),
+    # Process holding the lease: host:pid:random
+    Column("owner", String, nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+)
+
+_owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_election: asyncio.Task | None = None
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def _claim() -> bool:
+    """Take or renew the lease; True while this process holds it."""
+    now = _now()
+    stmt = upsert(scheduler_lease)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[scheduler_lease.c.name],
+        set_={"owner": stmt.excluded.owner, "expires_at": stmt.excluded.expires_at},
+        where=or_(scheduler_lease.c.owner == _owner, scheduler_lease.c.expires_at < now),
+    ).returning(scheduler_lease.c.owner)
+    async with engine.begin() as conn:
+        claimed = await conn.scalar(stmt.values(
+            name="scheduler", owner=_owner, expires_at=now + timedelta(seconds=SCHEDULER_LEASE_TTL_SECONDS),
+        ))
+    return claimed == _owner
+
+
+def _start() -> None:
+    """Become the scheduler: apply every registered task, drop stale jobs, then run."""
+    # Paused until the tasks are applied, so stored jobs are reconciled before any runs
+    scheduler.start(paused=True)
+    for func, task_def in list(_registered.values()):
+        _apply(scheduler, func, task_def)
+    _remove_stale_jobs()
+    scheduler.resume()
+    logger.info("This process runs the scheduler (%s)", _owner)
+
+
+async def _elect(interval: float) -> None:
+    while True:
+        try:
+            leader = await _claim()
+        except Exception as e:
+            logger.warning("Scheduler lease check failed: %s", e)
+        else:
+            if leader and not scheduler.running:
+                _start()
+            elif not leader and scheduler.running:
+                logger.warning("Scheduler lease lost to another process, standing by")
+                scheduler.shutdown(wait=False)
+        await asyncio.sleep(interval)
+
+
+async def start_elected(interval: float = SCHEDULER_LEASE_HEARTBEAT_SECONDS) -> None:
+    """Run the scheduler here if no other process holds the lease, else stand by for it.
+
+    Call once plugins have registered their tasks. Returns after the first
+    election; the lease is renewed, or retried, every ``interval`` seconds.
+    """
+    global _election
+    async with engine.begin() as conn:
+        await conn.execute(CreateTable(scheduler_lease, if_not_exists=True))
+    if await _claim():
+        _start()
+    else:
+        logger.info("Another process runs the scheduler; standing by")
+    _election = asyncio.create_task(_elect(interval))
+
 
-scheduler = AsyncIOScheduler()
+async def stop_elected() -> None:
+    """Stop the election, ``drain`` the scheduler, then give the lease up so a standby takes over at once."""
+    global _election
+    if _election is not None:
+        _election.cancel()
+        await asyncio.gather(_election, return_exceptions=True)
+        _election = None
+    await drain()
+    async with engine.begin() as conn:
+        await conn.execute(delete(scheduler_lease).where(scheduler_lease.c.owner == _owner))
@@ -1,42 +1,321 @@
 import asyncio
 import json
+import logging
+import time
+from collections import deque
+from fnmatch import fnmatchcase
 from datetime import datetime, timezone
 
 from fastapi import WebSocket
 
+from config import WS_CLIENT_QUEUE_SIZE, WS_OVERFLOW_POLICY
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+_WILDCARDS = frozenset("*?[")
+
+ws_fanout_seconds = registry.histogram(
+    "ws_broadcast_fanout_seconds", "Time to queue one broadcast for all of its recipients",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+ws_fanout_recipients = registry.histogram(
+    "ws_broadcast_recipients", "Clients each broadcast was queued for",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+
+def _is_pattern(topic: str) -> bool:
+    return not _WILDCARDS.isdisjoint(topic)
+
+
+class _Client:
+    """One connection with its own bounded outbound queue and writer task."""
+
+    def __init__(self, websocket: WebSocket, maxsize: int, policy: str):
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.policy = policy
+        # (event, serialized message, enqueue time)
+        self.queue: deque[tuple[str, str, float]] = deque()
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.connected_at = time.time()
+        self.writer: asyncio.Task | None = None
+        # Event names or fnmatch patterns; empty means "everything"
+        self.topics: set[str] = set()
+
+    def enqueue(self, event: str, message: str) -> bool:
+        """Queue a message, applying the overflow policy. False means the client must go."""
+        now = time.monotonic()
+        if len(self.queue) >= self.maxsize:
+            if self.policy == "disconnect":
+                return False
+            if self.policy == "coalesce":
+                for i, (queued_event, _, queued_at) in enumerate(self.queue):
+                    if queued_event == event:
+                        self.queue[i] = (event, message, queued_at)
+                        self.coalesced += 1
+                        return True
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append((event, message, now))
+        self.ready.set()
+        return True
+
+    async def run(self) -> None:
+        while True:
+            await self.ready.wait()
+            while self.queue:
+                _, message, _ = self.queue.popleft()
+                await self.websocket.send_text(message)
+                self.sent += 1
+            self.ready.clear()
+
+    def stats(self) -> dict:
+        oldest = self.queue[0][2] if self.queue else None
+        client = self.websocket.client
+        return {
+            "client": f"{client.host}:{client.port}" if client else None,
+            "topics": sorted(self.topics),
+            "connected_at": datetime.fromtimestamp(self.connected_at, timezone.utc).isoformat(),
+            "queue_depth": len(self.queue),
+            "lag_ms": int((time.monotonic() - oldest) * 1000) if oldest is not None else 0,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
 
 class WebSocketManager:
-    def __init__(self):
-        self._connections: set[WebSocket] = set()
-        self._lock = asyncio.Lock()
+    """Fans broadcasts out to connected clients.
+
+    Clients narrow what they receive by sending
+    ``{"action": "subscribe", "topics": ["lan_scanner:*"]}`` (and ``"unsubscribe"``).
+    Topics are event names or fnmatch patterns; a client with no subscriptions
+    receives every event.
+    """
+
+    def __init__(self, queue_size: int = WS_CLIENT_QUEUE_SIZE, overflow_policy: str = WS_OVERFLOW_POLICY):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown WebSocket overflow policy: {overflow_policy}")
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self._clients: dict[WebSocket, _Client] = {}
+        # Subscription index: clients without topics, exact event names, patterns
+        self._firehose: set[_Client] = set()
+        self._exact: dict[str, set[_Client]] = {}
+        self._patterns: dict[str, set[_Client]] = {}
+        # event name -> patterns matching it, rebuilt when the pattern set changes
+        self._pattern_matches: dict[str, tuple[str, ...]] = {}
+        self._outbox: asyncio.Queue[tuple[str, str]] | None = None
+        self._dispatcher: asyncio.Task | None = None
+        self.broadcasts = 0
+        self.disconnected_slow = 0
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        async with self._lock:
-            self._connections.add(websocket)
+        client = _Client(websocket, self.queue_size, self.overflow_policy)
+        client.writer = asyncio.create_task(self._write(client))
+        self._clients[websocket] = client
+        self._firehose.add(client)
 
     async def disconnect(self, websocket: WebSocket):
-        async with self._lock:
-            self._connections.discard(websocket)
+        client = self._clients.get(websocket)
+        if client is not None:
+            self._remove(client)
+
+    def _remove(self, client: _Client) -> None:
+        self._clients.pop(client.websocket, None)
+        self._firehose.discard(client)
+        for topic in client.topics:
+            self._unindex(client, topic)
+        if client.writer is not None:
+            client.writer.cancel()
+
+    async def _write(self, client: _Client) -> None:
+        try:
+            await client.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._remove(client)
+
+    def _drop_slow(self, client: _Client) -> None:
+        self._remove(client)
+        self.disconnected_slow += 1
+        logger.warning("Disconnecting slow WebSocket client (%d queued)", len(client.queue))
+        asyncio.create_task(self._close(client.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket) -> None:
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def _index(self, client: _Client, topic: str) -> None:
+        if _is_pattern(topic):
+            if topic not in self._patterns:
+                self._pattern_matches.clear()
+            self._patterns.setdefault(topic, set()).add(client)
+        else:
+            self._exact.setdefault(topic, set()).add(client)
+
+    def _unindex(self, client: _Client, topic: str) -> None:
+        index = self._patterns if _is_pattern(topic) else self._exact
+        subscribers = index.get(topic)
+        if subscribers is None:
+            return
+        subscribers.discard(client)
+        if not subscribers:
+            del index[topic]
+            if index is self._patterns:
+                self._pattern_matches.clear()
+
+    def subscribe(self, websocket: WebSocket, topics: list[str]) -> None:
+        client = self._clients.get(websocket)
+        if client is None:
+            return
+        for topic in topics:
+            if topic not in client.topics:
+                client.topics.add(topic)
+                self._index(client, topic)
+        if client.topics:
+            self._firehose.discard(client)
+
+    def unsubscribe(self, websocket: WebSocket, topics: list[str]) -> None:
+        client = self._clients.get(websocket)
+        if client is None:
+            return
+        for topic in topics:
+            if topic in client.topics:
+                client.topics.discard(topic)
+                self._unindex(client, topic)
+        if not client.topics:
+            self._firehose.add(client)
+
+    async def handle_message(self, websocket: WebSocket, text: str) -> None:
+        """Apply a client control message (subscribe/unsubscribe) and acknowledge it."""
+        try:
+            message = json.loads(text)
+            action = message["action"]
+            topics = message.get("topics", [])
+            if isinstance(topics, str):
+                topics = [topics]
+            topics = [str(topic) for topic in topics]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            logger.debug("Ignoring malformed WebSocket message: %.200s", text)
+            return
+        if action == "subscribe":
+            self.subscribe(websocket, topics)
+        elif action == "unsubscribe":
+            self.unsubscribe(websocket, topics)
+        else:
+            logger.debug("Ignoring unknown WebSocket action: %s", action)
+            return
+        client = self._clients.get(websocket)
+        if client is not None:
+            client.enqueue("ws:subscriptions", json.dumps({
+                "event": "ws:subscriptions",
+                "data": {"topics": sorted(client.topics)},
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+            }))
+
+    def _matching_patterns(self, event: str) -> tuple[str, ...]:
+        matches = self._pattern_matches.get(event)
+        if matches is None:
+            matches = tuple(p for p in self._patterns if fnmatchcase(event, p))
+            self._pattern_matches[event] = matches
+        return matches
+
+    def _recipients(self, event: str) -> set[_Client]:
+        recipients = set(self._firehose)
+        recipients.update(self._exact.get(event, ()))
+        for pattern in self._matching_patterns(event):
+            recipients.update(self._patterns[pattern])
+        return recipients
+
+    def has_subscribers(self, event: str) -> bool:
+        return bool(self._firehose or event in self._exact or self._matching_patterns(event))
+
+    async def _dispatch(self) -> None:
+        while True:
+            event, message = await self._outbox.get()
+            start = time.perf_counter()
+            recipients = self._recipients(event)
+            for client in recipients:
+                if not client.enqueue(event, message):
+                    self._drop_slow(client)
+            ws_fanout_seconds.observe(time.perf_counter() - start)
+            ws_fanout_recipients.observe(len(recipients))
+            # Let writers drain between messages so a burst does not overflow fast clients
+            await asyncio.sleep(0)
 
     async def broadcast(self, event: str, data: dict | None = None):
+        """Serialize once and hand off to the dispatcher; never waits on a client.
+
+        Events nobody is subscribed to are dropped before serialization.
+        """
+        if not self.has_subscribers(event):
+            return
         message = json.dumps({
             "event": event,
             "data": data or {},
             "timestamp": datetime.now(timezone.utc).isoformat(),
         })
-        dead = set()
-        async with self._lock:
-            for ws in self._connections:
-                try:
-                    await ws.send_text(message)
-                except Exception:
-                    dead.add(ws)
-            self._connections -= dead
+        if self._dispatcher is None or self._dispatcher.done():
+            self._outbox = asyncio.Queue()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._outbox.put_nowait((event, message))
+        self.broadcasts += 1
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for client in list(self._clients.values()):
+            self._remove(client)
 
     @property
     def connection_count(self) -> int:
-        return len(self._connections)
+        return len(self._clients)
+
+    @property
+    def dispatch_queue_depth(self) -> int:
+        return self._outbox.qsize() if self._outbox is not None else 0
+
+    def client_queue_depths(self) -> list[int]:
+        return [len(client.queue) for client in self._clients.values()]
+
+    def stats(self) -> dict:
+        return {
+            "overflow_policy": self.overflow_policy,
+            "queue_size": self.queue_size,
+            "broadcasts": self.broadcasts,
+            "subscriptions": {
+                "firehose": len(self._firehose),
+                "topics": {topic: len(c) for topic, c in self._exact.items()},
+                "patterns": {topic: len(c) for topic, c in self._patterns.items()},
+            },
+            "pending_dispatch": self.dispatch_queue_depth,
+            "disconnected_slow": self.disconnected_slow,
+            "clients": [client.stats() for client in self._clients.values()],
+        }
 
 
 ws_manager = WebSocketManager()
+
+registry.gauge("ws_clients", "Connected WebSocket clients", fn=lambda: ws_manager.connection_count)
+registry.gauge("ws_dispatch_queue_depth", "Broadcasts waiting for the dispatcher", fn=lambda: ws_manager.dispatch_queue_depth)
+registry.gauge(
+    "ws_client_queue_depth_max", "Deepest per-client send queue",
+    fn=lambda: max(ws_manager.client_queue_depths(), default=0),
+)
+registry.gauge(
+    "ws_client_queued_messages", "Messages queued across all client send queues",
+    fn=lambda: sum(ws_manager.client_queue_depths()),
+)
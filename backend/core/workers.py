@@ -0,0 +1,227 @@
+"""Named, sized worker pools for blocking and CPU-bound plugin work.
+
+A pool wraps a thread or process executor with a bounded queue: at most
+``workers`` calls run and ``queue_size`` more wait in the executor. Further
+callers wait for a slot instead of piling work up, so a burst of scan
+parsing backs up into the scan rather than into memory. Process pools keep
+CPU-heavy parsing off the event loop's GIL entirely; functions sent to them
+must be importable module-level functions with picklable arguments.
+
+Executors start on first use; ``pool_stats()`` reports every pool's saturation.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Callable, Iterable
+
+from config import (
+    WORKER_PROCESS_POOL_SIZE,
+    WORKER_PROCESS_START_METHOD,
+    WORKER_QUEUE_SIZE,
+    WORKER_THREAD_POOL_SIZE,
+)
+from core.metrics import registry
+from core.profiling import record_span
+
+logger = logging.getLogger(__name__)
+
+POOL_KINDS = ("thread", "process")
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        name: str,
+        kind: str = "thread",
+        workers: int | None = None,
+        queue_size: int = WORKER_QUEUE_SIZE,
+        initializer: Callable | None = None,
+        initargs: tuple = (),
+    ):
+        if kind not in POOL_KINDS:
+            raise ValueError(f"Unknown worker pool kind: {kind}")
+        self.name = name
+        self.kind = kind
+        self.workers = workers or (WORKER_PROCESS_POOL_SIZE if kind == "process" else WORKER_THREAD_POOL_SIZE)
+        self.queue_size = queue_size
+        self._initializer = initializer
+        self._initargs = initargs
+        self._executor: Executor | None = None
+        self._slots = asyncio.Semaphore(self.workers + queue_size)
+        self.pending = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+        self.wait_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+
+    def _ensure_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(WORKER_PROCESS_START_METHOD),
+                    initializer=self._initializer,
+                    initargs=self._initargs,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix=self.name,
+                    initializer=self._initializer,
+                    initargs=self._initargs,
+                )
+        return self._executor
+
+    async def run(self, fn: Callable, *args):
+        """Run ``fn(*args)`` in the pool, waiting for a slot while the queue is full."""
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.wait_seconds_max = max(self.wait_seconds_max, time.monotonic() - start)
+
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            future = self._ensure_executor().submit(fn, *args)
+            result = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed by the OOM killer); start fresh processes next time
+            self.failed += 1
+            self._discard_executor()
+            raise
+        except BaseException:
+            self.failed += 1
+            raise
+        else:
+            self.completed += 1
+            return result
+        finally:
+            self.pending -= 1
+            end = time.perf_counter()
+            self.run_seconds_total += end - start
+            self._slots.release()
+            record_span(f"pool.{self.name}", start, end)
+
+    async def stream(self, fn: Callable, items: Iterable) -> AsyncIterator:
+        """Yield ``fn(item)`` for each item as the calls complete, in completion order.
+
+        At most the pool's capacity is in flight, so a long input is consumed as
+        results are taken rather than all submitted up front.
+        """
+        tasks: set[asyncio.Task] = set()
+        limit = self.workers + self.queue_size
+        iterator = iter(items)
+        try:
+            exhausted = False
+            while True:
+                while not exhausted and len(tasks) < limit:
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    tasks.add(asyncio.create_task(self.run(fn, item)))
+                if not tasks:
+                    return
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _discard_executor(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self.restarts += 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        capacity = self.workers + self.queue_size
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "active": min(self.pending, self.workers),
+            "queued": max(0, self.pending - self.workers),
+            # Callers blocked because workers and queue are all taken
+            "waiting": self.waiting,
+            "saturation": round(self.pending / capacity, 3),
+            "completed": self.completed,
+            "failed": self.failed,
+            "restarts": self.restarts,
+            "wait_ms_max": int(self.wait_seconds_max * 1000),
+            "run_ms_total": int(self.run_seconds_total * 1000),
+        }
+
+
+_pools: dict[str, WorkerPool] = {}
+
+
+def create_pool(name: str, kind: str = "thread", **options) -> WorkerPool:
+    """Return pool ``name``, creating it with ``options`` if it does not exist yet."""
+    pool = _pools.get(name)
+    if pool is None:
+        pool = _pools[name] = WorkerPool(name, kind, **options)
+        logger.info("Worker pool %s: %d %s worker(s), queue %d", name, pool.workers, kind, pool.queue_size)
+    elif pool.kind != kind:
+        raise ValueError(f"Worker pool {name} already exists as a {pool.kind} pool")
+    return pool
+
+
+def get_pool(name: str) -> WorkerPool:
+    """The pool created as ``name``; raises KeyError if none was."""
+    return _pools[name]
+
+
+def shutdown_pools(prefix: str | None = None, wait: bool = True) -> None:
+    """Shut down and forget every pool, or only those named ``prefix.*``."""
+    for name in list(_pools):
+        if prefix is None or name.startswith(f"{prefix}."):
+            _pools.pop(name).shutdown(wait=wait)
+
+
+def detach_pools(prefix: str) -> dict[str, WorkerPool]:
+    """Forget the pools named ``prefix.*`` without shutting them down, and return them.
+
+    New callers get fresh pools while the detached ones finish their work, e.g.
+    while a reloaded plugin's new instance initializes beside the old one.
+    """
+    return {name: _pools.pop(name) for name in list(_pools) if name.startswith(f"{prefix}.")}
+
+
+def restore_pools(pools: dict[str, WorkerPool]) -> None:
+    """Put pools taken by ``detach_pools`` back; shut down any created under their names first."""
+    _pools.update(pools)
+
+
+def pool_stats() -> dict[str, dict]:
+    return {name: pool.stats() for name, pool in _pools.items()}
+
+
+def _pool_gauge(name: str, documentation: str, key: str) -> None:
+    registry.gauge(name, documentation, ("pool",), fn=lambda: {(n,): p.stats()[key] for n, p in _pools.items()})
+
+
+_pool_gauge("worker_pool_active", "Calls running in the pool", "active")
+_pool_gauge("worker_pool_queued", "Calls queued in the pool's executor", "queued")
+_pool_gauge("worker_pool_waiting", "Callers waiting because the pool and its queue are full", "waiting")
+_pool_gauge("worker_pool_saturation", "Running and queued calls as a fraction of workers + queue", "saturation")
+_pool_gauge("worker_pool_completed", "Calls completed since the pool was created", "completed")
+_pool_gauge("worker_pool_failed", "Calls that raised since the pool was created", "failed")
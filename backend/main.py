@@ -5,13 +5,17 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 
 from config import CORS_ORIGINS
-from core.database import init_db, close_db
-from core.scheduler import scheduler
+from core.database import close_db
+from core.metrics import MetricsMiddleware
+from core.profiling import ProfilingMiddleware
+from core.scheduler import scheduler, start_elected, stop_elected
 from core.websocket_manager import ws_manager
 from core.database import async_session_factory
 from core import plugin_loader
 from api.system import router as system_router
 from api.plugin_registry import router as registry_router
+from api.metrics import router as metrics_router
+from api.profiling import router as profiling_router
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
 logger = logging.getLogger(__name__)
@@ -20,14 +24,16 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting Rali Kilimanjaro...")
-    await init_db()
     await plugin_loader.discover_and_register(app, scheduler, async_session_factory)
-    scheduler.start()
+    # Runs the scheduler here, once the plugins' tasks are known, if no other worker does
+    await start_elected()
+    plugin_loader.start_watcher()
     logger.info("Startup complete. Loaded %d plugin(s).", len(plugin_loader.get_registry()))
     yield
     logger.info("Shutting down...")
-    scheduler.shutdown(wait=False)
+    await stop_elected()
     await plugin_loader.shutdown_all()
+    await ws_manager.shutdown()
     await close_db()
 
 
@@ -40,9 +46,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 app.include_router(system_router)
 app.include_router(registry_router)
+app.include_router(metrics_router)
+app.include_router(profiling_router)
 
 
 @app.websocket("/ws")
@@ -50,6 +60,8 @@ async def websocket_endpoint(websocket: WebSocket):
     await ws_manager.connect(websocket)
     try:
         while True:
-            await websocket.receive_text()
+            await ws_manager.handle_message(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
+        pass
+    finally:
         await ws_manager.disconnect(websocket)
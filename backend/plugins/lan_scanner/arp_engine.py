@@ -0,0 +1,301 @@
+"""Native asyncio ARP sweeper built on a Linux ``AF_PACKET`` socket.
+
+Request frames are patched in place from one template and replies are parsed
+straight out of the receive buffer, so a /16 costs no per-packet objects.
+"""
+
+import asyncio
+import fcntl
+import ipaddress
+import logging
+import socket
+import struct
+from pathlib import Path
+from typing import AsyncIterator, Callable, Protocol
+
+from plugins.lan_scanner.budget import ProbeBudget, TokenBucket
+from plugins.lan_scanner.metrics import probes_sent
+
+logger = logging.getLogger(__name__)
+
+ETH_P_ARP = 0x0806
+ARP_REQUEST = 1
+ARP_REPLY = 2
+
+SIOCGIFADDR = 0x8915
+SIOCGIFHWADDR = 0x8927
+
+FRAME_LEN = 42
+_TPA_OFFSET = 38
+_BROADCAST = b"\xff" * 6
+
+# eth type @12, ARP opcode @20, sender MAC @22, sender IPv4 @28
+_REPLY = struct.Struct("!12xH6xH6sI")
+_PCAP_HEADER = struct.Struct("<IHHiIII")
+_PCAP_RECORD = struct.Struct("<IIII")
+_PCAP_MAGIC = 0xA1B2C3D4
+
+FrameHandler = Callable[[memoryview], None]
+
+
+class ArpTransport(Protocol):
+    def open(self, loop: asyncio.AbstractEventLoop, on_frame: FrameHandler) -> None: ...
+
+    async def send(self, frame: bytearray) -> None: ...
+
+    def close(self) -> None: ...
+
+
+def _ifreq(ifname: str, request: int) -> bytes:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        return fcntl.ioctl(s.fileno(), request, struct.pack("256s", ifname[:15].encode()))
+
+
+def find_interface(subnet: str) -> tuple[str, bytes, bytes]:
+    """Return (ifname, mac, ipv4) of the local interface that sits on ``subnet``."""
+    network = ipaddress.ip_network(subnet, strict=False)
+    for _, ifname in socket.if_nameindex():
+        try:
+            ip = _ifreq(ifname, SIOCGIFADDR)[20:24]
+        except OSError:
+            continue
+        if ipaddress.IPv4Address(ip) in network:
+            mac = _ifreq(ifname, SIOCGIFHWADDR)[18:24]
+            return ifname, mac, ip
+    raise OSError(f"No local interface on {subnet}")
+
+
+def build_request_template(src_mac: bytes, src_ip: bytes) -> bytearray:
+    """Broadcast ARP who-has frame; the target IP at offset 38 is patched per send."""
+    frame = bytearray(FRAME_LEN)
+    frame[0:6] = _BROADCAST
+    frame[6:12] = src_mac
+    struct.pack_into("!HHHBBH", frame, 12, ETH_P_ARP, 1, 0x0800, 6, 4, ARP_REQUEST)
+    frame[22:28] = src_mac
+    frame[28:32] = src_ip
+    return frame
+
+
+def build_reply_frame(dst_mac: bytes, src_mac: bytes, src_ip: int, dst_ip: int) -> bytes:
+    """ARP is-at frame, used by the replay harness to synthesize captures."""
+    frame = bytearray(FRAME_LEN)
+    frame[0:6] = dst_mac
+    frame[6:12] = src_mac
+    struct.pack_into("!HHHBBH", frame, 12, ETH_P_ARP, 1, 0x0800, 6, 4, ARP_REPLY)
+    frame[22:28] = src_mac
+    struct.pack_into("!I", frame, 28, src_ip)
+    frame[32:38] = dst_mac
+    struct.pack_into("!I", frame, 38, dst_ip)
+    return bytes(frame)
+
+
+class PacketSocketTransport:
+    """Non-blocking ``AF_PACKET`` socket registered with the event loop as a reader."""
+
+    def __init__(self, ifname: str, bufsize: int = 2048):
+        self.ifname = ifname
+        self._buf = bytearray(bufsize)
+        self._view = memoryview(self._buf)
+        self._sock: socket.socket | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._on_frame: FrameHandler | None = None
+
+    def open(self, loop: asyncio.AbstractEventLoop, on_frame: FrameHandler) -> None:
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind((self.ifname, ETH_P_ARP))
+        self._sock, self._loop, self._on_frame = sock, loop, on_frame
+        loop.add_reader(sock.fileno(), self._drain)
+
+    def _drain(self) -> None:
+        sock, view, on_frame = self._sock, self._view, self._on_frame
+        while True:
+            try:
+                n = sock.recv_into(self._buf)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.debug("ARP socket recv failed: %s", e)
+                return
+            on_frame(view[:n])
+
+    async def send(self, frame: bytearray) -> None:
+        try:
+            self._sock.send(frame)
+        except BlockingIOError:
+            await self._loop.sock_sendall(self._sock, frame)
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+
+
+class ReplayTransport:
+    """Answers requests from recorded frames instead of touching the network.
+
+    ARP replies are indexed by sender IP and delivered through the event loop
+    when a request for that IP is sent, like a responsive host would. Any other
+    recorded frames are delivered on the first send as background noise.
+    """
+
+    def __init__(self, frames: list[bytes]):
+        self.frames = frames
+        self.sent = 0
+        self._by_ip: dict[int, list[bytes]] = {}
+        self._noise: list[bytes] = []
+        for frame in frames:
+            if len(frame) >= FRAME_LEN:
+                eth_type, op, _, spa = _REPLY.unpack_from(frame)
+                if eth_type == ETH_P_ARP and op == ARP_REPLY:
+                    self._by_ip.setdefault(spa, []).append(frame)
+                    continue
+            self._noise.append(frame)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._on_frame: FrameHandler | None = None
+
+    @classmethod
+    def from_pcap(cls, path: str | Path) -> "ReplayTransport":
+        data = Path(path).read_bytes()
+        magic = _PCAP_HEADER.unpack_from(data, 0)[0]
+        if magic != _PCAP_MAGIC:
+            raise ValueError(f"{path}: not a little-endian microsecond pcap file")
+        frames = []
+        offset = _PCAP_HEADER.size
+        while offset + _PCAP_RECORD.size <= len(data):
+            _, _, incl_len, _ = _PCAP_RECORD.unpack_from(data, offset)
+            offset += _PCAP_RECORD.size
+            frames.append(data[offset:offset + incl_len])
+            offset += incl_len
+        return cls(frames)
+
+    @classmethod
+    def synthesize(cls, subnet: str, count: int | None = None) -> "ReplayTransport":
+        """Build one reply per host in ``subnet`` (or the first ``count`` hosts)."""
+        network = ipaddress.ip_network(subnet, strict=False)
+        first = int(network.network_address) + 1
+        last = int(network.broadcast_address) - 1
+        if count is not None:
+            last = min(last, first + count - 1)
+        local_mac = b"\x02\x00\x00\x00\x00\x01"
+        frames = [
+            build_reply_frame(local_mac, b"\x02" + ip.to_bytes(5, "big"), ip, first - 1)
+            for ip in range(first, last + 1)
+        ]
+        return cls(frames)
+
+    def write_pcap(self, path: str | Path) -> None:
+        with open(path, "wb") as f:
+            f.write(_PCAP_HEADER.pack(_PCAP_MAGIC, 2, 4, 0, 0, 65535, 1))
+            for frame in self.frames:
+                f.write(_PCAP_RECORD.pack(0, 0, len(frame), len(frame)))
+                f.write(frame)
+
+    def open(self, loop: asyncio.AbstractEventLoop, on_frame: FrameHandler) -> None:
+        self._loop, self._on_frame = loop, on_frame
+
+    def _deliver(self, frames: list[bytes]) -> None:
+        for frame in frames:
+            self._on_frame(memoryview(frame))
+
+    async def send(self, frame: bytearray) -> None:
+        if self.sent == 0 and self._noise:
+            self._loop.call_soon(self._deliver, self._noise)
+        self.sent += 1
+        frames = self._by_ip.get(struct.unpack_from("!I", frame, _TPA_OFFSET)[0])
+        if frames:
+            self._loop.call_soon(self._deliver, frames)
+
+    def close(self) -> None:
+        self._on_frame = lambda view: None
+
+
+def _format_mac(mac: bytes) -> str:
+    return mac.hex(":").upper()
+
+
+async def stream(
+    subnet: str,
+    timeout: float = 3,
+    rate_pps: int = 2000,
+    transport: ArpTransport | None = None,
+    src_mac: bytes | None = None,
+    src_ip: bytes | None = None,
+    limiter: TokenBucket | None = None,
+    inflight: ProbeBudget | None = None,
+    deadline: float | None = None,
+) -> AsyncIterator[dict]:
+    """ARP-sweep every host address in ``subnet``, yielding each host as it first answers.
+
+    Requests are paced by ``limiter`` (``rate_pps`` in 10ms bursts by default),
+    then replies are collected for ``timeout`` seconds after the last request.
+    Each request counts against ``inflight`` until its timeout passes. Sending
+    stops at the loop-time ``deadline``. Requires CAP_NET_RAW when no transport
+    is supplied.
+    """
+    network = ipaddress.ip_network(subnet, strict=False)
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    if network.prefixlen < 31:
+        first, last = first + 1, last - 1
+
+    if transport is None:
+        ifname, src_mac, src_ip = find_interface(subnet)
+        transport = PacketSocketTransport(ifname)
+    frame = build_request_template(src_mac or bytes(6), src_ip or bytes(4))
+
+    seen: set[int] = set()
+    answers: asyncio.Queue[tuple[int, bytes] | None] = asyncio.Queue()
+    unpack_from = _REPLY.unpack_from
+
+    def on_frame(view: memoryview) -> None:
+        if len(view) < FRAME_LEN:
+            return
+        eth_type, op, sha, spa = unpack_from(view)
+        if eth_type == ETH_P_ARP and op == ARP_REPLY and first <= spa <= last and spa not in seen:
+            seen.add(spa)
+            answers.put_nowait((spa, sha))
+
+    loop = asyncio.get_running_loop()
+    limiter = limiter or TokenBucket(rate_pps)
+    sent = probes_sent.labels(subnet, "arp")
+
+    async def send_all() -> None:
+        try:
+            burst = limiter.capacity
+            pack_into = struct.pack_into
+            for start in range(first, last + 1, burst):
+                if deadline is not None and loop.time() >= deadline:
+                    break
+                count = min(burst, last + 1 - start)
+                await limiter.acquire(count)
+                if inflight is not None:
+                    await inflight.acquire(count)
+                    loop.call_later(timeout, inflight.release, count)
+                for ip in range(start, start + count):
+                    pack_into("!I", frame, _TPA_OFFSET, ip)
+                    await transport.send(frame)
+                sent.inc(count)
+            wait = timeout if deadline is None else min(timeout, max(0.0, deadline - loop.time()))
+            await asyncio.sleep(wait)
+        finally:
+            answers.put_nowait(None)
+
+    transport.open(loop, on_frame)
+    sender = loop.create_task(send_all())
+    try:
+        while (answer := await answers.get()) is not None:
+            ip, mac = answer
+            yield {"ip_address": str(ipaddress.IPv4Address(ip)), "mac_address": _format_mac(mac)}
+        await sender
+    finally:
+        sender.cancel()
+        transport.close()
+
+
+async def sweep(subnet: str, timeout: float = 3, rate_pps: int = 2000, **kwargs) -> list[dict]:
+    """Collect :func:`stream` into a list ordered by IP address."""
+    devices = [device async for device in stream(subnet, timeout, rate_pps, **kwargs)]
+    return sorted(devices, key=lambda d: ipaddress.IPv4Address(d["ip_address"]))
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from collections import deque
+
+
+class TokenBucket:
+    """Packets-per-second limiter; ``capacity`` is the largest burst handed out at once."""
+
+    def __init__(self, rate_pps: int, capacity: int | None = None):
+        self.rate = rate_pps
+        self.capacity = capacity or max(1, rate_pps // 100)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+
+    async def acquire(self, n: int = 1) -> None:
+        if self.rate <= 0:
+            return
+        n = min(n, self.capacity)
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= n:
+                self._tokens -= n
+                return
+            await asyncio.sleep((n - self._tokens) / self.rate)
+
+
+class ProbeBudget:
+    """Counting semaphore over outstanding probes shared by every concurrent sweep.
+
+    ``release`` is a plain function because reply handlers and ``call_later``
+    timeouts call it; it hands freed probes straight to waiting sweeps in
+    arrival order.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+
+    async def acquire(self, n: int = 1) -> None:
+        n = min(n, self.limit)
+        if not self._waiters and self.in_flight + n <= self.limit:
+            self.in_flight += n
+            return
+        waiter = (n, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            if waiter[1].cancelled():
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    self._wake()
+            else:
+                # Granted just as the sweep was cancelled
+                self.release(n)
+            raise
+
+    def release(self, n: int = 1) -> None:
+        self.in_flight = max(0, self.in_flight - n)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            n, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if self.in_flight + n > self.limit:
+                return
+            self._waiters.popleft()
+            self.in_flight += n
+            future.set_result(None)
+
+
+class ScanBudget:
+    """Global limits for one scan run: in-flight probes, per-interface rate and a wall-clock deadline."""
+
+    def __init__(self, max_inflight: int, interface_rate_pps: int, deadline_seconds: float):
+        self.inflight = ProbeBudget(max_inflight)
+        self.interface_rate_pps = interface_rate_pps
+        self.deadline = asyncio.get_running_loop().time() + deadline_seconds
+        self._limiters: dict[str, TokenBucket] = {}
+
+    def limiter_for(self, interface: str) -> TokenBucket:
+        limiter = self._limiters.get(interface)
+        if limiter is None:
+            limiter = self._limiters[interface] = TokenBucket(self.interface_rate_pps)
+        return limiter
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - asyncio.get_running_loop().time())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from config import RESPONSE_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+
+class Payload:
+    """A build result with extra response headers (e.g. a pagination cursor)."""
+
+    __slots__ = ("value", "headers")
+
+    def __init__(self, value: Any, headers: dict[str, str]):
+        self.value = value
+        self.headers = headers
+
+
+class _Entry:
+    __slots__ = ("body", "etag", "headers")
+
+    def __init__(self, body: bytes, headers: dict[str, str] | None = None):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.headers = {"ETag": self.etag, "Cache-Control": "no-cache", **(headers or {})}
+
+
+class ResponseCache:
+    """Serialized JSON responses keyed by (path, query params), dropped when scan data changes.
+
+    ETags are derived from the body, so a response rebuilt with the same content
+    after an invalidation still answers ``If-None-Match`` with 304. Concurrent
+    misses for one key share a single build.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._adapters: dict[Any, TypeAdapter] = {}
+        # Bumped on every invalidation; a build started before it is not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(request: Request, vary: tuple) -> tuple:
+        return request.url.path, tuple(sorted(request.query_params.multi_items())), vary
+
+    def _serialize(self, model: Any, value: Any) -> bytes:
+        adapter = self._adapters.get(model)
+        if adapter is None:
+            adapter = self._adapters[model] = TypeAdapter(model)
+        return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+    async def _build(self, key: tuple, model: Any, build: Callable[[], Awaitable[Any]]) -> _Entry:
+        generation = self.generation
+        value = await build()
+        if isinstance(value, Payload):
+            entry = _Entry(self._serialize(model, value.value), value.headers)
+        else:
+            entry = _Entry(self._serialize(model, value))
+        if generation == self.generation:
+            self._entries[key] = entry
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    async def respond(
+        self, request: Request, model: Any, build: Callable[[], Awaitable[Any]], vary: tuple = ()
+    ) -> Response:
+        """Serve ``build()`` (validated against ``model``) from cache, honouring ``If-None-Match``.
+
+        ``vary`` holds inputs the query string does not, such as the resolved end
+        of a window relative to now.
+        """
+        key = self._key(request, vary)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            future = self._inflight.get(key)
+            if future is None:
+                future = asyncio.ensure_future(self._build(key, model, build))
+                self._inflight[key] = future
+                future.add_done_callback(lambda _: self._inflight.pop(key, None))
+            entry = await asyncio.shield(future)
+
+        if entry.etag in request.headers.get("if-none-match", ""):
+            self.not_modified += 1
+            return Response(status_code=304, headers=entry.headers)
+        return Response(content=entry.body, media_type="application/json", headers=entry.headers)
+
+    def invalidate(self) -> None:
+        self.generation += 1
+        self.invalidations += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+response_cache = ResponseCache()
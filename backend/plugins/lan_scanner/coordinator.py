@@ -0,0 +1,182 @@
+"""Cluster-wide scan coordination through lease rows in the shared database.
+
+A scan claims one ``ScanLease`` row per subnet, all or nothing, in the same
+transaction that creates its ``ScanRecord``. While it runs, a heartbeat pushes
+the lease expiry forward; a worker that dies simply stops renewing, and once the
+lease expires the next scan takes it over and marks the dead scan abandoned.
+A request made while a scan holds the lease is collapsed into that scan.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from sqlalchemy import delete, select, update
+
+from config import SCAN_LEASE_HEARTBEAT_SECONDS, SCAN_LEASE_TTL_SECONDS
+from core.database import async_session_factory, upsert
+from plugins.lan_scanner.metrics import scan_duration_seconds
+from plugins.lan_scanner.models import ScanLease, ScanRecord
+from plugins.lan_scanner.rollups import utc_naive
+from plugins.lan_scanner.sync import bump_generation
+
+logger = logging.getLogger(__name__)
+
+
+def _now() -> datetime:
+    return utc_naive(datetime.now(timezone.utc))
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class ScanCoordinator:
+    def __init__(self, ttl: float = SCAN_LEASE_TTL_SECONDS, heartbeat: float = SCAN_LEASE_HEARTBEAT_SECONDS):
+        self.ttl = timedelta(seconds=ttl)
+        self.heartbeat = heartbeat
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self.scan_id: int | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _acquire(self, subnets: list[str]) -> tuple[int, bool]:
+        """Create a running ScanRecord and lease every subnet to it, or find the scan holding them."""
+        now = _now()
+        async with async_session_factory() as session:
+            expired = (await session.execute(
+                select(ScanLease.scan_id).where(ScanLease.subnet.in_(subnets), ScanLease.expires_at < now)
+            )).scalars().all()
+
+            record = ScanRecord(subnet=",".join(subnets), device_count=0, status="running", started_at=now)
+            session.add(record)
+            await session.flush()
+
+            stmt = upsert(ScanLease)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ScanLease.subnet],
+                set_={
+                    "scan_id": stmt.excluded.scan_id,
+                    "owner": stmt.excluded.owner,
+                    "acquired_at": stmt.excluded.acquired_at,
+                    "expires_at": stmt.excluded.expires_at,
+                },
+                where=ScanLease.expires_at < now,
+            ).returning(ScanLease.subnet)
+            acquired = (await session.execute(stmt, [
+                {"subnet": s, "scan_id": record.id, "owner": self.owner, "acquired_at": now, "expires_at": now + self.ttl}
+                for s in subnets
+            ])).scalars().all()
+
+            if len(acquired) < len(subnets):
+                await session.rollback()
+                holder = await session.scalar(
+                    select(ScanLease.scan_id)
+                    .where(ScanLease.subnet.in_(subnets), ScanLease.expires_at >= now)
+                    .limit(1)
+                )
+                return holder, False
+
+            if expired:
+                await session.execute(
+                    update(ScanRecord)
+                    .where(ScanRecord.id.in_(expired), ScanRecord.status == "running")
+                    .values(status="abandoned", error_message="Scan lease expired", completed_at=now)
+                )
+                logger.warning("Took over expired scan lease(s) from scan(s) %s", sorted(set(expired)))
+            # Other workers' /scans show the running record on their next sync
+            await bump_generation(session)
+            await session.commit()
+            return record.id, True
+
+    async def _renew(self, scan_id: int) -> None:
+        async with async_session_factory() as session:
+            result = await session.execute(
+                update(ScanLease)
+                .where(ScanLease.scan_id == scan_id, ScanLease.owner == self.owner)
+                .values(expires_at=_now() + self.ttl)
+            )
+            await session.commit()
+        if result.rowcount == 0:
+            raise LeaseLost(f"Lease for scan {scan_id} was lost")
+
+    async def _release(self, scan_id: int, status: str | None = None, error: str | None = None) -> None:
+        """Drop the scan's leases; if it did not finish, close its record with ``status``."""
+        async with async_session_factory() as session:
+            await session.execute(
+                delete(ScanLease).where(ScanLease.scan_id == scan_id, ScanLease.owner == self.owner)
+            )
+            if status:
+                await session.execute(
+                    update(ScanRecord)
+                    .where(ScanRecord.id == scan_id, ScanRecord.status == "running")
+                    .values(status=status, error_message=error, completed_at=_now())
+                )
+                await bump_generation(session)
+            await session.commit()
+
+    async def _run(self, scan_id: int, runner: Callable[[int], Awaitable[None]]) -> None:
+        scan = asyncio.create_task(runner(scan_id))
+        started = time.monotonic()
+        status, error = None, None
+        try:
+            while True:
+                done, _ = await asyncio.wait({scan}, timeout=self.heartbeat)
+                if done:
+                    scan.result()
+                    break
+                await self._renew(scan_id)
+        except LeaseLost as e:
+            logger.error("%s; stopping the scan", e)
+            status, error = "abandoned", str(e)
+        except asyncio.CancelledError:
+            status, error = "cancelled", None
+            raise
+        except Exception as e:
+            logger.exception("Scan %d failed", scan_id)
+            status, error = "failed", str(e)
+        finally:
+            if not scan.done():
+                scan.cancel()
+                await asyncio.gather(scan, return_exceptions=True)
+            if status:
+                # Completed and partial scans are timed by the runner itself
+                scan_duration_seconds.labels(status).observe(time.monotonic() - started)
+            await asyncio.shield(self._release(scan_id, status, error))
+
+    async def start(self, subnets: list[str], runner: Callable[[int], Awaitable[None]]) -> tuple[int | None, bool]:
+        """Start ``runner(scan_id)`` under a lease on ``subnets``.
+
+        Returns ``(scan_id, True)`` for a new scan, or the id of the scan already
+        running (here or on another worker) and False.
+        """
+        async with self._lock:
+            if self.running:
+                return self.scan_id, False
+            scan_id, started = await self._acquire(subnets)
+            if started:
+                self.scan_id = scan_id
+                self._task = asyncio.create_task(self._run(scan_id, runner))
+            return scan_id, started
+
+    async def wait(self) -> None:
+        """Wait for this worker's running scan, if any, to finish."""
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def shutdown(self) -> None:
+        if self.running:
+            self._task.cancel()
+        await self.wait()
+
+
+scan_coordinator = ScanCoordinator()
@@ -0,0 +1,240 @@
+"""Single-socket ICMP echo sweeper.
+
+Uses an unprivileged ``SOCK_DGRAM`` ICMP socket when ``net.ipv4.ping_group_range``
+allows it and a raw socket otherwise. Replies are matched by identifier and
+sequence number; per-host timeouts live in one deadline heap.
+"""
+
+import asyncio
+import heapq
+import ipaddress
+import logging
+import random
+import socket
+import struct
+from typing import AsyncIterator, Callable, Protocol
+
+from plugins.lan_scanner.budget import ProbeBudget, TokenBucket
+from plugins.lan_scanner.metrics import probes_sent
+
+logger = logging.getLogger(__name__)
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+PACKET_LEN = 16
+_HEADER = struct.Struct("!BBHHH")
+_WORDS = struct.Struct("!8H")
+
+ReplyHandler = Callable[[int, int, int], None]
+
+
+class IcmpTransport(Protocol):
+    ident: int
+
+    def open(self, loop: asyncio.AbstractEventLoop, on_reply: ReplyHandler) -> None: ...
+
+    async def send(self, packet: bytearray, dst_ip: int) -> None: ...
+
+    def close(self) -> None: ...
+
+
+def _checksum(packet: bytearray) -> int:
+    total = sum(_WORDS.unpack(packet))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+class IcmpSocketTransport:
+    """ICMP socket registered with the event loop as a reader."""
+
+    def __init__(self, ident: int | None = None):
+        # A raw socket sees every echo reply on the host, so the identifier has to
+        # tell this sweep's replies from other pingers'. Random rather than the pid:
+        # concurrent subnet sweeps in one process each open their own socket.
+        self.ident = random.getrandbits(16) if ident is None else ident
+        self.kind: str | None = None
+        self._buf = bytearray(2048)
+        self._sock: socket.socket | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._on_reply: ReplyHandler | None = None
+
+    def open(self, loop: asyncio.AbstractEventLoop, on_reply: ReplyHandler) -> None:
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            self.kind = "dgram"
+        except PermissionError:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self.kind = "raw"
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        if self.kind == "dgram":
+            # The kernel rewrites the echo identifier to the socket's local port
+            sock.bind(("0.0.0.0", 0))
+            self.ident = sock.getsockname()[1]
+        self._sock, self._loop, self._on_reply = sock, loop, on_reply
+        loop.add_reader(sock.fileno(), self._drain)
+
+    def _drain(self) -> None:
+        buf, raw = self._buf, self.kind == "raw"
+        while True:
+            try:
+                n, addr = self._sock.recvfrom_into(buf)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.debug("ICMP socket recv failed: %s", e)
+                return
+            offset = (buf[0] & 0x0F) * 4 if raw else 0
+            if n < offset + 8:
+                continue
+            icmp_type, _, _, ident, seq = _HEADER.unpack_from(buf, offset)
+            if icmp_type == ICMP_ECHO_REPLY:
+                self._on_reply(int.from_bytes(socket.inet_aton(addr[0]), "big"), ident, seq)
+
+    async def send(self, packet: bytearray, dst_ip: int) -> None:
+        addr = (socket.inet_ntoa(dst_ip.to_bytes(4, "big")), 0)
+        try:
+            self._sock.sendto(packet, addr)
+        except BlockingIOError:
+            await self._loop.sock_sendto(self._sock, packet, addr)
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+
+
+class SimulatedTransport:
+    """Fake responder: every address in ``alive`` answers after ``latency`` seconds."""
+
+    def __init__(self, alive: set[int], latency: float = 0.001, ident: int = 0x4B4D):
+        self.alive = alive
+        self.latency = latency
+        self.ident = ident
+        self.sent = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._on_reply: ReplyHandler | None = None
+
+    def open(self, loop: asyncio.AbstractEventLoop, on_reply: ReplyHandler) -> None:
+        self._loop, self._on_reply = loop, on_reply
+
+    async def send(self, packet: bytearray, dst_ip: int) -> None:
+        self.sent += 1
+        if dst_ip in self.alive:
+            _, _, _, ident, seq = _HEADER.unpack_from(packet)
+            self._loop.call_later(self.latency, self._reply, dst_ip, ident, seq)
+
+    def _reply(self, ip: int, ident: int, seq: int) -> None:
+        if self._on_reply is not None:
+            self._on_reply(ip, ident, seq)
+
+    def close(self) -> None:
+        self._on_reply = None
+
+
+async def stream(
+    subnet: str,
+    timeout: float = 1,
+    rate_pps: int = 2000,
+    transport: IcmpTransport | None = None,
+    limiter: TokenBucket | None = None,
+    inflight: ProbeBudget | None = None,
+    deadline: float | None = None,
+) -> AsyncIterator[str]:
+    """Echo-ping every host address in ``subnet``, yielding each address as it answers.
+
+    Each echo holds one ``inflight`` slot until it is answered or times out. No
+    host is waited for past the loop-time ``deadline``.
+    """
+    network = ipaddress.ip_network(subnet, strict=False)
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    if network.prefixlen < 31:
+        first, last = first + 1, last - 1
+
+    transport = transport or IcmpSocketTransport()
+    limiter = limiter or TokenBucket(rate_pps)
+    loop = asyncio.get_running_loop()
+    sent = probes_sent.labels(subnet, "ping")
+
+    # ip -> expected sequence number for hosts still awaiting a reply
+    pending: dict[int, int] = {}
+    deadlines: list[tuple[float, int]] = []
+    answers: asyncio.Queue[int | None] = asyncio.Queue()
+    wakeup = asyncio.Event()
+
+    def on_reply(ip: int, ident: int, seq: int) -> None:
+        if ident == transport.ident and pending.get(ip) == seq:
+            del pending[ip]
+            answers.put_nowait(ip)
+            if inflight is not None:
+                inflight.release()
+            if not pending:
+                wakeup.set()
+
+    async def reap(sending_done: asyncio.Event) -> None:
+        while True:
+            now = loop.time()
+            while deadlines and (deadlines[0][0] <= now or deadlines[0][1] not in pending):
+                _, ip = heapq.heappop(deadlines)
+                if pending.pop(ip, None) is not None and inflight is not None:
+                    inflight.release()
+            if sending_done.is_set() and not pending:
+                return
+            wait = deadlines[0][0] - now if deadlines else timeout
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def probe() -> None:
+        sending_done = asyncio.Event()
+        reaper = loop.create_task(reap(sending_done))
+        try:
+            packet = bytearray(PACKET_LEN)
+            burst = limiter.capacity
+            for start in range(first, last + 1, burst):
+                if deadline is not None and loop.time() >= deadline:
+                    break
+                count = min(burst, last + 1 - start)
+                await limiter.acquire(count)
+                if inflight is not None:
+                    await inflight.acquire(count)
+                for ip in range(start, start + count):
+                    seq = ip & 0xFFFF
+                    _HEADER.pack_into(packet, 0, ICMP_ECHO_REQUEST, 0, 0, transport.ident, seq)
+                    struct.pack_into("!H", packet, 2, _checksum(packet))
+                    pending[ip] = seq
+                    expires = loop.time() + timeout
+                    heapq.heappush(deadlines, (expires if deadline is None else min(expires, deadline), ip))
+                    await transport.send(packet, ip)
+                sent.inc(count)
+            sending_done.set()
+            wakeup.set()
+            await reaper
+        finally:
+            reaper.cancel()
+            answers.put_nowait(None)
+
+    transport.open(loop, on_reply)
+    prober = loop.create_task(probe())
+    try:
+        while (ip := await answers.get()) is not None:
+            yield str(ipaddress.IPv4Address(ip))
+        await prober
+    finally:
+        prober.cancel()
+        transport.close()
+        if inflight is not None and pending:
+            inflight.release(len(pending))
+            pending.clear()
+
+
+async def sweep(subnet: str, timeout: float = 1, rate_pps: int = 2000, **kwargs) -> list[str]:
+    """Collect :func:`stream` into a list of answering addresses in numeric order."""
+    alive = [ip async for ip in stream(subnet, timeout, rate_pps, **kwargs)]
+    return sorted(alive, key=ipaddress.IPv4Address)
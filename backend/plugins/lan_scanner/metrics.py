@@ -0,0 +1,53 @@
+"""LAN scanner metrics, kept in the shared ``core.metrics`` registry."""
+
+import ipaddress
+import time
+
+from core.metrics import registry
+from core.profiling import record_span
+
+PHASES = ("discovery", "enrichment", "reconcile", "broadcast", "hostnames")
+PROBE_METHODS = ("arp", "ping")
+
+scan_phase_seconds = registry.histogram(
+    "lan_scanner_scan_phase_seconds",
+    "Time per scan step: waiting on discovery for a batch, vendor enrichment, database "
+    "reconciliation, broadcasting, and background hostname resolution per batch",
+    ("phase",),
+)
+scan_duration_seconds = registry.histogram(
+    "lan_scanner_scan_duration_seconds", "Whole scans by outcome", ("status",),
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+probes_sent = registry.counter("lan_scanner_probes_sent_total", "ARP requests and ICMP echoes sent", ("subnet", "method"))
+replies = registry.counter("lan_scanner_replies_total", "Hosts found, by subnet and the method that found them", ("subnet", "method"))
+probe_rate = registry.histogram(
+    "lan_scanner_probe_rate_pps", "Probes per second achieved by each subnet sweep", ("subnet",),
+    buckets=(50, 100, 250, 500, 1000, 2000, 5000, 10000, 25000, 50000),
+)
+
+
+def probe_count(subnet: str) -> float:
+    return sum(probes_sent.labels(subnet, method).value for method in PROBE_METHODS)
+
+
+def host_count(subnet: str) -> int:
+    network = ipaddress.ip_network(subnet, strict=False)
+    return network.num_addresses - 2 if network.prefixlen < 31 else network.num_addresses
+
+
+class PhaseClock:
+    """Attributes elapsed time to scan phases: ``lap(phase)`` observes the time since the last lap.
+
+    Laps are also spans of a running profile capture.
+    """
+
+    def __init__(self):
+        self._phases = {phase: scan_phase_seconds.labels(phase) for phase in PHASES}
+        self._mark = time.perf_counter()
+
+    def lap(self, phase: str) -> None:
+        now = time.perf_counter()
+        self._phases[phase].observe(now - self._mark)
+        record_span(phase, self._mark, now)
+        self._mark = now
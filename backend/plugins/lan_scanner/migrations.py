@@ -0,0 +1,209 @@
+"""lan_scanner's schema history.
+
+Each migration describes the schema as it stood at its version, with table
+definitions frozen here rather than taken from ``models``: the ORM classes
+follow the current schema, and a later column must arrive through its own
+migration instead of being absorbed by an earlier one.
+"""
+
+import ipaddress
+import logging
+from datetime import datetime
+
+from sqlalchemy import (
+    JSON, Column, DateTime, ForeignKey, Index, Integer, LargeBinary, MetaData, String, Table, Text, UniqueConstraint,
+    bindparam, func, inspect, select, text, update,
+)
+
+from core.database import add_missing_columns, add_missing_indexes
+from core.migrations import Migration
+
+logger = logging.getLogger(__name__)
+
+# Version 1: the tables as they were when migrations were introduced
+_v1 = MetaData()
+
+devices_v1 = Table(
+    "devices", _v1,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("mac_address", String, unique=True, nullable=False, index=True),
+    Column("ip_address", String, nullable=False),
+    Column("ip_key", LargeBinary(16), nullable=True),
+    Column("hostname", String, nullable=True),
+    Column("vendor", String, nullable=True),
+    Column("status", String, index=True),
+    Column("device_type", String),
+    Column("custom_name", String, nullable=True),
+    Column("notes", Text, nullable=True),
+    Column("first_seen", DateTime, nullable=False, server_default=func.now()),
+    Column("last_seen", DateTime, nullable=False, server_default=func.now()),
+    Column("created_at", DateTime, server_default=func.now()),
+    Column("updated_at", DateTime, server_default=func.now()),
+)
+Index("ix_devices_ip_key_id", devices_v1.c.ip_key, devices_v1.c.id)
+Index("ix_devices_hostname_id", func.coalesce(devices_v1.c.hostname, ""), devices_v1.c.id)
+Index("ix_devices_vendor_id", func.coalesce(devices_v1.c.vendor, ""), devices_v1.c.id)
+Index("ix_devices_status_ip_key_id", devices_v1.c.status, devices_v1.c.ip_key, devices_v1.c.id)
+Index("ix_devices_last_seen_id", devices_v1.c.last_seen, devices_v1.c.id)
+
+scan_records_v1 = Table(
+    "scan_records", _v1,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("subnet", String, nullable=False),
+    Column("device_count", Integer, nullable=False),
+    Column("new_devices", Integer),
+    Column("offline_devices", Integer),
+    Column("scan_method", String),
+    Column("scan_duration_ms", Integer, nullable=True),
+    Column("subnet_results", JSON, nullable=True),
+    Column("status", String),
+    Column("error_message", Text, nullable=True),
+    Column("started_at", DateTime, nullable=False, server_default=func.now()),
+    Column("completed_at", DateTime, nullable=True),
+    Column("created_at", DateTime, server_default=func.now()),
+)
+
+device_history_v1 = Table(
+    "device_history", _v1,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("scan_id", Integer, ForeignKey("scan_records.id")),
+    Column("timestamp", DateTime, nullable=False, server_default=func.now()),
+    Column("online_count", Integer, nullable=False),
+    Column("offline_count", Integer, nullable=False),
+    Column("total_count", Integer, nullable=False),
+)
+Index("ix_device_history_timestamp", device_history_v1.c.timestamp)
+
+history_rollups_v1 = Table(
+    "device_history_rollups", _v1,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("resolution", String, nullable=False),
+    Column("bucket", DateTime, nullable=False),
+    Column("samples", Integer, nullable=False),
+    Column("online_min", Integer, nullable=False),
+    Column("online_max", Integer, nullable=False),
+    Column("online_sum", Integer, nullable=False),
+    Column("offline_sum", Integer, nullable=False),
+    Column("total_sum", Integer, nullable=False),
+    Column("total_max", Integer, nullable=False),
+    UniqueConstraint("resolution", "bucket", name="uq_history_rollup_bucket"),
+)
+
+device_presence_v1 = Table(
+    "device_presence", _v1,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("mac_address", String, nullable=False),
+    Column("started_at", DateTime, nullable=False),
+    Column("last_seen_at", DateTime, nullable=False),
+    Column("ended_at", DateTime, nullable=True),
+)
+Index("ix_device_presence_mac_ended", device_presence_v1.c.mac_address, device_presence_v1.c.ended_at)
+Index("ix_device_presence_mac_started", device_presence_v1.c.mac_address, device_presence_v1.c.started_at)
+Index("ix_device_presence_ended", device_presence_v1.c.ended_at)
+
+# Version 4
+_v4 = MetaData()
+# Only what the lease foreign key refers to
+scan_records_v4 = Table("scan_records", _v4, Column("id", Integer, primary_key=True))
+scan_leases_v4 = Table(
+    "scan_leases", _v4,
+    Column("subnet", String, primary_key=True),
+    Column("scan_id", Integer, ForeignKey("scan_records.id"), nullable=False),
+    Column("owner", String, nullable=False),
+    Column("acquired_at", DateTime, nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+)
+
+# Version 5
+data_generation_v5 = Table(
+    "data_generation", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("generation", Integer, nullable=False),
+)
+
+
+def _baseline(connection) -> None:
+    """Bring a fresh database, or one created by ``create_all`` before migrations, to the version 1 schema."""
+    _v1.create_all(connection)
+    add_missing_columns(connection, _v1.sorted_tables)
+    add_missing_indexes(connection, _v1.sorted_tables)
+
+
+def _ip_key(ip: str) -> bytes:
+    # models.ip_key as of version 2: IPv4 stored IPv4-mapped
+    address = ipaddress.ip_address(ip)
+    if address.version == 4:
+        return b"\0" * 10 + b"\xff\xff" + address.packed
+    return address.packed
+
+
+def _ip_keys(connection) -> None:
+    """Backfill ``ip_key`` for rows written before it existed and drop the text-IP indexes it replaces."""
+    devices = devices_v1
+    rows = connection.execute(select(devices.c.id, devices.c.ip_address).where(devices.c.ip_key.is_(None))).all()
+    params = []
+    for device_id, ip in rows:
+        try:
+            params.append({"b_id": device_id, "b_key": _ip_key(ip)})
+        except ValueError:
+            continue
+    if params:
+        connection.execute(
+            update(devices).where(devices.c.id == bindparam("b_id")).values(ip_key=bindparam("b_key")),
+            params,
+        )
+    for name in ("ix_devices_ip_address", "ix_devices_ip_id", "ix_devices_status_ip_id"):
+        connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def _rollups(connection) -> None:
+    """Build rollups from existing raw history the first time the rollup table is used."""
+    history, rollups = device_history_v1, history_rollups_v1
+    if connection.execute(select(func.count(rollups.c.id))).scalar():
+        return
+    buckets: dict[tuple[str, datetime], dict] = {}
+    rows = connection.execute(
+        select(history.c.timestamp, history.c.online_count, history.c.offline_count, history.c.total_count)
+    )
+    for ts, online, offline, total in rows:
+        minute = ts.replace(second=0, microsecond=0)
+        starts = {"minute": minute, "hour": minute.replace(minute=0), "day": minute.replace(minute=0, hour=0)}
+        for key in starts.items():
+            b = buckets.get(key)
+            if b is None:
+                buckets[key] = {
+                    "resolution": key[0], "bucket": key[1], "samples": 1,
+                    "online_min": online, "online_max": online, "online_sum": online,
+                    "offline_sum": offline, "total_sum": total, "total_max": total,
+                }
+                continue
+            b["samples"] += 1
+            b["online_min"] = min(b["online_min"], online)
+            b["online_max"] = max(b["online_max"], online)
+            b["online_sum"] += online
+            b["offline_sum"] += offline
+            b["total_sum"] += total
+            b["total_max"] = max(b["total_max"], total)
+    if buckets:
+        connection.execute(rollups.insert(), list(buckets.values()))
+        logger.info("Backfilled %d history rollup buckets", len(buckets))
+
+
+def _data_generation(connection) -> None:
+    """The shared generation row, and the column stamping devices with it."""
+    data_generation_v5.create(connection, checkfirst=True)
+    if connection.execute(select(data_generation_v5.c.id)).first() is None:
+        connection.execute(data_generation_v5.insert().values(id=1, generation=0))
+    # Databases baselined by an earlier build of this migration may have the column already
+    if "generation" not in {column["name"] for column in inspect(connection).get_columns("devices")}:
+        connection.execute(text("ALTER TABLE devices ADD COLUMN generation INTEGER DEFAULT 0 NOT NULL"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_devices_generation ON devices (generation)"))
+
+
+MIGRATIONS = [
+    Migration(1, "baseline schema", _baseline),
+    Migration(2, "backfill numeric IP keys", _ip_keys),
+    Migration(3, "backfill history rollups", _rollups),
+    Migration(4, "scan leases", lambda connection: scan_leases_v4.create(connection, checkfirst=True)),
+    Migration(5, "data generation", _data_generation),
+]
@@ -1,15 +1,40 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+import ipaddress
+
+from sqlalchemy import (
+    Column, Integer, LargeBinary, String, DateTime, Text, ForeignKey, Index, JSON, UniqueConstraint,
+)
+from sqlalchemy.orm import validates
 from sqlalchemy.sql import func
 
 from core.database import Base
 
 
+def ip_key(ip: str) -> bytes:
+    """16-byte big-endian sort key for an address; IPv4 is stored IPv4-mapped.
+
+    Byte-wise comparison of keys (SQLite BLOB, PostgreSQL bytea) is numeric
+    address order, and an IPv4 network is a contiguous key range.
+    """
+    address = ipaddress.ip_address(ip)
+    if address.version == 4:
+        return b"\0" * 10 + b"\xff\xff" + address.packed
+    return address.packed
+
+
+def cidr_key_range(cidr: str) -> tuple[bytes, bytes]:
+    """Inclusive ``(low, high)`` key range covering every address in ``cidr``."""
+    network = ipaddress.ip_network(cidr, strict=False)
+    return ip_key(str(network.network_address)), ip_key(str(network.broadcast_address))
+
+
 class Device(Base):
     __tablename__ = "devices"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     mac_address = Column(String, unique=True, nullable=False, index=True)
-    ip_address = Column(String, nullable=False, index=True)
+    ip_address = Column(String, nullable=False)
+    # Numeric form of ip_address, see ip_key(); kept in sync on every write
+    ip_key = Column(LargeBinary(16), nullable=True)
     hostname = Column(String, nullable=True)
     vendor = Column(String, nullable=True)
     status = Column(String, default="online", index=True)
@@ -20,6 +45,23 @@ class Device(Base):
     last_seen = Column(DateTime, nullable=False, server_default=func.now())
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # DataGeneration.generation of the transaction that last wrote the row
+    generation = Column(Integer, nullable=False, default=0, server_default="0")
+
+    @validates("ip_address")
+    def _sync_ip_key(self, _, value):
+        self.ip_key = ip_key(value)
+        return value
+
+
+# Keyset pagination indexes: (sort key, id) for each sortable device column.
+# Nullable text columns sort on coalesce(col, '') so NULLs page like empty strings.
+Index("ix_devices_ip_key_id", Device.ip_key, Device.id)
+Index("ix_devices_hostname_id", func.coalesce(Device.hostname, ""), Device.id)
+Index("ix_devices_vendor_id", func.coalesce(Device.vendor, ""), Device.id)
+Index("ix_devices_status_ip_key_id", Device.status, Device.ip_key, Device.id)
+Index("ix_devices_last_seen_id", Device.last_seen, Device.id)
+Index("ix_devices_generation", Device.generation)
 
 
 class ScanRecord(Base):
@@ -32,6 +74,7 @@ class ScanRecord(Base):
     offline_devices = Column(Integer, default=0)
     scan_method = Column(String, default="arp")
     scan_duration_ms = Column(Integer, nullable=True)
+    subnet_results = Column(JSON, nullable=True)
     status = Column(String, default="completed")
     error_message = Column(Text, nullable=True)
     started_at = Column(DateTime, nullable=False, server_default=func.now())
@@ -39,6 +82,33 @@ class ScanRecord(Base):
     created_at = Column(DateTime, server_default=func.now())
 
 
+class ScanLease(Base):
+    """Cluster-wide claim on a subnet by the scan currently running it."""
+
+    __tablename__ = "scan_leases"
+
+    subnet = Column(String, primary_key=True)
+    scan_id = Column(Integer, ForeignKey("scan_records.id"), nullable=False)
+    # Process holding the lease: host:pid:random
+    owner = Column(String, nullable=False)
+    acquired_at = Column(DateTime, nullable=False)
+    # Renewed by the owner's heartbeat; an expired lease may be taken over
+    expires_at = Column(DateTime, nullable=False)
+
+
+class DataGeneration(Base):
+    """Single row counting committed writes to devices and scans, shared by every worker.
+
+    A writing transaction bumps it and stamps the device rows it touches with the
+    new value, so a worker that polls it can fetch exactly the rows others changed.
+    """
+
+    __tablename__ = "data_generation"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+
+
 class DeviceHistory(Base):
     __tablename__ = "device_history"
 
@@ -48,3 +118,43 @@ class DeviceHistory(Base):
     online_count = Column(Integer, nullable=False, default=0)
     offline_count = Column(Integer, nullable=False, default=0)
     total_count = Column(Integer, nullable=False, default=0)
+
+
+Index("ix_device_history_timestamp", DeviceHistory.timestamp)
+
+
+class HistoryRollup(Base):
+    """Device counts aggregated per minute, hour or day bucket."""
+
+    __tablename__ = "device_history_rollups"
+    __table_args__ = (UniqueConstraint("resolution", "bucket", name="uq_history_rollup_bucket"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    resolution = Column(String, nullable=False)
+    bucket = Column(DateTime, nullable=False)
+    samples = Column(Integer, nullable=False, default=0)
+    online_min = Column(Integer, nullable=False)
+    online_max = Column(Integer, nullable=False)
+    online_sum = Column(Integer, nullable=False)
+    offline_sum = Column(Integer, nullable=False)
+    total_sum = Column(Integer, nullable=False)
+    total_max = Column(Integer, nullable=False)
+
+
+class DevicePresence(Base):
+    """One contiguous span during which a device answered every scan."""
+
+    __tablename__ = "device_presence"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    mac_address = Column(String, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    # Last scan that saw the device; extended in place while the span is open
+    last_seen_at = Column(DateTime, nullable=False)
+    # First complete scan that missed the device; NULL while it is still online
+    ended_at = Column(DateTime, nullable=True)
+
+
+Index("ix_device_presence_mac_ended", DevicePresence.mac_address, DevicePresence.ended_at)
+Index("ix_device_presence_mac_started", DevicePresence.mac_address, DevicePresence.started_at)
+Index("ix_device_presence_ended", DevicePresence.ended_at)
@@ -0,0 +1,172 @@
+"""Kernel ARP/neighbour table access.
+
+Reads the whole table in one rtnetlink ``RTM_GETNEIGH`` dump (or from
+``/proc/net/arp`` when netlink is unavailable) so a sweep can join live IPs
+against it in memory instead of running ``arp -n`` per host.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import struct
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROC_NET_ARP = Path("/proc/net/arp")
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+RTMGRP_NEIGH = 0x04
+
+NDA_DST = 1
+NDA_LLADDR = 2
+
+NUD_INCOMPLETE = 0x01
+NUD_FAILED = 0x20
+_UNUSABLE_STATES = NUD_INCOMPLETE | NUD_FAILED
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_NDMSG = struct.Struct("=BxxxiHBB")
+_RTATTR = struct.Struct("=HH")
+_ZERO_MAC = b"\x00" * 6
+
+
+def _align(n: int) -> int:
+    return (n + 3) & ~3
+
+
+def _format_mac(mac: bytes) -> str:
+    return mac.hex(":").upper()
+
+
+def parse_neigh_messages(data: bytes | memoryview, table: dict[str, str]) -> bool:
+    """Merge every RTM_NEWNEIGH in ``data`` into ``table``. Returns True on NLMSG_DONE."""
+    view = memoryview(data)
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(view):
+        msg_len, msg_type, _, _, _ = _NLMSGHDR.unpack_from(view, offset)
+        if msg_len < _NLMSGHDR.size:
+            break
+        if msg_type == NLMSG_DONE:
+            return True
+        if msg_type == NLMSG_ERROR:
+            errno = -struct.unpack_from("=i", view, offset + _NLMSGHDR.size)[0]
+            raise OSError(errno, os.strerror(errno))
+        if msg_type == RTM_NEWNEIGH:
+            body = offset + _NLMSGHDR.size
+            family, _, state, _, _ = _NDMSG.unpack_from(view, body)
+            if family == socket.AF_INET and not state & _UNUSABLE_STATES:
+                dst = lladdr = None
+                attr = body + _NDMSG.size
+                end = offset + msg_len
+                while attr + _RTATTR.size <= end:
+                    attr_len, attr_type = _RTATTR.unpack_from(view, attr)
+                    if attr_len < _RTATTR.size:
+                        break
+                    payload = view[attr + _RTATTR.size:attr + attr_len]
+                    if attr_type == NDA_DST:
+                        dst = bytes(payload)
+                    elif attr_type == NDA_LLADDR:
+                        lladdr = bytes(payload)
+                    attr += _align(attr_len)
+                if dst and lladdr and len(lladdr) == 6 and lladdr != _ZERO_MAC:
+                    table[socket.inet_ntoa(dst)] = _format_mac(lladdr)
+        offset += _align(msg_len)
+    return False
+
+
+def dump_neighbours() -> dict[str, str]:
+    """IPv4 → MAC for every usable entry, via one rtnetlink dump."""
+    table: dict[str, str] = {}
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE) as sock:
+        sock.bind((0, 0))
+        ndmsg = _NDMSG.pack(socket.AF_INET, 0, 0, 0, 0)
+        header = _NLMSGHDR.pack(_NLMSGHDR.size + len(ndmsg), RTM_GETNEIGH, NLM_F_REQUEST | NLM_F_DUMP, 1, 0)
+        sock.send(header + ndmsg)
+        while not parse_neigh_messages(sock.recv(65536), table):
+            pass
+    return table
+
+
+def read_proc_arp(path: Path = PROC_NET_ARP) -> dict[str, str]:
+    """IPv4 → MAC from the ``/proc/net/arp`` text table, skipping incomplete entries."""
+    table: dict[str, str] = {}
+    with open(path, "r", encoding="ascii") as f:
+        next(f, None)
+        for line in f:
+            parts = line.split()
+            if len(parts) < 4 or parts[2] == "0x0":
+                continue
+            mac = parts[3].upper()
+            if mac != "00:00:00:00:00:00":
+                table[parts[0]] = mac
+    return table
+
+
+def neighbour_snapshot() -> dict[str, str] | None:
+    """Read the whole neighbour table once; None when the platform offers neither source."""
+    if hasattr(socket, "AF_NETLINK"):
+        try:
+            return dump_neighbours()
+        except OSError as e:
+            logger.debug("rtnetlink neighbour dump failed: %s", e)
+    if PROC_NET_ARP.exists():
+        try:
+            return read_proc_arp()
+        except OSError as e:
+            logger.debug("Reading %s failed: %s", PROC_NET_ARP, e)
+    return None
+
+
+class NeighbourMonitor:
+    """Collects neighbour entries passively from rtnetlink events while a sweep runs.
+
+    Entries the kernel resolves for hosts answering the sweep land in ``table``
+    without any extra lookup. Silently does nothing where netlink is unavailable.
+    """
+
+    def __init__(self):
+        self.table: dict[str, str] = {}
+        self._sock: socket.socket | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.debug("rtnetlink neighbour monitor recv failed: %s", e)
+                return
+            try:
+                parse_neigh_messages(data, self.table)
+            except OSError:
+                continue
+
+    async def __aenter__(self) -> "NeighbourMonitor":
+        if hasattr(socket, "AF_NETLINK"):
+            try:
+                sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+                sock.setblocking(False)
+                sock.bind((0, RTMGRP_NEIGH))
+            except OSError as e:
+                logger.debug("rtnetlink neighbour monitor unavailable: %s", e)
+            else:
+                self._sock = sock
+                self._loop = asyncio.get_running_loop()
+                self._loop.add_reader(sock.fileno(), self._drain)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._sock is not None:
+            self._drain()
+            self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
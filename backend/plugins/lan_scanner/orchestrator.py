@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from config import SCAN_BATCH_INTERVAL_MS, SCAN_BATCH_SIZE, SCAN_TIMEOUT_SECONDS
+from plugins.lan_scanner.budget import ScanBudget
+from plugins.lan_scanner.metrics import probe_count, probe_rate, replies
+from plugins.lan_scanner.scanner import NetworkScan, interface_for_subnet
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class SubnetResult:
+    subnet: str
+    interface: str
+    method: str | None = None
+    status: str = "pending"
+    device_count: int = 0
+    duration_ms: int = 0
+    error: str | None = None
+
+    def to_record(self) -> dict:
+        return {
+            "subnet": self.subnet,
+            "interface": self.interface,
+            "method": self.method,
+            "status": self.status,
+            "device_count": self.device_count,
+            "duration_ms": self.duration_ms,
+            "error": self.error,
+        }
+
+
+async def _scan_one(
+    result: SubnetResult,
+    budget: ScanBudget,
+    timeout: int,
+    out: asyncio.Queue,
+    slots: asyncio.Semaphore,
+) -> None:
+    start = time.monotonic()
+    probes_before = probe_count(result.subnet)
+    scan = NetworkScan(result.subnet, timeout, budget)
+    try:
+        async for device in scan:
+            result.device_count += 1
+            await slots.acquire()
+            out.put_nowait(device)
+        result.status = "partial" if budget.expired else "completed"
+    except asyncio.CancelledError:
+        result.status = "cancelled"
+        raise
+    except Exception as e:
+        logger.error("Scan failed for %s: %s", result.subnet, e)
+        result.status = "failed"
+        result.error = str(e)
+    finally:
+        result.method = scan.method
+        elapsed = time.monotonic() - start
+        result.duration_ms = int(elapsed * 1000)
+        replies.labels(result.subnet, scan.method or "none").inc(result.device_count)
+        probes = probe_count(result.subnet) - probes_before
+        if probes and elapsed > 0:
+            probe_rate.labels(result.subnet).observe(probes / elapsed)
+        out.put_nowait(_DONE)
+
+
+async def stream_subnets(
+    subnets: list[str],
+    budget: ScanBudget,
+    results: list[SubnetResult],
+    timeout: int = SCAN_TIMEOUT_SECONDS,
+    batch_size: int = SCAN_BATCH_SIZE,
+    batch_interval_ms: int = SCAN_BATCH_INTERVAL_MS,
+) -> AsyncIterator[list[dict]]:
+    """Scan every subnet concurrently under one shared budget, yielding micro-batches.
+
+    A batch is emitted once it holds ``batch_size`` devices or its first device is
+    ``batch_interval_ms`` old, whichever comes first. At most ``4 * batch_size``
+    devices wait in the queue, so discovery stalls rather than buffering when the
+    consumer falls behind.
+    One :class:`SubnetResult` per subnet is appended to ``results``.
+
+    The native engines stop probing at the budget deadline on their own; anything
+    still running ``timeout`` seconds later (the scapy and subprocess fallbacks) is
+    cancelled and reported as such.
+    """
+    loop = asyncio.get_running_loop()
+    # Devices take a slot before being queued; end-of-subnet markers never block
+    queue: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(batch_size * 4)
+    for subnet in subnets:
+        results.append(SubnetResult(subnet=subnet, interface=interface_for_subnet(subnet)))
+    tasks = [asyncio.create_task(_scan_one(result, budget, timeout, queue, slots)) for result in results]
+
+    hard_deadline = budget.deadline + timeout
+    running = len(tasks)
+    batch: list[dict] = []
+    flush_at = None
+    try:
+        while running:
+            now = loop.time()
+            if now >= hard_deadline:
+                break
+            wait = hard_deadline - now
+            if flush_at is not None:
+                wait = min(wait, max(0.0, flush_at - now))
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=wait)
+            except asyncio.TimeoutError:
+                if batch:
+                    yield batch
+                    batch, flush_at = [], None
+                continue
+            if item is _DONE:
+                running -= 1
+                continue
+            slots.release()
+            if not batch:
+                flush_at = loop.time() + batch_interval_ms / 1000
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch, flush_at = [], None
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning("Scan deadline reached, cancelled %d subnet scan(s)", len(pending))
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    # Devices still queued when the hard deadline cut the loop short
+    while not queue.empty():
+        item = queue.get_nowait()
+        if item is not _DONE:
+            batch.append(item)
+    if batch:
+        yield batch
@@ -1,10 +1,10 @@
+import asyncio
 import json
 import logging
 from pathlib import Path
 
 from fastapi import APIRouter
 
-from core.database import Base, engine
 from core.plugin_base import PluginBase
 
 logger = logging.getLogger(__name__)
@@ -18,32 +18,62 @@ class LanScannerPlugin(PluginBase):
         return "lan_scanner"
 
     def get_manifest(self) -> dict:
-        with open(PLUGIN_DIR / "manifest.json", "r", encoding="utf-8") as f:
-            return json.load(f)
+        if self.manifest is None:
+            with open(PLUGIN_DIR / "manifest.json", "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        return self.manifest
 
     def get_router(self) -> APIRouter:
         from plugins.lan_scanner.routes import router
         return router
 
     def register_tasks(self, scheduler) -> None:
+        from core.scheduler import schedule_task
+        from plugins.lan_scanner.tasks import TASKS
         manifest = self.get_manifest()
         for task_def in manifest.get("scheduled_tasks", []):
-            from plugins.lan_scanner.tasks import run_scan
-            scheduler.add_job(
-                run_scan,
-                "interval",
-                seconds=task_def["interval_seconds"],
-                id=task_def["task_id"],
-                replace_existing=True,
-            )
+            handler = TASKS.get(task_def["task_id"])
+            if handler is None:
+                logger.warning("No handler for scheduled task %s", task_def["task_id"])
+                continue
+            schedule_task(scheduler, handler, task_def)
             logger.info("Registered task %s (every %ds)", task_def["task_id"], task_def["interval_seconds"])
 
+    def get_migrations(self) -> list:
+        from plugins.lan_scanner.migrations import MIGRATIONS
+        return MIGRATIONS
+
     async def initialize(self, db_session_factory) -> None:
-        # Import models so they register with Base.metadata
-        import plugins.lan_scanner.models  # noqa: F401
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
+        from plugins.lan_scanner.vendors import vendor_index
+        from plugins.lan_scanner.workers import PARSE_POOL
+        # Before any scan asks for it, so the manifest's sizes apply
+        self.worker_pool(PARSE_POOL, "process")
+        if vendor_index.needs_download():
+            await vendor_index.download()
+        await asyncio.get_running_loop().run_in_executor(None, vendor_index.load)
+
+        from sqlalchemy import select
+        from plugins.lan_scanner.models import Device
+        from plugins.lan_scanner.state import device_dict, device_state
+        from plugins.lan_scanner.sync import data_sync, read_generation
+        from plugins.lan_scanner.tasks import apply_synced_devices
+        async with db_session_factory() as session:
+            # Read first: anything written meanwhile is fetched again by the first sync
+            generation = await read_generation(session)
+            devices = (await session.execute(select(Device))).scalars()
+            device_state.load(device_dict(d) for d in devices)
+        data_sync.start(generation, apply_synced_devices)
         logger.info("LAN Scanner plugin initialized")
 
     async def on_shutdown(self) -> None:
+        from plugins.lan_scanner.sync import data_sync
+        await data_sync.stop()
+        from plugins.lan_scanner.coordinator import scan_coordinator
+        await scan_coordinator.shutdown()
+        from plugins.lan_scanner.tasks import cancel_enrichment
+        await cancel_enrichment()
+        from plugins.lan_scanner.resolver import hostname_resolver
+        from plugins.lan_scanner.vendors import vendor_index
+        await hostname_resolver.close()
+        vendor_index.close()
         logger.info("LAN Scanner plugin shutting down")
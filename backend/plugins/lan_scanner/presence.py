@@ -0,0 +1,155 @@
+"""Per-device presence as run-length intervals.
+
+A device that keeps answering scans has one open ``DevicePresence`` row whose
+``last_seen_at`` moves forward; a new row appears only when it comes back after
+being missed. Storage therefore grows with state changes, not with scans.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Sequence
+
+from sqlalchemy import Float, and_, case, exists, func, insert, literal, or_, select, update
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.functions import FunctionElement
+
+from plugins.lan_scanner.models import Device, DevicePresence, cidr_key_range
+from plugins.lan_scanner.rollups import utc_naive
+
+logger = logging.getLogger(__name__)
+
+
+async def update_presence(session: AsyncSession, now: datetime, complete_subnets: Sequence[str]) -> None:
+    """Apply one scan to the presence intervals with three set-based statements.
+
+    Devices seen by the scan carry ``last_seen = now`` (see ``finalize_scan``):
+    their open interval is extended, or a new one opened; open intervals of
+    devices the scan missed are closed at ``now``, but only in
+    ``complete_subnets``; a partial or failed subnet proves no absence.
+    The caller owns the transaction.
+    """
+    seen = exists().where(Device.mac_address == DevicePresence.mac_address, Device.last_seen == now)
+    await session.execute(
+        update(DevicePresence)
+        .where(DevicePresence.ended_at.is_(None), seen)
+        .values(last_seen_at=now)
+        .execution_options(synchronize_session=False)
+    )
+
+    has_open = exists().where(DevicePresence.mac_address == Device.mac_address, DevicePresence.ended_at.is_(None))
+    await session.execute(
+        insert(DevicePresence).from_select(
+            ["mac_address", "started_at", "last_seen_at"],
+            select(Device.mac_address, literal(now, Device.last_seen.type), literal(now, Device.last_seen.type))
+            .where(Device.last_seen == now, ~has_open),
+        )
+    )
+
+    if complete_subnets:
+        in_subnets = exists().where(
+            Device.mac_address == DevicePresence.mac_address,
+            or_(*(Device.ip_key.between(*cidr_key_range(subnet)) for subnet in complete_subnets)),
+        )
+        await session.execute(
+            update(DevicePresence)
+            .where(DevicePresence.ended_at.is_(None), ~seen, in_subnets)
+            .values(ended_at=now)
+            .execution_options(synchronize_session=False)
+        )
+
+
+class _epoch_seconds(FunctionElement):
+    """Fractional seconds since 1970 for a naive-UTC timestamp expression."""
+
+    type = Float()
+    inherit_cache = True
+
+
+@compiles(_epoch_seconds)
+def _epoch_seconds_default(element, compiler, **kw):
+    # EXTRACT returns numeric on PostgreSQL 14+; sums of it would come back as Decimal
+    return f"CAST(EXTRACT(EPOCH FROM {compiler.process(element.clauses, **kw)}) AS DOUBLE PRECISION)"
+
+
+@compiles(_epoch_seconds, "sqlite")
+def _epoch_seconds_sqlite(element, compiler, **kw):
+    return f"((julianday({compiler.process(element.clauses, **kw)}) - 2440587.5) * 86400.0)"
+
+
+def _overlap_seconds(start: datetime, end: datetime):
+    """SQL expression: seconds of each interval that fall inside [start, end]."""
+    interval_end = func.coalesce(DevicePresence.ended_at, literal(end, DevicePresence.started_at.type))
+    clipped_start = case((DevicePresence.started_at > start, DevicePresence.started_at), else_=start)
+    clipped_end = case((interval_end < end, interval_end), else_=end)
+    return _epoch_seconds(clipped_end) - _epoch_seconds(clipped_start)
+
+
+def _overlaps(start: datetime, end: datetime):
+    return and_(
+        DevicePresence.started_at <= end,
+        or_(DevicePresence.ended_at.is_(None), DevicePresence.ended_at >= start),
+    )
+
+
+def presence_window(start: datetime | None, end: datetime | None, default_span) -> tuple[datetime, datetime]:
+    """Resolve optional query bounds to a naive-UTC window ending now by default."""
+    end = utc_naive(end or datetime.now(timezone.utc))
+    start = utc_naive(start) if start else end - default_span
+    return start, end
+
+
+async def device_presence(session: AsyncSession, mac: str, start: datetime, end: datetime) -> dict:
+    """Intervals of one device overlapping [start, end] and its availability there."""
+    rows = await session.execute(
+        select(DevicePresence, _overlap_seconds(start, end).label("online_seconds"))
+        .where(DevicePresence.mac_address == mac, _overlaps(start, end))
+        .order_by(DevicePresence.started_at)
+    )
+    intervals = []
+    online_seconds = 0.0
+    for presence, seconds in rows:
+        online_seconds += max(seconds or 0.0, 0.0)
+        intervals.append({
+            "started_at": presence.started_at,
+            "last_seen_at": presence.last_seen_at,
+            "ended_at": presence.ended_at,
+        })
+    window = (end - start).total_seconds()
+    return {
+        "mac_address": mac,
+        "from": start,
+        "to": end,
+        "online_seconds": round(online_seconds, 3),
+        "availability": round(online_seconds / window, 6) if window > 0 else None,
+        "intervals": intervals,
+    }
+
+
+async def availability(session: AsyncSession, start: datetime, end: datetime) -> list[dict]:
+    """Availability in [start, end] for every device, in one grouped query."""
+    overlap = (
+        select(
+            DevicePresence.mac_address.label("mac_address"),
+            func.sum(_overlap_seconds(start, end)).label("online_seconds"),
+        )
+        .where(_overlaps(start, end))
+        .group_by(DevicePresence.mac_address)
+        .subquery()
+    )
+    rows = await session.execute(
+        select(Device.mac_address, Device.ip_address, Device.status, func.coalesce(overlap.c.online_seconds, 0.0))
+        .outerjoin(overlap, overlap.c.mac_address == Device.mac_address)
+        .order_by(Device.ip_key, Device.id)
+    )
+    window = (end - start).total_seconds()
+    return [
+        {
+            "mac_address": mac,
+            "ip_address": ip,
+            "status": status,
+            "online_seconds": round(seconds, 3),
+            "availability": round(seconds / window, 6) if window > 0 else None,
+        }
+        for mac, ip, status, seconds in rows
+    ]
@@ -0,0 +1,148 @@
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from plugins.lan_scanner.models import Device, cidr_key_range
+from plugins.lan_scanner.schemas import DeviceOut
+
+PLUGIN_DIR = Path(__file__).resolve().parent
+
+# Sort expressions; each has a matching (expression, id) index in models.py
+_SORT_EXPRESSIONS = {
+    "ip_address": Device.ip_key,
+    "mac_address": Device.mac_address,
+    "hostname": func.coalesce(Device.hostname, ""),
+    "vendor": func.coalesce(Device.vendor, ""),
+    "status": Device.status,
+    "last_seen": Device.last_seen,
+}
+
+DEVICE_FIELDS = tuple(DeviceOut.model_fields)
+
+
+def _manifest_sortable(widget_id: str = "device_table") -> set[str]:
+    with open(PLUGIN_DIR / "manifest.json", "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    for widget in manifest.get("frontend", {}).get("widgets", []):
+        if widget.get("widget_id") == widget_id:
+            return {c["key"] for c in widget.get("columns", []) if c.get("sortable")}
+    return set()
+
+
+# The device table's sortable columns are the ones clients may sort and page on
+SORT_KEYS = tuple(key for key in _SORT_EXPRESSIONS if key in _manifest_sortable())
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+@dataclass
+class DeviceQuery:
+    sort: str = "ip_address"
+    order: str = "asc"
+    limit: int | None = None
+    cursor: str | None = None
+    fields: list[str] = field(default_factory=lambda: list(DEVICE_FIELDS))
+    status: str | None = None
+    vendor: str | None = None
+    search: str | None = None
+    cidr: str | None = None
+
+    def validate(self) -> None:
+        if self.sort not in SORT_KEYS:
+            raise InvalidQuery(f"sort must be one of: {', '.join(SORT_KEYS)}")
+        if self.order not in ("asc", "desc"):
+            raise InvalidQuery("order must be asc or desc")
+        if self.cidr:
+            try:
+                cidr_key_range(self.cidr)
+            except ValueError:
+                raise InvalidQuery(f"Invalid CIDR: {self.cidr}")
+        unknown = [f for f in self.fields if f not in DEVICE_FIELDS]
+        if unknown:
+            raise InvalidQuery(f"Unknown field(s): {', '.join(unknown)}")
+
+
+def encode_cursor(query: DeviceQuery, value, device_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, bytes):
+        value = value.hex()
+    raw = json.dumps([query.sort, query.order, value, device_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(query: DeviceQuery) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(query.cursor + "=" * (-len(query.cursor) % 4))
+        sort, order, value, device_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidQuery("Malformed cursor")
+    if (sort, order) != (query.sort, query.order):
+        raise InvalidQuery("Cursor was issued for a different sort order")
+    try:
+        if sort == "last_seen":
+            value = datetime.fromisoformat(value)
+        elif sort == "ip_address":
+            value = bytes.fromhex(value)
+    except (ValueError, TypeError):
+        raise InvalidQuery("Malformed cursor")
+    return value, device_id
+
+
+async def device_page(session: AsyncSession, query: DeviceQuery) -> tuple[list[dict], str | None]:
+    """One page of devices as dicts holding only ``query.fields``, plus the next cursor.
+
+    Pages are keyset-paginated on ``(sort key, id)``: the cursor carries the last
+    row's key, so each page is an index range scan regardless of depth.
+    """
+    query.validate()
+    sort_expr = _SORT_EXPRESSIONS[query.sort]
+    columns = [getattr(Device, name) for name in query.fields]
+    stmt = select(*columns, sort_expr.label("_sort_key"), Device.id.label("_id"))
+
+    if query.status:
+        stmt = stmt.where(Device.status == query.status)
+    if query.cidr:
+        low, high = cidr_key_range(query.cidr)
+        stmt = stmt.where(Device.ip_key.between(low, high))
+    if query.vendor:
+        stmt = stmt.where(func.coalesce(Device.vendor, "") == query.vendor)
+    if query.search:
+        # A plain substring: escape LIKE's wildcards so "_" and "%" match themselves
+        escaped = query.search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = f"%{escaped}%"
+        stmt = stmt.where(or_(
+            Device.ip_address.ilike(pattern, escape="\\"),
+            Device.mac_address.ilike(pattern, escape="\\"),
+            Device.hostname.ilike(pattern, escape="\\"),
+            Device.vendor.ilike(pattern, escape="\\"),
+            Device.custom_name.ilike(pattern, escape="\\"),
+        ))
+
+    if query.cursor:
+        # (key, id) > (value, last_id), spelled so the planner seeks the index on key
+        value, last_id = decode_cursor(query)
+        if query.order == "asc":
+            stmt = stmt.where(sort_expr >= value, or_(sort_expr > value, Device.id > last_id))
+        else:
+            stmt = stmt.where(sort_expr <= value, or_(sort_expr < value, Device.id < last_id))
+    if query.order == "asc":
+        stmt = stmt.order_by(sort_expr, Device.id)
+    else:
+        stmt = stmt.order_by(sort_expr.desc(), Device.id.desc())
+    if query.limit is not None:
+        stmt = stmt.limit(query.limit + 1)
+
+    rows = (await session.execute(stmt)).all()
+    next_cursor = None
+    if query.limit is not None and len(rows) > query.limit:
+        rows = rows[:query.limit]
+        next_cursor = encode_cursor(query, rows[-1]._sort_key, rows[-1]._id)
+    return [dict(zip(query.fields, row)) for row in rows], next_cursor
@@ -0,0 +1,153 @@
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Sequence
+
+from sqlalchemy import bindparam, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.database import upsert
+
+from plugins.lan_scanner.models import Device, cidr_key_range, ip_key
+from plugins.lan_scanner.state import device_dict
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UpsertResult:
+    """Outcome of applying one micro-batch of discovered devices."""
+
+    seen_count: int = 0
+    new_devices: list[dict] = field(default_factory=list)
+    # Full rows as written, for the versioned device state
+    rows: list[dict] = field(default_factory=list)
+
+
+@dataclass
+class ReconcileResult:
+    """Outcome of closing a scan: who went offline and the resulting totals."""
+
+    offline_devices: list[dict] = field(default_factory=list)
+    online_count: int = 0
+    offline_count: int = 0
+
+    @property
+    def total_count(self) -> int:
+        return self.online_count + self.offline_count
+
+
+def _dedupe_by_mac(devices: list[dict]) -> dict[str, dict]:
+    """Collapse scan results to one row per MAC; later results win."""
+    by_mac: dict[str, dict] = {}
+    for device_data in devices:
+        mac = device_data.get("mac_address", "unknown")
+        if mac == "unknown":
+            continue
+        by_mac[mac] = device_data
+    return by_mac
+
+
+async def upsert_devices(session: AsyncSession, devices: list[dict], now: datetime, generation: int) -> UpsertResult:
+    """Apply a batch of discovered devices in one ``INSERT ... ON CONFLICT(mac_address) DO UPDATE``.
+
+    Every row touched carries ``last_seen = now`` (the scan timestamp) and the
+    transaction's ``generation`` (see ``sync.bump_generation``). The update
+    is skipped for rows already stamped by an earlier batch of the same scan, so
+    those are not returned and a device reported by two subnets counts once.
+    Freshly inserted rows are the ones whose ``first_seen`` equals ``last_seen``.
+    """
+    result = UpsertResult()
+    by_mac = _dedupe_by_mac(devices)
+    if not by_mac:
+        return result
+
+    rows = [
+        {
+            "mac_address": mac,
+            "ip_address": data["ip_address"],
+            "ip_key": ip_key(data["ip_address"]),
+            "hostname": data.get("hostname"),
+            "vendor": data.get("vendor"),
+            "status": "online",
+            "first_seen": now,
+            "last_seen": now,
+            "generation": generation,
+        }
+        for mac, data in by_mac.items()
+    ]
+    stmt = upsert(Device)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Device.mac_address],
+        set_={
+            "ip_address": stmt.excluded.ip_address,
+            "ip_key": stmt.excluded.ip_key,
+            "hostname": func.coalesce(stmt.excluded.hostname, Device.hostname),
+            "vendor": func.coalesce(stmt.excluded.vendor, Device.vendor),
+            "status": "online",
+            "last_seen": stmt.excluded.last_seen,
+            "updated_at": func.now(),
+            "generation": stmt.excluded.generation,
+        },
+        where=Device.last_seen != stmt.excluded.last_seen,
+    ).returning(*Device.__table__.c, (Device.first_seen == Device.last_seen).label("is_new"))
+
+    upserted = await session.execute(stmt, rows)
+    for row in upserted.mappings():
+        result.seen_count += 1
+        result.rows.append(device_dict(row))
+        if row["is_new"]:
+            result.new_devices.append(by_mac[row["mac_address"]])
+    return result
+
+
+async def update_hostnames(session: AsyncSession, hostnames: dict[str, str], generation: int) -> None:
+    """Store resolved hostnames (mac → name) with one executemany ``UPDATE``."""
+    if not hostnames:
+        return
+    stmt = (
+        update(Device.__table__)
+        .where(Device.mac_address == bindparam("b_mac"))
+        .values(hostname=bindparam("b_hostname"), generation=generation)
+    )
+    await session.execute(stmt, [{"b_mac": mac, "b_hostname": name} for mac, name in hostnames.items()])
+
+
+async def finalize_scan(
+    session: AsyncSession, now: datetime, generation: int, complete_subnets: Sequence[str]
+) -> ReconcileResult:
+    """Close a scan with a fixed number of set-based statements.
+
+    1. One bulk ``UPDATE`` marking every online device not upserted by this scan
+       as offline. Every row upserted in this scan carries ``last_seen = now``,
+       so "not in the scan set" is expressed as ``last_seen != now`` instead of
+       binding tens of thousands of MACs into a ``NOT IN`` list. Limited to
+       ``complete_subnets``: only a subnet swept to the end proves absence, so
+       devices in a partial or failed subnet keep their status.
+    2. One aggregate ``SELECT`` for the online/offline totals.
+
+    The caller owns the transaction and must commit.
+    """
+    result = ReconcileResult()
+    if complete_subnets:
+        in_subnets = or_(*(Device.ip_key.between(*cidr_key_range(subnet)) for subnet in complete_subnets))
+        offline_stmt = (
+            update(Device)
+            .where(Device.status == "online", Device.last_seen != now, in_subnets)
+            .values(status="offline", generation=generation)
+            .returning(Device.ip_address, Device.mac_address)
+            .execution_options(synchronize_session=False)
+        )
+        offline_rows = await session.execute(offline_stmt)
+        result.offline_devices = [
+            {"ip_address": ip, "mac_address": mac} for ip, mac in offline_rows
+        ]
+
+    counts = await session.execute(
+        select(
+            func.count(Device.id).filter(Device.status == "online"),
+            func.count(Device.id).filter(Device.status == "offline"),
+        )
+    )
+    result.online_count, result.offline_count = counts.one()
+    return result
@@ -0,0 +1,437 @@
+"""Asynchronous reverse hostname resolution for discovered devices.
+
+Each address is tried against unicast DNS (PTR), then the host's own mDNS
+responder, then NetBIOS node status, all over one shared UDP socket. Answers
+and failures are kept in a TTL-aware LRU cache that outlives individual scans.
+"""
+
+import asyncio
+import ipaddress
+import itertools
+import logging
+import struct
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from config import (
+    HOSTNAME_CACHE_SIZE,
+    HOSTNAME_NEGATIVE_TTL,
+    HOSTNAME_QUERY_TIMEOUT,
+    HOSTNAME_RESOLVE_CONCURRENCY,
+)
+
+logger = logging.getLogger(__name__)
+
+RESOLV_CONF = Path("/etc/resolv.conf")
+
+DNS_PORT = 53
+MDNS_PORT = 5353
+NBNS_PORT = 137
+
+TYPE_PTR = 12
+TYPE_NBSTAT = 0x21
+CLASS_IN = 1
+RCODE_NXDOMAIN = 3
+
+_HEADER = struct.Struct("!HHHHHH")
+_RR = struct.Struct("!HHIH")
+# NetBIOS wildcard name "*" padded with NULs, first-level encoded
+_NBSTAT_NAME = b"\x20" + b"CK" + b"AA" * 15 + b"\x00"
+
+
+def _encode_name(name: str) -> bytes:
+    out = bytearray()
+    for label in name.rstrip(".").split("."):
+        raw = label.encode()
+        out.append(len(raw))
+        out += raw
+    out.append(0)
+    return bytes(out)
+
+
+def _read_name(data: bytes, offset: int) -> tuple[str, int]:
+    """Decode a possibly compressed domain name. Returns (name, offset after it)."""
+    labels = []
+    end = None
+    for _ in range(128):
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        if length == 0:
+            return ".".join(labels), end if end is not None else offset + 1
+        labels.append(data[offset + 1:offset + 1 + length].decode("utf-8", "replace"))
+        offset += 1 + length
+    raise ValueError("DNS name compression loop")
+
+
+def _skip_name(data: bytes, offset: int) -> int:
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        if length == 0:
+            return offset + 1
+        offset += 1 + length
+
+
+def build_ptr_query(txid: int, ip: str) -> bytes:
+    name = ipaddress.ip_address(ip).reverse_pointer
+    return _HEADER.pack(txid, 0x0100, 1, 0, 0, 0) + _encode_name(name) + struct.pack("!HH", TYPE_PTR, CLASS_IN)
+
+
+def build_nbstat_query(txid: int) -> bytes:
+    return _HEADER.pack(txid, 0x0000, 1, 0, 0, 0) + _NBSTAT_NAME + struct.pack("!HH", TYPE_NBSTAT, CLASS_IN)
+
+
+def parse_ptr_response(data: bytes) -> tuple[str | None, int | None]:
+    """Return (hostname, ttl). ttl is None when the answer says nothing about caching."""
+    _, flags, qdcount, ancount, _, _ = _HEADER.unpack_from(data, 0)
+    offset = _HEADER.size
+    for _ in range(qdcount):
+        offset = _skip_name(data, offset) + 4
+    for _ in range(ancount):
+        offset = _skip_name(data, offset)
+        rtype, _, ttl, rdlength = _RR.unpack_from(data, offset)
+        offset += _RR.size
+        if rtype == TYPE_PTR:
+            name, _ = _read_name(data, offset)
+            return name.rstrip(".") or None, ttl
+        offset += rdlength
+    if flags & 0x000F == RCODE_NXDOMAIN:
+        return None, HOSTNAME_NEGATIVE_TTL
+    return None, None
+
+
+def parse_nbstat_response(data: bytes) -> str | None:
+    """First unique workstation (suffix 0x00) name in a NetBIOS node status reply."""
+    _, _, _, ancount, _, _ = _HEADER.unpack_from(data, 0)
+    if not ancount:
+        return None
+    offset = _skip_name(data, _HEADER.size)
+    rtype, _, _, _ = _RR.unpack_from(data, offset)
+    if rtype != TYPE_NBSTAT:
+        return None
+    offset += _RR.size
+    count = data[offset]
+    offset += 1
+    for _ in range(count):
+        raw, suffix, name_flags = data[offset:offset + 15], data[offset + 15], data[offset + 16] << 8 | data[offset + 17]
+        offset += 18
+        if suffix == 0x00 and not name_flags & 0x8000:
+            return raw.decode("ascii", "replace").strip() or None
+    return None
+
+
+def read_nameservers(path: Path = RESOLV_CONF) -> list[str]:
+    servers = []
+    try:
+        for line in path.read_text(encoding="utf-8").splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and parts[0] == "nameserver":
+                try:
+                    if ipaddress.ip_address(parts[1]).version == 4:
+                        servers.append(parts[1])
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return servers
+
+
+class _TTLCache:
+    """LRU cache of ip → hostname (or None for negative entries) with per-entry expiry."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, str | None]] = OrderedDict()
+
+    def get(self, key: str) -> tuple[bool, str | None]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def put(self, key: str, value: str | None, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.transport: asyncio.DatagramTransport | None = None
+        self.waiters: dict[int, tuple[tuple[str, int], asyncio.Future]] = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < _HEADER.size:
+            return
+        txid = int.from_bytes(data[:2], "big")
+        waiter = self.waiters.get(txid)
+        if waiter is None:
+            return
+        expected, future = waiter
+        if addr[0] == expected[0] and not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc):
+        logger.debug("Hostname resolver socket error: %s", exc)
+
+
+class HostnameResolver:
+    def __init__(
+        self,
+        nameservers: list[str] | None = None,
+        dns_port: int = DNS_PORT,
+        mdns_port: int = MDNS_PORT,
+        nbns_port: int = NBNS_PORT,
+        concurrency: int = HOSTNAME_RESOLVE_CONCURRENCY,
+        query_timeout: float = HOSTNAME_QUERY_TIMEOUT,
+        cache_size: int = HOSTNAME_CACHE_SIZE,
+        negative_ttl: float = HOSTNAME_NEGATIVE_TTL,
+    ):
+        self._nameservers = nameservers
+        self.dns_port = dns_port
+        self.mdns_port = mdns_port
+        self.nbns_port = nbns_port
+        self.concurrency = concurrency
+        self.query_timeout = query_timeout
+        self.negative_ttl = negative_ttl
+        self.cache = _TTLCache(cache_size)
+        # Shared by every resolve_many() call so concurrent batches stay within one bound
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.hits = 0
+        self.misses = 0
+        self._txids = itertools.count(1)
+        self._protocol: _UdpProtocol | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def nameservers(self) -> list[str]:
+        if self._nameservers is None:
+            self._nameservers = read_nameservers()
+        return self._nameservers
+
+    async def _endpoint(self) -> _UdpProtocol:
+        loop = asyncio.get_running_loop()
+        if self._protocol is None or self._loop is not loop or self._protocol.transport.is_closing():
+            _, self._protocol = await loop.create_datagram_endpoint(_UdpProtocol, local_addr=("0.0.0.0", 0))
+            self._loop = loop
+        return self._protocol
+
+    def _next_txid(self, protocol: _UdpProtocol) -> int:
+        while True:
+            txid = next(self._txids) & 0xFFFF
+            if txid and txid not in protocol.waiters:
+                return txid
+
+    async def _query(self, build, addr: tuple[str, int]) -> bytes | None:
+        protocol = await self._endpoint()
+        txid = self._next_txid(protocol)
+        future = asyncio.get_running_loop().create_future()
+        protocol.waiters[txid] = (addr, future)
+        try:
+            protocol.transport.sendto(build(txid), addr)
+            return await asyncio.wait_for(future, self.query_timeout)
+        except (asyncio.TimeoutError, OSError):
+            return None
+        finally:
+            protocol.waiters.pop(txid, None)
+
+    async def _resolve_uncached(self, ip: str) -> tuple[str | None, float]:
+        negative_ttl = self.negative_ttl
+        for server in self.nameservers:
+            data = await self._query(lambda txid: build_ptr_query(txid, ip), (server, self.dns_port))
+            if data is None:
+                continue
+            try:
+                name, ttl = parse_ptr_response(data)
+            except (IndexError, struct.error, ValueError):
+                continue
+            if name:
+                return name, ttl or negative_ttl
+            if ttl is not None:
+                negative_ttl = min(negative_ttl, ttl)
+            break
+
+        data = await self._query(lambda txid: build_ptr_query(txid, ip), (ip, self.mdns_port))
+        if data is not None:
+            try:
+                name, ttl = parse_ptr_response(data)
+            except (IndexError, struct.error, ValueError):
+                name = None
+            if name:
+                return name, ttl or negative_ttl
+
+        data = await self._query(build_nbstat_query, (ip, self.nbns_port))
+        if data is not None:
+            try:
+                name = parse_nbstat_response(data)
+            except (IndexError, struct.error):
+                name = None
+            if name:
+                return name, negative_ttl
+
+        return None, negative_ttl
+
+    async def resolve(self, ip: str) -> str | None:
+        hit, name = self.cache.get(ip)
+        if hit:
+            self.hits += 1
+            return name
+        self.misses += 1
+        name, ttl = await self._resolve_uncached(ip)
+        self.cache.put(ip, name, ttl)
+        return name
+
+    async def resolve_many(self, ips: list[str], deadline: float | None = None) -> dict[str, str | None]:
+        """Resolve ``ips`` with bounded concurrency. Hosts still pending at ``deadline`` seconds map to None."""
+        semaphore = self._semaphore
+        results: dict[str, str | None] = {ip: None for ip in ips}
+
+        async def worker(ip: str):
+            async with semaphore:
+                results[ip] = await self.resolve(ip)
+
+        tasks = [asyncio.ensure_future(worker(ip)) for ip in results]
+        if not tasks:
+            return results
+        _, still_pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in still_pending:
+            task.cancel()
+        return results
+
+    def stats(self) -> dict:
+        return {"entries": len(self.cache), "hits": self.hits, "misses": self.misses}
+
+    async def close(self) -> None:
+        if self._protocol is not None and self._protocol.transport is not None:
+            self._protocol.transport.close()
+        self._protocol = None
+
+
+class _ResponderProtocol(asyncio.DatagramProtocol):
+    def __init__(self, answer):
+        self.answer = answer
+        self.transport: asyncio.DatagramTransport | None = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            reply = self.answer(data)
+        except (IndexError, struct.error, ValueError):
+            return
+        if reply is not None:
+            self.transport.sendto(reply, addr)
+
+
+class LocalResponder:
+    """Fake DNS, mDNS and NetBIOS responders on loopback, for tests and benchmarks.
+
+    A nameserver on 127.0.0.1 answers PTR queries for the addresses in ``dns``,
+    returns NXDOMAIN for those in ``nxdomain`` and never answers the rest.
+    ``mdns`` and ``netbios`` map loopback addresses (any 127.x.y.z) to names
+    answered from that address, the way the host itself would answer. Point a
+    resolver at it with ``HostnameResolver(**responder.resolver_options())``.
+    """
+
+    def __init__(
+        self,
+        dns: dict[str, str] | None = None,
+        nxdomain: set[str] | None = None,
+        mdns: dict[str, str] | None = None,
+        netbios: dict[str, str] | None = None,
+        ttl: int = 300,
+    ):
+        self.dns = dns or {}
+        self.nxdomain = nxdomain or set()
+        self.mdns = mdns or {}
+        self.netbios = netbios or {}
+        self.ttl = ttl
+        self.queries = {"dns": 0, "mdns": 0, "netbios": 0}
+        self.ports = {"dns": 0, "mdns": 0, "netbios": 0}
+        self._transports: list[asyncio.DatagramTransport] = []
+
+    async def _bind(self, kind: str, host: str, answer) -> None:
+        loop = asyncio.get_running_loop()
+        # Every host of a kind shares one port, as real responders share a well-known one
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _ResponderProtocol(answer), local_addr=(host, self.ports[kind])
+        )
+        self.ports[kind] = transport.get_extra_info("sockname")[1]
+        self._transports.append(transport)
+
+    async def start(self) -> "LocalResponder":
+        await self._bind("dns", "127.0.0.1", self._answer_dns)
+        for ip, name in self.mdns.items():
+            await self._bind("mdns", ip, lambda data, name=name: self._answer_ptr("mdns", data, name))
+        for ip, name in self.netbios.items():
+            await self._bind("netbios", ip, lambda data, name=name: self._answer_nbstat(data, name))
+        for kind in ("mdns", "netbios"):
+            if not self.ports[kind]:
+                # Nothing answers, but the resolver still needs a port to query
+                await self._bind(kind, "127.0.0.1", lambda data: None)
+        return self
+
+    def resolver_options(self) -> dict:
+        return {
+            "nameservers": ["127.0.0.1"],
+            "dns_port": self.ports["dns"],
+            "mdns_port": self.ports["mdns"],
+            "nbns_port": self.ports["netbios"],
+        }
+
+    def _answer_dns(self, data: bytes) -> bytes | None:
+        name, _ = _read_name(data, _HEADER.size)
+        ip = ".".join(reversed(name.removesuffix(".in-addr.arpa").split(".")))
+        return self._answer_ptr("dns", data, self.dns.get(ip), nxdomain=ip in self.nxdomain)
+
+    def _answer_ptr(self, kind: str, data: bytes, hostname: str | None, nxdomain: bool = False) -> bytes | None:
+        self.queries[kind] += 1
+        txid = int.from_bytes(data[:2], "big")
+        question = data[_HEADER.size:_skip_name(data, _HEADER.size) + 4]
+        if hostname is None:
+            if not nxdomain:
+                return None
+            return _HEADER.pack(txid, 0x8183, 1, 0, 0, 0) + question
+        rdata = _encode_name(hostname)
+        # The answer's name points back at the question's (offset 12)
+        answer = b"\xc0\x0c" + _RR.pack(TYPE_PTR, CLASS_IN, self.ttl, len(rdata)) + rdata
+        return _HEADER.pack(txid, 0x8180, 1, 1, 0, 0) + question + answer
+
+    def _answer_nbstat(self, data: bytes, hostname: str) -> bytes:
+        self.queries["netbios"] += 1
+        txid = int.from_bytes(data[:2], "big")
+        # Workstation (0x00) name, then the group name real hosts also list; 46 bytes of statistics follow
+        names = [(hostname, 0x00, 0x0400), ("WORKGROUP", 0x00, 0x8400)]
+        rdata = bytes([len(names)]) + b"".join(
+            name.upper().encode("ascii")[:15].ljust(15) + bytes([suffix]) + flags.to_bytes(2, "big")
+            for name, suffix, flags in names
+        ) + bytes(46)
+        answer = _NBSTAT_NAME + _RR.pack(TYPE_NBSTAT, CLASS_IN, 0, len(rdata)) + rdata
+        return _HEADER.pack(txid, 0x8400, 0, 1, 0, 0) + answer
+
+    def close(self) -> None:
+        for transport in self._transports:
+            transport.close()
+        self._transports.clear()
+
+
+hostname_resolver = HostnameResolver()
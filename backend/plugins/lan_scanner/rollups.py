@@ -0,0 +1,160 @@
+"""Device-count time series: raw per-scan points plus minute, hour and day rollups.
+
+Each scan adds one raw ``DeviceHistory`` row and folds the same sample into the
+three rollup tiers. Range queries read whichever tier keeps the answer within a
+point budget, so charting a year costs the same as charting an hour.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import (
+    HISTORY_HOUR_RETENTION_DAYS,
+    HISTORY_MINUTE_RETENTION_DAYS,
+    HISTORY_RAW_RETENTION_DAYS,
+    SCAN_INTERVAL_SECONDS,
+)
+from core.database import upsert
+from plugins.lan_scanner.models import DeviceHistory, HistoryRollup
+
+ROLLUP_RESOLUTIONS = ("minute", "hour", "day")
+RESOLUTIONS = ("raw",) + ROLLUP_RESOLUTIONS
+
+# resolution -> (bucket width, retention; None keeps forever)
+TIERS = {
+    "raw": (timedelta(seconds=SCAN_INTERVAL_SECONDS), timedelta(days=HISTORY_RAW_RETENTION_DAYS)),
+    "minute": (timedelta(minutes=1), timedelta(days=HISTORY_MINUTE_RETENTION_DAYS)),
+    "hour": (timedelta(hours=1), timedelta(days=HISTORY_HOUR_RETENTION_DAYS)),
+    "day": (timedelta(days=1), None),
+}
+
+
+def utc_naive(ts: datetime) -> datetime:
+    """Timestamps are stored as naive UTC."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def bucket_start(ts: datetime, resolution: str) -> datetime:
+    ts = utc_naive(ts).replace(second=0, microsecond=0)
+    if resolution in ("hour", "day"):
+        ts = ts.replace(minute=0)
+    if resolution == "day":
+        ts = ts.replace(hour=0)
+    return ts
+
+
+async def record_rollups(session: AsyncSession, ts: datetime, online: int, offline: int, total: int) -> None:
+    """Fold one scan's counts into its minute, hour and day buckets (one upsert)."""
+    rows = [
+        {
+            "resolution": resolution,
+            "bucket": bucket_start(ts, resolution),
+            "samples": 1,
+            "online_min": online,
+            "online_max": online,
+            "online_sum": online,
+            "offline_sum": offline,
+            "total_sum": total,
+            "total_max": total,
+        }
+        for resolution in ROLLUP_RESOLUTIONS
+    ]
+    stmt = upsert(HistoryRollup)
+    new = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[HistoryRollup.resolution, HistoryRollup.bucket],
+        set_={
+            "samples": HistoryRollup.samples + 1,
+            "online_min": case((new.online_min < HistoryRollup.online_min, new.online_min), else_=HistoryRollup.online_min),
+            "online_max": case((new.online_max > HistoryRollup.online_max, new.online_max), else_=HistoryRollup.online_max),
+            "online_sum": HistoryRollup.online_sum + new.online_sum,
+            "offline_sum": HistoryRollup.offline_sum + new.offline_sum,
+            "total_sum": HistoryRollup.total_sum + new.total_sum,
+            "total_max": case((new.total_max > HistoryRollup.total_max, new.total_max), else_=HistoryRollup.total_max),
+        },
+    )
+    await session.execute(stmt, rows)
+
+
+async def prune_history(session: AsyncSession, now: datetime) -> dict[str, int]:
+    """Delete raw points and rollups older than their tier's retention."""
+    now = utc_naive(now)
+    removed = {}
+    _, raw_retention = TIERS["raw"]
+    result = await session.execute(delete(DeviceHistory).where(DeviceHistory.timestamp < now - raw_retention))
+    removed["raw"] = result.rowcount
+    for resolution in ROLLUP_RESOLUTIONS:
+        _, retention = TIERS[resolution]
+        if retention is None:
+            continue
+        result = await session.execute(
+            delete(HistoryRollup).where(
+                HistoryRollup.resolution == resolution,
+                HistoryRollup.bucket < bucket_start(now - retention, resolution),
+            )
+        )
+        removed[resolution] = result.rowcount
+    return removed
+
+
+def pick_resolution(start: datetime, end: datetime, max_points: int, now: datetime) -> str:
+    """Finest tier that still covers ``start`` and returns at most ``max_points`` points."""
+    span = end - start
+    for resolution in RESOLUTIONS:
+        width, retention = TIERS[resolution]
+        if retention is not None and start < utc_naive(now) - retention:
+            continue
+        # Buckets finer than the scan interval hold at most one sample each
+        if span / max(width, TIERS["raw"][0]) <= max_points:
+            return resolution
+    return "day"
+
+
+async def history_range(
+    session: AsyncSession, start: datetime, end: datetime, resolution: str, max_points: int
+) -> list[dict]:
+    """Points between ``start`` and ``end`` at ``resolution``; one bounded index range read."""
+    start, end = utc_naive(start), utc_naive(end)
+    if resolution == "raw":
+        rows = await session.execute(
+            select(DeviceHistory)
+            .where(DeviceHistory.timestamp.between(start, end))
+            .order_by(DeviceHistory.timestamp.desc())
+            .limit(max_points)
+        )
+        return [
+            {
+                "timestamp": h.timestamp,
+                "online_count": h.online_count,
+                "offline_count": h.offline_count,
+                "total_count": h.total_count,
+            }
+            for h in reversed(rows.scalars().all())
+        ]
+
+    rows = await session.execute(
+        select(HistoryRollup)
+        .where(
+            HistoryRollup.resolution == resolution,
+            HistoryRollup.bucket.between(bucket_start(start, resolution), end),
+        )
+        .order_by(HistoryRollup.bucket.desc())
+        .limit(max_points)
+    )
+    return [
+        {
+            "timestamp": r.bucket,
+            "online_count": round(r.online_sum / r.samples),
+            "offline_count": round(r.offline_sum / r.samples),
+            "total_count": round(r.total_sum / r.samples),
+            "online_min": r.online_min,
+            "online_max": r.online_max,
+            "total_max": r.total_max,
+            "samples": r.samples,
+        }
+        for r in reversed(rows.scalars().all())
+    ]
@@ -1,91 +1,239 @@
-import asyncio
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import Any
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy import select, func, desc
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.database import get_session
-from plugins.lan_scanner.models import Device, ScanRecord, DeviceHistory
-from plugins.lan_scanner.schemas import DeviceOut, ScanSummary, ScanRecordOut, HistoryPoint
+from config import HISTORY_DEFAULT_SPAN_HOURS, HISTORY_MAX_POINTS, RESPONSE_CACHE_WINDOW_SECONDS
+from core.database import get_read_session, read_session_factory
+from plugins.lan_scanner.cache import Payload, response_cache
+from plugins.lan_scanner.models import Device, ScanRecord, DeviceHistory, ip_key
+from plugins.lan_scanner.presence import availability, device_presence, presence_window
+from plugins.lan_scanner.queries import SORT_KEYS, DeviceQuery, InvalidQuery, device_page
+from plugins.lan_scanner.rollups import RESOLUTIONS, history_range, pick_resolution, utc_naive
+from plugins.lan_scanner.schemas import (
+    DeviceAvailabilityOut, DeviceChangesOut, DeviceOut, DevicePresenceOut, HistoryPoint, ScanRecordOut, ScanSummary,
+)
 from plugins.lan_scanner.scanner import detect_subnets
-from plugins.lan_scanner.tasks import run_scan
+from plugins.lan_scanner.state import device_state
+from plugins.lan_scanner.tasks import start_scan
 
 router = APIRouter()
 
 
-@router.get("/devices", response_model=list[DeviceOut])
+def _window_end(to: datetime | None) -> datetime:
+    """``to``, or for a window ending now, the next RESPONSE_CACHE_WINDOW_SECONDS boundary.
+
+    Rounded up so the cached window always covers now, including a scan that
+    just finished; scan commits invalidate it, and between scans it moves on
+    every boundary.
+    """
+    if to is not None:
+        return to
+    now = datetime.now(timezone.utc)
+    remainder = now.timestamp() % RESPONSE_CACHE_WINDOW_SECONDS
+    return now + timedelta(seconds=RESPONSE_CACHE_WINDOW_SECONDS - remainder) if remainder else now
+
+
+@router.get("/devices", response_model=list[DeviceOut] | DeviceChangesOut)
 async def list_devices(
+    request: Request,
     status: str | None = Query(None, description="Filter by status: online/offline"),
-    session: AsyncSession = Depends(get_session),
+    vendor: str | None = Query(None, description="Filter by vendor"),
+    q: str | None = Query(None, description="Substring match on IP, MAC, hostname, vendor or name"),
+    cidr: str | None = Query(None, description="Only devices inside this network, e.g. 10.20.0.0/16"),
+    sort: str = Query("ip_address", description=f"Sort key: {', '.join(SORT_KEYS)}"),
+    order: str = Query("asc", description="asc or desc"),
+    limit: int | None = Query(None, ge=1, le=1000, description="Page size; the next page's cursor is in X-Next-Cursor"),
+    cursor: str | None = Query(None, description="Cursor from a previous page's X-Next-Cursor header"),
+    fields: str | None = Query(None, description="Comma-separated device fields to return"),
+    since: int | None = Query(None, ge=0, description="Return device changes after this sequence number (0 for a full snapshot)"),
+    epoch: str | None = Query(None, description="Epoch the sequence number belongs to"),
 ):
-    stmt = select(Device).order_by(Device.ip_address)
-    if status:
-        stmt = stmt.where(Device.status == status)
-    result = await session.execute(stmt)
-    return result.scalars().all()
+    if since is not None:
+        return device_state.since(since, epoch)
+
+    query = DeviceQuery(
+        sort=sort, order=order, limit=limit, cursor=cursor,
+        status=status, vendor=vendor, search=q, cidr=cidr,
+    )
+    if fields:
+        query.fields = [f.strip() for f in fields.split(",") if f.strip()]
+    try:
+        query.validate()
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def build():
+        async with read_session_factory() as session:
+            try:
+                devices, next_cursor = await device_page(session, query)
+            except InvalidQuery as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        headers = {}
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+            headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+        return Payload(devices, headers)
+
+    return await response_cache.respond(request, list[dict[str, Any]], build)
 
 
 @router.get("/devices/{ip_address}", response_model=DeviceOut)
-async def get_device(ip_address: str, session: AsyncSession = Depends(get_session)):
-    result = await session.execute(select(Device).where(Device.ip_address == ip_address))
+async def get_device(ip_address: str, session: AsyncSession = Depends(get_read_session)):
+    try:
+        key = ip_key(ip_address)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid IP address")
+    # An address can be held by several devices over time; report its latest holder
+    result = await session.execute(
+        select(Device).where(Device.ip_key == key).order_by(desc(Device.last_seen)).limit(1)
+    )
     device = result.scalar_one_or_none()
     if not device:
-        from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Device not found")
     return device
 
 
-@router.get("/summary", response_model=ScanSummary)
-async def get_summary(session: AsyncSession = Depends(get_session)):
-    total = await session.scalar(select(func.count(Device.id)))
-    online = await session.scalar(select(func.count(Device.id)).where(Device.status == "online"))
-    offline = (total or 0) - (online or 0)
+@router.get("/devices/{mac_address}/presence", response_model=DevicePresenceOut)
+async def get_device_presence(
+    mac_address: str,
+    from_: datetime | None = Query(None, alias="from", description="Window start; defaults to `to` minus HISTORY_DEFAULT_SPAN_HOURS"),
+    to: datetime | None = Query(None, description="Window end; defaults to now"),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Online intervals of one device overlapping the window, and its availability there."""
+    start, end = presence_window(from_, to, timedelta(hours=HISTORY_DEFAULT_SPAN_HOURS))
+    return await device_presence(session, mac_address, start, end)
 
-    last_scan = await session.scalar(
-        select(ScanRecord.completed_at).order_by(desc(ScanRecord.completed_at)).limit(1)
-    )
-    subnets = detect_subnets()
-
-    return ScanSummary(
-        total_devices=total or 0,
-        online_devices=online or 0,
-        offline_devices=offline,
-        last_scan_at=last_scan,
-        subnets=subnets,
-    )
+
+@router.get("/availability", response_model=list[DeviceAvailabilityOut])
+async def get_availability(
+    request: Request,
+    from_: datetime | None = Query(None, alias="from", description="Window start; defaults to `to` minus HISTORY_DEFAULT_SPAN_HOURS"),
+    to: datetime | None = Query(None, description="Window end; defaults to now"),
+):
+    """Share of the window each device was online, for every device."""
+    start, end = presence_window(from_, _window_end(to), timedelta(hours=HISTORY_DEFAULT_SPAN_HOURS))
+
+    async def build():
+        async with read_session_factory() as session:
+            return await availability(session, start, end)
+
+    return await response_cache.respond(request, list[DeviceAvailabilityOut], build, vary=(end,))
+
+
+@router.get("/summary", response_model=ScanSummary)
+async def get_summary(request: Request):
+    async def build():
+        async with read_session_factory() as session:
+            total = await session.scalar(select(func.count(Device.id)))
+            online = await session.scalar(select(func.count(Device.id)).where(Device.status == "online"))
+            last_scan = await session.scalar(
+                select(ScanRecord.completed_at)
+                .where(ScanRecord.completed_at.is_not(None))
+                .order_by(desc(ScanRecord.completed_at))
+                .limit(1)
+            )
+        offline = (total or 0) - (online or 0)
+        subnets = detect_subnets()
+
+        return ScanSummary(
+            total_devices=total or 0,
+            online_devices=online or 0,
+            offline_devices=offline,
+            last_scan_at=last_scan,
+            subnets=subnets,
+        )
+
+    return await response_cache.respond(request, ScanSummary, build)
 
 
 @router.get("/history", response_model=list[HistoryPoint])
 async def get_history(
+    request: Request,
     limit: int = Query(50, ge=1, le=500),
-    session: AsyncSession = Depends(get_session),
+    from_: datetime | None = Query(None, alias="from", description="Range start; defaults to `to` minus HISTORY_DEFAULT_SPAN_HOURS"),
+    to: datetime | None = Query(None, description="Range end; defaults to now"),
+    resolution: str | None = Query(None, description=f"auto, {', '.join(RESOLUTIONS)}"),
+    max_points: int = Query(HISTORY_MAX_POINTS, ge=1, le=5000),
 ):
-    result = await session.execute(
-        select(DeviceHistory).order_by(desc(DeviceHistory.timestamp)).limit(limit)
-    )
-    rows = result.scalars().all()
-    return list(reversed(rows))
+    """Without a range or resolution, the latest ``limit`` raw points.
+
+    Otherwise points between ``from`` and ``to``; ``resolution=auto`` picks the
+    finest tier that covers the range within ``max_points``. The tier used is
+    returned in the ``X-History-Resolution`` header.
+    """
+    if from_ is None and to is None and resolution is None:
+        async def build_latest():
+            async with read_session_factory() as session:
+                result = await session.execute(
+                    select(DeviceHistory).order_by(desc(DeviceHistory.timestamp)).limit(limit)
+                )
+                rows = result.scalars().all()
+            return list(reversed(rows))
+
+        return await response_cache.respond(request, list[HistoryPoint], build_latest)
+
+    if resolution not in (None, "auto") + RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be auto or one of: {', '.join(RESOLUTIONS)}")
+
+    end = _window_end(to)
+    start = from_ or end - timedelta(hours=HISTORY_DEFAULT_SPAN_HOURS)
+
+    async def build():
+        tier = resolution if resolution in RESOLUTIONS else pick_resolution(
+            utc_naive(start), utc_naive(end), max_points, datetime.now(timezone.utc)
+        )
+        async with read_session_factory() as session:
+            points = await history_range(session, start, end, tier, max_points)
+        return Payload(points, {"X-History-Resolution": tier})
+
+    return await response_cache.respond(request, list[HistoryPoint], build, vary=(end,))
 
 
 @router.get("/scans", response_model=list[ScanRecordOut])
 async def list_scans(
+    request: Request,
     limit: int = Query(20, ge=1, le=100),
-    session: AsyncSession = Depends(get_session),
 ):
-    result = await session.execute(
-        select(ScanRecord).order_by(desc(ScanRecord.started_at)).limit(limit)
-    )
-    return result.scalars().all()
+    async def build():
+        async with read_session_factory() as session:
+            result = await session.execute(
+                select(ScanRecord).order_by(desc(ScanRecord.started_at)).limit(limit)
+            )
+            return result.scalars().all()
+
+    return await response_cache.respond(request, list[ScanRecordOut], build)
+
+
+@router.get("/scans/{scan_id}", response_model=ScanRecordOut)
+async def get_scan(scan_id: int, session: AsyncSession = Depends(get_read_session)):
+    """One scan record; poll it for the status of a scan started with POST /scan."""
+    scan = await session.get(ScanRecord, scan_id)
+    if not scan:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    return scan
 
 
 @router.post("/scan")
 async def trigger_scan():
-    """Trigger an immediate manual scan."""
-    asyncio.create_task(run_scan())
-    return {"message": "Scan started"}
+    """Trigger an immediate manual scan, or join the one already running."""
+    scan_id, started = await start_scan()
+    return {
+        "message": "Scan started" if started else "Scan already running",
+        "scan_id": scan_id,
+        "started": started,
+    }
 
 
 @router.get("/subnets")
 async def get_subnets():
     return {"subnets": detect_subnets()}
+
+
+@router.get("/cache")
+async def cache_stats():
+    """Response cache hit/miss counters."""
+    return response_cache.stats()
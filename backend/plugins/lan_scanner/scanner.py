@@ -3,8 +3,14 @@ import ipaddress
 import logging
 import platform
 import re
-import socket
 import subprocess
+import time
+from typing import AsyncIterator
+
+from config import ARP_ENGINE, SCAN_INTERFACE_RATE_PPS, SUBNET_CACHE_TTL_SECONDS
+from plugins.lan_scanner.budget import ScanBudget
+from plugins.lan_scanner.metrics import host_count, probes_sent
+from plugins.lan_scanner.workers import parse_pool
 
 logger = logging.getLogger(__name__)
 
@@ -59,56 +65,74 @@ def _fallback_subnet_detection() -> list[str]:
     return subnets or ["192.168.1.0/24"]
 
 
-def detect_subnets() -> list[str]:
-    return _detect_local_subnets()
+_subnet_cache: tuple[float, list[str]] | None = None
 
 
-def _resolve_hostname(ip: str) -> str | None:
-    try:
-        return socket.gethostbyaddr(ip)[0]
-    except (socket.herror, socket.gaierror, OSError):
-        return None
+def detect_subnets(refresh: bool = False) -> list[str]:
+    """Local subnets, re-detected at most every ``SUBNET_CACHE_TTL_SECONDS`` unless ``refresh``."""
+    global _subnet_cache
+    now = time.monotonic()
+    if refresh or _subnet_cache is None or now - _subnet_cache[0] >= SUBNET_CACHE_TTL_SECONDS:
+        _subnet_cache = (now, _detect_local_subnets())
+    return list(_subnet_cache[1])
 
 
-def _lookup_vendor(mac: str) -> str | None:
-    try:
-        from mac_vendor_lookup import MacLookup
-        return MacLookup().lookup(mac)
-    except Exception:
-        return None
+def _scapy_arp(subnet: str, timeout: int) -> list[dict]:
+    """Blocking scapy ARP sweep, run in the parse pool where scapy decodes the replies."""
+    from scapy.all import ARP, Ether, srp
+
+    arp = ARP(pdst=str(subnet))
+    ether = Ether(dst="ff:ff:ff:ff:ff:ff")
+    packet = ether / arp
+    answered, _ = srp(packet, timeout=timeout, verbose=False)
+    devices = []
+    for _, received in answered:
+        ip = received.psrc
+        mac = received.hwsrc.upper()
+        devices.append({
+            "ip_address": ip,
+            "mac_address": mac,
+        })
+    return devices
 
 
 async def arp_scan(subnet: str, timeout: int = 3) -> list[dict]:
-    """ARP scan using scapy. Requires root/sudo."""
-    try:
-        from scapy.all import ARP, Ether, srp
-    except ImportError:
-        logger.warning("scapy not installed, falling back to ping sweep")
-        return await ping_sweep(subnet, timeout)
-
-    def _do_scan():
-        arp = ARP(pdst=str(subnet))
-        ether = Ether(dst="ff:ff:ff:ff:ff:ff")
-        packet = ether / arp
-        answered, _ = srp(packet, timeout=timeout, verbose=False)
-        devices = []
-        for _, received in answered:
-            ip = received.psrc
-            mac = received.hwsrc.upper()
-            devices.append({
-                "ip_address": ip,
-                "mac_address": mac,
-                "hostname": _resolve_hostname(ip),
-                "vendor": _lookup_vendor(mac),
-            })
-        return devices
-
-    loop = asyncio.get_event_loop()
+    """ARP scan using scapy in a worker process. Requires root/sudo; raises ImportError without scapy."""
+    devices = await parse_pool().run(_scapy_arp, subnet, timeout)
+    probes_sent.labels(subnet, "arp").inc(host_count(subnet))
+    return devices
+
+
+def interface_for_subnet(subnet: str) -> str:
+    """Name of the local interface on ``subnet``, or "default" when it cannot be determined."""
     try:
-        return await loop.run_in_executor(None, _do_scan)
-    except PermissionError:
-        logger.warning("ARP scan requires root, falling back to ping sweep")
-        return await ping_sweep(subnet, timeout)
+        from plugins.lan_scanner.arp_engine import find_interface
+        return find_interface(subnet)[0]
+    except (ImportError, OSError):
+        return "default"
+
+
+def _budget_kwargs(subnet: str, budget: ScanBudget | None) -> dict:
+    """Pacing for a native sweep: the scan's shared limits, or the interface rate on its own."""
+    if budget is None:
+        return {"rate_pps": SCAN_INTERFACE_RATE_PPS}
+    return {
+        "limiter": budget.limiter_for(interface_for_subnet(subnet)),
+        "inflight": budget.inflight,
+        "deadline": budget.deadline,
+    }
+
+
+async def native_arp_stream(
+    subnet: str,
+    timeout: int = 3,
+    budget: ScanBudget | None = None,
+) -> AsyncIterator[dict]:
+    """ARP scan on a raw AF_PACKET socket driven by the event loop. Linux only, requires root."""
+    from plugins.lan_scanner.arp_engine import stream
+
+    async for device in stream(subnet, timeout=timeout, **_budget_kwargs(subnet, budget)):
+        yield device
 
 
 async def _get_mac_from_arp_cache(ip: str) -> str | None:
@@ -129,13 +153,49 @@ async def _get_mac_from_arp_cache(ip: str) -> str | None:
     return None
 
 
-async def ping_sweep(subnet: str, timeout: int = 1) -> list[dict]:
-    """Fallback: ping each IP in the subnet concurrently."""
+async def ping_stream(
+    subnet: str,
+    timeout: int = 1,
+    budget: ScanBudget | None = None,
+) -> AsyncIterator[dict]:
+    """Fallback: echo-ping the whole subnet from one ICMP socket.
+
+    Hosts whose MAC is already in the neighbour table are yielded as they answer;
+    the rest are resolved from one more snapshot after the sweep. Raises
+    PermissionError/OSError on the first iteration when no ICMP socket can be opened.
+    """
+    from plugins.lan_scanner.icmp_engine import stream
+    from plugins.lan_scanner.neighbours import NeighbourMonitor, neighbour_snapshot
+
+    pool = parse_pool()
+    unresolved: list[str] = []
+    async with NeighbourMonitor() as monitor:
+        neighbours = await pool.run(neighbour_snapshot) or {}
+        async for ip in stream(subnet, timeout=timeout, **_budget_kwargs(subnet, budget)):
+            mac = monitor.table.get(ip) or neighbours.get(ip)
+            if mac:
+                yield {"ip_address": ip, "mac_address": mac}
+            else:
+                unresolved.append(ip)
+
+    if unresolved:
+        neighbours = await pool.run(neighbour_snapshot)
+        for ip in unresolved:
+            if neighbours is not None:
+                mac = neighbours.get(ip)
+            else:
+                mac = await _get_mac_from_arp_cache(ip)
+            yield {"ip_address": ip, "mac_address": mac or "unknown"}
+
+
+async def subprocess_ping_stream(subnet: str, timeout: int = 1) -> AsyncIterator[dict]:
+    """Ping each IP in the subnet concurrently with the system ``ping`` binary."""
     network = ipaddress.ip_network(subnet, strict=False)
     hosts = list(network.hosts())
 
     # Limit concurrency to avoid overwhelming the system
     semaphore = asyncio.Semaphore(50)
+    sent = probes_sent.labels(subnet, "ping")
 
     async def ping_host(ip: str) -> dict | None:
         async with semaphore:
@@ -150,29 +210,85 @@ async def ping_sweep(subnet: str, timeout: int = 1) -> list[dict]:
                 stderr=asyncio.subprocess.DEVNULL,
             )
             await proc.wait()
+            sent.inc()
             if proc.returncode == 0:
                 mac = await _get_mac_from_arp_cache(ip)
-                hostname = _resolve_hostname(ip)
-                vendor = _lookup_vendor(mac) if mac else None
-                return {
-                    "ip_address": ip,
-                    "mac_address": mac or "unknown",
-                    "hostname": hostname,
-                    "vendor": vendor,
-                }
+                return {"ip_address": ip, "mac_address": mac or "unknown"}
             return None
 
-    tasks = [ping_host(str(ip)) for ip in hosts]
-    results = await asyncio.gather(*tasks)
-    return [r for r in results if r is not None]
+    tasks = [asyncio.ensure_future(ping_host(str(ip))) for ip in hosts]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            device = await next_done
+            if device is not None:
+                yield device
+    finally:
+        for task in tasks:
+            task.cancel()
 
 
-async def scan_network(subnet: str, timeout: int = 3) -> tuple[list[dict], str]:
-    """Try ARP scan first, fall back to ping sweep. Returns (devices, method)."""
-    try:
-        devices = await arp_scan(subnet, timeout)
-        return devices, "arp"
-    except Exception as e:
-        logger.warning("ARP scan failed for %s: %s, trying ping sweep", subnet, e)
-    devices = await ping_sweep(subnet, timeout)
-    return devices, "ping"
+class NetworkScan:
+    """Devices on one subnet, yielded as they are discovered.
+
+    Tries the native ARP engine, then scapy, then the ICMP sweep, then one ``ping``
+    per host. ``method`` names the path that produced the results. With a
+    ``budget`` the native engines share its rate, in-flight and deadline limits.
+    A socket error falls back to the next path only while nothing has been
+    yielded; once devices were found it fails the scan instead of yielding
+    them again.
+    """
+
+    def __init__(self, subnet: str, timeout: int = 3, budget: ScanBudget | None = None):
+        self.subnet = subnet
+        self.timeout = timeout
+        self.budget = budget
+        self.method: str | None = None
+        self._yielded = 0
+
+    async def __aiter__(self) -> AsyncIterator[dict]:
+        subnet, timeout = self.subnet, self.timeout
+        if ARP_ENGINE == "native" and platform.system() == "Linux":
+            try:
+                self.method = "arp"
+                async for device in native_arp_stream(subnet, timeout, budget=self.budget):
+                    self._yielded += 1
+                    yield device
+                return
+            except (PermissionError, OSError) as e:
+                if self._yielded:
+                    raise
+                logger.warning("Native ARP scan unavailable for %s: %s, trying scapy", subnet, e)
+
+        try:
+            devices = await arp_scan(subnet, timeout)
+        except ImportError:
+            logger.warning("scapy not installed, falling back to ping sweep")
+        except PermissionError:
+            logger.warning("ARP scan requires root, falling back to ping sweep")
+        except Exception as e:
+            logger.warning("ARP scan failed for %s: %s, trying ping sweep", subnet, e)
+        else:
+            self.method = "arp"
+            for device in devices:
+                yield device
+            return
+
+        self.method = "ping"
+        try:
+            async for device in ping_stream(subnet, timeout, budget=self.budget):
+                self._yielded += 1
+                yield device
+            return
+        except (PermissionError, OSError) as e:
+            if self._yielded:
+                raise
+            logger.warning("ICMP socket unavailable for %s: %s, spawning ping per host", subnet, e)
+        async for device in subprocess_ping_stream(subnet, timeout):
+            yield device
+
+
+async def scan_network(subnet: str, timeout: int = 3, budget: ScanBudget | None = None) -> tuple[list[dict], str]:
+    """Collect a :class:`NetworkScan`. Returns (devices, method)."""
+    scan = NetworkScan(subnet, timeout, budget)
+    devices = [device async for device in scan]
+    return devices, scan.method
@@ -1,6 +1,7 @@
 from datetime import datetime
+from typing import Any
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class DeviceOut(BaseModel):
@@ -18,6 +19,16 @@ class DeviceOut(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class DeviceChangesOut(BaseModel):
+    """Device state after ``seq``: either the changes since then or a full snapshot."""
+
+    epoch: str
+    seq: int
+    full: bool
+    devices: list[DeviceOut]
+    changes: list[dict[str, Any]]
+
+
 class ScanSummary(BaseModel):
     total_devices: int
     online_devices: int
@@ -26,6 +37,16 @@ class ScanSummary(BaseModel):
     subnets: list[str]
 
 
+class SubnetScanOut(BaseModel):
+    subnet: str
+    interface: str
+    method: str | None
+    status: str
+    device_count: int
+    duration_ms: int
+    error: str | None = None
+
+
 class ScanRecordOut(BaseModel):
     id: int
     subnet: str
@@ -34,6 +55,7 @@ class ScanRecordOut(BaseModel):
     offline_devices: int
     scan_method: str
     scan_duration_ms: int | None
+    subnet_results: list[SubnetScanOut] | None = None
     status: str
     started_at: datetime
     completed_at: datetime | None
@@ -46,3 +68,33 @@ class HistoryPoint(BaseModel):
     online_count: int
     offline_count: int
     total_count: int
+    # Rollup buckets only: counts above are bucket averages
+    online_min: int | None = None
+    online_max: int | None = None
+    total_max: int | None = None
+    samples: int | None = None
+
+
+class PresenceIntervalOut(BaseModel):
+    started_at: datetime
+    last_seen_at: datetime
+    ended_at: datetime | None
+
+
+class DevicePresenceOut(BaseModel):
+    mac_address: str
+    from_: datetime = Field(alias="from")
+    to: datetime
+    online_seconds: float
+    availability: float | None
+    intervals: list[PresenceIntervalOut]
+
+    model_config = {"populate_by_name": True, "serialize_by_alias": True}
+
+
+class DeviceAvailabilityOut(BaseModel):
+    mac_address: str
+    ip_address: str
+    status: str
+    online_seconds: float
+    availability: float | None
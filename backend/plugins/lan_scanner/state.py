@@ -0,0 +1,139 @@
+import logging
+import uuid
+from collections import deque
+from typing import Iterable
+
+from config import DEVICE_CHANGE_LOG_SIZE
+from plugins.lan_scanner.models import ip_key
+from plugins.lan_scanner.schemas import DeviceOut
+
+logger = logging.getLogger(__name__)
+
+# Columns that change on every scan; a device whose only change is one of these
+# is reported in a batched "seen" entry instead of its own "update"
+_SCAN_COLUMNS = frozenset({"last_seen"})
+
+
+def device_dict(row) -> dict:
+    """JSON-ready device dict, shaped like the ``/devices`` response."""
+    return DeviceOut.model_validate(row).model_dump(mode="json")
+
+
+class DeviceState:
+    """In-memory, versioned copy of the device table.
+
+    Every change is assigned the next sequence number and kept in a bounded log,
+    so a client that knows its last ``seq`` can catch up with only the changes it
+    missed. Change entries are one of::
+
+        {"seq": n, "op": "new", "mac_address": ..., "fields": {<full device>}}
+        {"seq": n, "op": "update", "mac_address": ..., "fields": {<changed columns>}}
+        {"seq": n, "op": "offline", "mac_address": ..., "fields": {"status": "offline"}}
+        {"seq": n, "op": "seen", "last_seen": ..., "macs": [...]}
+
+    The ``epoch`` changes whenever the state is rebuilt (e.g. on restart), which
+    invalidates every sequence number handed out before.
+    """
+
+    def __init__(self, log_size: int = DEVICE_CHANGE_LOG_SIZE):
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self._devices: dict[str, dict] = {}
+        self._log: deque[dict] = deque(maxlen=log_size)
+
+    def load(self, devices: Iterable[dict]) -> None:
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self._log.clear()
+        self._devices = {d["mac_address"]: d for d in devices}
+        logger.info("Device state loaded: %d devices (epoch %s)", len(self._devices), self.epoch)
+
+    def _append(self, entry: dict, changes: list[dict]) -> None:
+        self.seq += 1
+        entry["seq"] = self.seq
+        self._log.append(entry)
+        changes.append(entry)
+
+    def apply_upserted(self, rows: Iterable[dict]) -> list[dict]:
+        """Record devices written by one upsert batch; returns the new change entries."""
+        changes: list[dict] = []
+        seen: list[str] = []
+        last_seen = None
+        for row in rows:
+            mac = row["mac_address"]
+            current = self._devices.get(mac)
+            # Logged entries must not see later in-place changes to the snapshot
+            self._devices[mac] = dict(row)
+            if current is None:
+                self._append({"op": "new", "mac_address": mac, "fields": row}, changes)
+                continue
+            diff = {k: v for k, v in row.items() if current.get(k) != v and k not in _SCAN_COLUMNS}
+            if diff:
+                diff["last_seen"] = row["last_seen"]
+                self._append({"op": "update", "mac_address": mac, "fields": diff}, changes)
+            else:
+                seen.append(mac)
+                last_seen = row["last_seen"]
+        if seen:
+            self._append({"op": "seen", "last_seen": last_seen, "macs": seen}, changes)
+        return changes
+
+    def apply_rows(self, rows: Iterable[dict]) -> list[dict]:
+        """Record device rows read back from the database, skipping ones already held as they are.
+
+        Used for rows written by other workers; rows this worker wrote itself come
+        back identical and add nothing to the log.
+        """
+        return self.apply_upserted(row for row in rows if self._devices.get(row["mac_address"]) != row)
+
+    def apply_fields(self, updates: dict[str, dict]) -> list[dict]:
+        """Record column changes for existing devices (mac → {column: value})."""
+        changes: list[dict] = []
+        for mac, fields in updates.items():
+            current = self._devices.get(mac)
+            if current is None:
+                continue
+            diff = {k: v for k, v in fields.items() if current.get(k) != v}
+            if diff:
+                current.update(diff)
+                self._append({"op": "update", "mac_address": mac, "fields": diff}, changes)
+        return changes
+
+    def apply_offline(self, macs: Iterable[str]) -> list[dict]:
+        changes: list[dict] = []
+        for mac in macs:
+            current = self._devices.get(mac)
+            if current is not None:
+                current["status"] = "offline"
+            self._append({"op": "offline", "mac_address": mac, "fields": {"status": "offline"}}, changes)
+        return changes
+
+    def snapshot(self) -> dict:
+        return {
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "full": True,
+            "devices": sorted(self._devices.values(), key=lambda d: ip_key(d["ip_address"])),
+            "changes": [],
+        }
+
+    def since(self, seq: int, epoch: str | None = None) -> dict:
+        """Changes after ``seq``, or a full snapshot if they are no longer in the log.
+
+        ``seq`` 0 means the client holds nothing and always gets a snapshot.
+        """
+        if seq == 0 or (epoch is not None and epoch != self.epoch) or seq > self.seq:
+            return self.snapshot()
+        oldest = self._log[0]["seq"] if self._log else self.seq + 1
+        if seq < oldest - 1:
+            return self.snapshot()
+        return {
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "full": False,
+            "devices": [],
+            "changes": [entry for entry in self._log if entry["seq"] > seq],
+        }
+
+
+device_state = DeviceState()
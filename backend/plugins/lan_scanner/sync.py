@@ -0,0 +1,86 @@
+"""Keeps every worker's cached responses and device deltas in step with the shared database.
+
+Each transaction that writes devices or scan records calls ``bump_generation``
+and stamps the device rows it writes with the returned value. ``DataSync``
+polls the generation every ``DATA_SYNC_INTERVAL_SECONDS``; when it has moved,
+the device rows stamped since are handed to a callback, which records them in
+the device state and drops cached responses. A worker therefore sees scans run
+by any other worker within one interval, and its own writes twice, harmlessly.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import DATA_SYNC_INTERVAL_SECONDS
+from core.database import read_session_factory
+from plugins.lan_scanner.models import DataGeneration, Device
+from plugins.lan_scanner.state import device_dict
+
+logger = logging.getLogger(__name__)
+
+
+async def bump_generation(session: AsyncSession) -> int:
+    """Advance the shared generation in the caller's transaction and return it.
+
+    The row stays locked until the transaction ends, so generations commit in
+    order: once a worker reads generation N, every write stamped up to N is visible.
+    """
+    return await session.scalar(
+        update(DataGeneration)
+        .where(DataGeneration.id == 1)
+        .values(generation=DataGeneration.generation + 1)
+        .returning(DataGeneration.generation)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def read_generation(session: AsyncSession) -> int:
+    return await session.scalar(select(DataGeneration.generation).where(DataGeneration.id == 1)) or 0
+
+
+class DataSync:
+    def __init__(self, interval: float = DATA_SYNC_INTERVAL_SECONDS):
+        self.interval = interval
+        self.generation = 0
+        self._task: asyncio.Task | None = None
+
+    def start(self, generation: int, apply: Callable[[list[dict]], Awaitable[None]]) -> None:
+        """Poll from ``generation`` on, calling ``apply(rows)`` with the device rows written since."""
+        self.generation = generation
+        self._task = asyncio.create_task(self._run(apply))
+
+    async def poll(self, apply: Callable[[list[dict]], Awaitable[None]]) -> bool:
+        """Apply changes committed since the last poll; returns whether there were any."""
+        async with read_session_factory() as session:
+            generation = await read_generation(session)
+            if generation == self.generation:
+                return False
+            stmt = select(Device)
+            # A lower generation means the database was replaced; take every row
+            if generation > self.generation:
+                stmt = stmt.where(Device.generation > self.generation)
+            rows = [device_dict(device) for device in (await session.execute(stmt)).scalars()]
+        self.generation = generation
+        await apply(rows)
+        return True
+
+    async def _run(self, apply: Callable[[list[dict]], Awaitable[None]]) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll(apply)
+            except Exception as e:
+                logger.warning("Data sync failed: %s", e)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+data_sync = DataSync()
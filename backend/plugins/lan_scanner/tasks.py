@@ -1,121 +1,242 @@
+import asyncio
 import logging
 import time
 from datetime import datetime, timezone
 
-from sqlalchemy import select
-
+from config import (
+    HOSTNAME_ENRICH_DEADLINE,
+    SCAN_DEADLINE_SECONDS,
+    SCAN_INTERFACE_RATE_PPS,
+    SCAN_MAX_INFLIGHT_PROBES,
+)
 from core.database import async_session_factory
+from core.profiling import profiler
 from core.websocket_manager import ws_manager
-from plugins.lan_scanner.models import Device, ScanRecord, DeviceHistory
-from plugins.lan_scanner.scanner import detect_subnets, scan_network
+from plugins.lan_scanner.budget import ScanBudget
+from plugins.lan_scanner.cache import response_cache
+from plugins.lan_scanner.metrics import PhaseClock, scan_duration_seconds
+from plugins.lan_scanner.coordinator import scan_coordinator
+from plugins.lan_scanner.models import ScanRecord, DeviceHistory
+from plugins.lan_scanner.orchestrator import SubnetResult, stream_subnets
+from plugins.lan_scanner.presence import update_presence
+from plugins.lan_scanner.reconcile import finalize_scan, update_hostnames, upsert_devices
+from plugins.lan_scanner.resolver import hostname_resolver
+from plugins.lan_scanner.rollups import prune_history, record_rollups, utc_naive
+from plugins.lan_scanner.scanner import detect_subnets
+from plugins.lan_scanner.state import device_state
+from plugins.lan_scanner.sync import bump_generation
+from plugins.lan_scanner.workers import lookup_vendors, parse_pool
 
 logger = logging.getLogger(__name__)
 
+# Hostname resolutions still running; they outlive the scan that started them
+_enrichment: set[asyncio.Task] = set()
+
+
+async def _broadcast_changes(changes: list[dict]) -> None:
+    """Drop cached responses and push device-state changes as one compact delta event."""
+    response_cache.invalidate()
+    if changes:
+        await ws_manager.broadcast("lan_scanner:device_delta", {
+            "epoch": device_state.epoch,
+            "from_seq": changes[0]["seq"],
+            "seq": changes[-1]["seq"],
+            "changes": changes,
+        })
+
+
+async def _resolve_hostnames(devices: list[dict]) -> None:
+    """Enrichment stage: resolve a persisted batch's hostnames without holding up discovery."""
+    clock = PhaseClock()
+    hostnames = await hostname_resolver.resolve_many(
+        [d["ip_address"] for d in devices], deadline=HOSTNAME_ENRICH_DEADLINE
+    )
+    clock.lap("hostnames")
+    resolved = {
+        d["mac_address"]: hostnames[d["ip_address"]]
+        for d in devices
+        if hostnames.get(d["ip_address"]) and d["mac_address"] != "unknown"
+    }
+    if resolved:
+        async with async_session_factory() as session:
+            await update_hostnames(session, resolved, await bump_generation(session))
+            await session.commit()
+        await _broadcast_changes(
+            device_state.apply_fields({mac: {"hostname": name} for mac, name in resolved.items()})
+        )
 
-async def run_scan():
-    """Execute a full network scan, update DB, and broadcast results."""
-    await ws_manager.broadcast("lan_scanner:scan_started", {})
-    start_time = time.time()
 
-    subnets = detect_subnets()
-    all_devices = []
-    scan_method = "arp"
+def _enrichment_done(task: asyncio.Task) -> None:
+    _enrichment.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Hostname enrichment failed", exc_info=task.exception())
 
-    for subnet in subnets:
-        try:
-            devices, method = await scan_network(subnet)
-            all_devices.extend(devices)
-            if method == "ping":
-                scan_method = "ping"
-        except Exception as e:
-            logger.error("Scan failed for %s: %s", subnet, e)
 
-    duration_ms = int((time.time() - start_time) * 1000)
-    now = datetime.now(timezone.utc)
+async def cancel_enrichment() -> None:
+    """Cancel hostname resolutions still running, e.g. at shutdown."""
+    for task in _enrichment:
+        task.cancel()
+    await asyncio.gather(*_enrichment, return_exceptions=True)
+
+
+async def run_scan(scan_id: int, subnets: list[str]):
+    """Execute a full network scan, update DB, and broadcast results.
+
+    Devices are persisted and broadcast in micro-batches while the scan runs;
+    offline marking, the scan record and the history point are written in one
+    transaction at the end. Hostnames are resolved by background tasks that
+    write and broadcast them as they arrive, so neither the scan's duration nor
+    its lease waits on DNS. Run through ``start_scan``, which holds the subnet
+    leases and created the running ``ScanRecord`` ``scan_id``. Profiled when a
+    ``scan`` capture is armed (``POST /api/profiling``).
+    """
+    with profiler.capture("scan", f"scan-{scan_id}", scan_id=scan_id, subnets=subnets):
+        await _run_scan(scan_id, subnets)
+
+
+async def _run_scan(scan_id: int, subnets: list[str]):
+    await ws_manager.broadcast("lan_scanner:scan_started", {"scan_id": scan_id})
+    start_time = time.time()
+    # Scan timestamp: stamped on every device seen, which is how absence is detected.
+    # Naive UTC like every stored timestamp; PostgreSQL rejects aware values for these columns.
+    now = utc_naive(datetime.now(timezone.utc))
+
+    budget = ScanBudget(SCAN_MAX_INFLIGHT_PROBES, SCAN_INTERFACE_RATE_PPS, SCAN_DEADLINE_SECONDS)
+    subnet_results: list[SubnetResult] = []
+    device_count = 0
     new_count = 0
-    offline_count = 0
+    clock = PhaseClock()
+
+    async for batch in stream_subnets(subnets, budget, subnet_results):
+        clock.lap("discovery")
+        vendors = await parse_pool().run(lookup_vendors, [d["mac_address"] for d in batch])
+        for device in batch:
+            device["vendor"] = vendors.get(device["mac_address"])
+        clock.lap("enrichment")
+
+        async with async_session_factory() as session:
+            upserted = await upsert_devices(session, batch, now, await bump_generation(session))
+            await session.commit()
+        device_count += upserted.seen_count
+        new_count += len(upserted.new_devices)
+        clock.lap("reconcile")
+        await _broadcast_changes(device_state.apply_upserted(upserted.rows))
+
+        await ws_manager.broadcast("lan_scanner:device_found", {
+            "devices": batch,
+            "devices_found": device_count,
+        })
+        for device_data in upserted.new_devices:
+            await ws_manager.broadcast("lan_scanner:device_new", device_data)
+
+        task = asyncio.create_task(_resolve_hostnames(batch))
+        _enrichment.add(task)
+        task.add_done_callback(_enrichment_done)
+        clock.lap("broadcast")
+    # The sweep's tail after its last batch
+    clock.lap("discovery")
+
+    scan_method = {r.method for r in subnet_results if r.method}
+    scan_method = scan_method.pop() if len(scan_method) == 1 else ("mixed" if scan_method else "arp")
+    # Only a complete sweep proves absence: devices go offline in completed subnets only
+    complete_subnets = [r.subnet for r in subnet_results if r.status == "completed"]
+    complete = len(complete_subnets) == len(subnet_results)
+    duration_ms = int((time.time() - start_time) * 1000)
 
     async with async_session_factory() as session:
-        # Track which MACs we found in this scan
-        found_macs = set()
-
-        for device_data in all_devices:
-            mac = device_data.get("mac_address", "unknown")
-            if mac == "unknown":
-                continue
-            found_macs.add(mac)
-
-            result = await session.execute(select(Device).where(Device.mac_address == mac))
-            existing = result.scalar_one_or_none()
-
-            if existing:
-                existing.ip_address = device_data["ip_address"]
-                existing.hostname = device_data.get("hostname") or existing.hostname
-                existing.vendor = device_data.get("vendor") or existing.vendor
-                existing.status = "online"
-                existing.last_seen = now
-            else:
-                new_device = Device(
-                    mac_address=mac,
-                    ip_address=device_data["ip_address"],
-                    hostname=device_data.get("hostname"),
-                    vendor=device_data.get("vendor"),
-                    status="online",
-                    first_seen=now,
-                    last_seen=now,
-                )
-                session.add(new_device)
-                new_count += 1
-                await ws_manager.broadcast("lan_scanner:device_new", device_data)
-
-        # Mark devices not seen as offline
-        all_result = await session.execute(select(Device).where(Device.status == "online"))
-        for device in all_result.scalars():
-            if device.mac_address not in found_macs:
-                device.status = "offline"
-                offline_count += 1
-                await ws_manager.broadcast("lan_scanner:device_offline", {
-                    "ip_address": device.ip_address,
-                    "mac_address": device.mac_address,
-                })
-
-        # Create scan record
-        scan_record = ScanRecord(
-            subnet=",".join(subnets),
-            device_count=len(all_devices),
-            new_devices=new_count,
-            offline_devices=offline_count,
-            scan_method=scan_method,
-            scan_duration_ms=duration_ms,
-            status="completed",
-            started_at=now,
-            completed_at=datetime.now(timezone.utc),
-        )
-        session.add(scan_record)
-        await session.flush()
+        result = await finalize_scan(session, now, await bump_generation(session), complete_subnets)
+        await update_presence(session, now, complete_subnets)
+        offline_count = len(result.offline_devices)
+
+        # Complete the scan record
+        scan_record = await session.get(ScanRecord, scan_id)
+        scan_record.device_count = device_count
+        scan_record.new_devices = new_count
+        scan_record.offline_devices = offline_count
+        scan_record.scan_method = scan_method
+        scan_record.scan_duration_ms = duration_ms
+        scan_record.subnet_results = [r.to_record() for r in subnet_results]
+        scan_record.status = "completed" if complete else "partial"
+        scan_record.completed_at = utc_naive(datetime.now(timezone.utc))
 
         # Record history point
-        total_result = await session.execute(select(Device))
-        all_devs = total_result.scalars().all()
-        online = sum(1 for d in all_devs if d.status == "online")
-        offline = sum(1 for d in all_devs if d.status == "offline")
-
         history = DeviceHistory(
             scan_id=scan_record.id,
             timestamp=now,
-            online_count=online,
-            offline_count=offline,
-            total_count=online + offline,
+            online_count=result.online_count,
+            offline_count=result.offline_count,
+            total_count=result.total_count,
         )
         session.add(history)
+        await record_rollups(session, now, result.online_count, result.offline_count, result.total_count)
         await session.commit()
+    clock.lap("reconcile")
+
+    await _broadcast_changes(device_state.apply_offline(d["mac_address"] for d in result.offline_devices))
+    for device_data in result.offline_devices:
+        await ws_manager.broadcast("lan_scanner:device_offline", device_data)
 
     await ws_manager.broadcast("lan_scanner:scan_complete", {
-        "total_devices": len(all_devices),
+        "scan_id": scan_id,
+        "total_devices": device_count,
         "new_devices": new_count,
         "offline_devices": offline_count,
         "scan_duration_ms": duration_ms,
         "subnets": subnets,
+        "status": "completed" if complete else "partial",
     })
+    clock.lap("broadcast")
+    scan_duration_seconds.labels("completed" if complete else "partial").observe(time.time() - start_time)
     logger.info("Scan complete: %d devices found, %d new, %d offline (%dms)",
-                len(all_devices), new_count, offline_count, duration_ms)
+                device_count, new_count, offline_count, duration_ms)
+
+
+async def apply_synced_devices(rows: list[dict]) -> None:
+    """``data_sync`` callback: record and push device rows written since its last poll.
+
+    Called whenever the shared generation moved, so cached responses are dropped
+    even when only scan records or history changed.
+    """
+    await _broadcast_changes(device_state.apply_rows(rows))
+
+
+async def start_scan() -> tuple[int | None, bool]:
+    """Start a scan of the detected subnets unless one is already running anywhere.
+
+    Returns the scan id and whether this call started it; a request made while a
+    scan holds the subnets gets that scan's id instead.
+    """
+    subnets = detect_subnets(refresh=True)
+    scan_id, started = await scan_coordinator.start(subnets, lambda scan_id: run_scan(scan_id, subnets))
+    if started:
+        # The running record is visible in GET /scans
+        response_cache.invalidate()
+    else:
+        logger.info("Scan %s already running; request collapsed into it", scan_id)
+    return scan_id, started
+
+
+async def run_scheduled_scan():
+    """Scheduler entry point: start a scan and wait for it, or skip if one is running."""
+    _, started = await start_scan()
+    if started:
+        await scan_coordinator.wait()
+
+
+async def run_history_maintenance():
+    """Prune raw history points and rollups past their retention."""
+    async with async_session_factory() as session:
+        removed = await prune_history(session, datetime.now(timezone.utc))
+        if any(removed.values()):
+            await bump_generation(session)
+        await session.commit()
+    if any(removed.values()):
+        response_cache.invalidate()
+        logger.info("History retention: removed %s", removed)
+
+
+# Scheduled task handlers by manifest task_id
+TASKS = {
+    "periodic_lan_scan": run_scheduled_scan,
+    "history_retention": run_history_maintenance,
+}
@@ -0,0 +1,211 @@
+"""OUI → vendor index loaded once per process.
+
+The vendor list (the ``PREFIX:Vendor`` text file that mac_vendor_lookup keeps
+in ``~/.cache``, or ``DATA_DIR/oui.txt``) is compiled into a sorted binary
+index in ``DATA_DIR`` and memory-mapped, so lookups are a bisect over a flat
+array instead of a reload of the whole database.
+"""
+
+import array
+import bisect
+import logging
+import mmap
+import os
+import struct
+from functools import lru_cache
+from pathlib import Path
+
+from config import DATA_DIR, VENDOR_LOOKUP_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+INDEX_PATH = DATA_DIR / "oui.idx"
+SOURCE_PATHS = (
+    DATA_DIR / "oui.txt",
+    Path(os.path.expanduser("~/.cache/mac-vendors.txt")),
+)
+
+_MAGIC = b"KOUI"
+_VERSION = 1
+# magic, version, entry count, string table offset
+_INDEX_HEADER = struct.Struct("<4sIII")
+_HEADER_SIZE = 16
+# MA-S (36-bit), MA-M (28-bit) and MA-L (24-bit) assignments, most specific first
+_PREFIX_BITS = (36, 28, 24)
+
+
+def _key(bits: int, prefix: int) -> int:
+    return (bits << 48) | prefix
+
+
+def parse_mac(mac: str) -> int | None:
+    digits = mac.replace(":", "").replace("-", "").replace(".", "")
+    if len(digits) != 12:
+        return None
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return None
+
+
+def parse_vendor_source(path: Path) -> dict[int, str]:
+    """Read ``PREFIX:Vendor`` lines where PREFIX is 6, 7 or 9 hex digits."""
+    entries: dict[int, str] = {}
+    with open(path, "rb") as f:
+        for line in f:
+            prefix, sep, vendor = line.strip().partition(b":")
+            if not sep or len(prefix) not in (6, 7, 9):
+                continue
+            try:
+                value = int(prefix, 16)
+            except ValueError:
+                continue
+            entries[_key(len(prefix) * 4, value)] = vendor.decode("utf-8", "replace").strip()
+    return entries
+
+
+def write_index(entries: dict[int, str], path: Path) -> None:
+    keys = array.array("Q", sorted(entries))
+    offsets = array.array("I")
+    strings = bytearray()
+    for key in keys:
+        offsets.append(len(strings))
+        raw = entries[key].encode("utf-8")
+        strings += struct.pack("<H", len(raw)) + raw
+    strings_offset = _HEADER_SIZE + len(keys) * 12
+    # Per process: app workers starting together may each rebuild the index
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(_INDEX_HEADER.pack(_MAGIC, _VERSION, len(keys), strings_offset))
+        f.write(keys.tobytes())
+        f.write(offsets.tobytes())
+        f.write(strings)
+    os.replace(tmp, path)
+
+
+class VendorIndex:
+    def __init__(self, cache_size: int = VENDOR_LOOKUP_CACHE_SIZE):
+        self._mmap: mmap.mmap | None = None
+        self._keys: memoryview | None = None
+        self._offsets: memoryview | None = None
+        self._strings_offset = 0
+        self._dict: dict[int, str] | None = None
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    @property
+    def loaded(self) -> bool:
+        return self._keys is not None or self._dict is not None
+
+    def __len__(self) -> int:
+        if self._keys is not None:
+            return len(self._keys)
+        return len(self._dict or ())
+
+    @staticmethod
+    def _source() -> Path | None:
+        return next((p for p in SOURCE_PATHS if p.exists()), None)
+
+    def needs_download(self) -> bool:
+        """Whether there is neither an index to map nor a vendor list to build one from."""
+        return not INDEX_PATH.exists() and self._source() is None
+
+    async def download(self) -> bool:
+        """Fetch the vendor list into mac_vendor_lookup's cache, on the event loop."""
+        try:
+            from mac_vendor_lookup import AsyncMacLookup
+        except ImportError:
+            return False
+        try:
+            await AsyncMacLookup().update_vendors()
+        except Exception as e:
+            logger.warning("Downloading the OUI vendor list failed: %s", e)
+            return False
+        return True
+
+    def load(self) -> None:
+        """Map the prebuilt index, rebuilding it first when the source list is newer."""
+        source = self._source()
+        if INDEX_PATH.exists() and (source is None or INDEX_PATH.stat().st_mtime >= source.stat().st_mtime):
+            try:
+                self._map(INDEX_PATH)
+                return
+            except (OSError, ValueError) as e:
+                logger.warning("Vendor index %s unusable, rebuilding: %s", INDEX_PATH, e)
+        if source is None:
+            logger.warning("No OUI vendor list available, vendor lookup disabled")
+            return
+        entries = parse_vendor_source(source)
+        try:
+            write_index(entries, INDEX_PATH)
+            self._map(INDEX_PATH)
+        except OSError as e:
+            logger.warning("Could not write vendor index %s, keeping it in memory: %s", INDEX_PATH, e)
+            self._dict = entries
+        logger.info("Vendor index loaded: %d prefixes from %s", len(self), source)
+
+    def attach(self) -> None:
+        """Map the index an app process already built, e.g. from a worker process.
+
+        Never writes: without a usable index file the vendor list, if any, is
+        parsed into memory, so workers cannot race each other on the index.
+        """
+        try:
+            self._map(INDEX_PATH)
+        except (OSError, ValueError):
+            source = self._source()
+            if source is not None:
+                self._dict = parse_vendor_source(source)
+
+    def _map(self, path: Path) -> None:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, strings_offset = _INDEX_HEADER.unpack_from(mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            mm.close()
+            raise ValueError("bad vendor index header")
+        view = memoryview(mm)
+        self.close()
+        self._mmap = mm
+        self._keys = view[_HEADER_SIZE:_HEADER_SIZE + count * 8].cast("Q")
+        self._offsets = view[_HEADER_SIZE + count * 8:strings_offset].cast("I")
+        self._strings_offset = strings_offset
+        self._dict = None
+        self.lookup.cache_clear()
+
+    def _find(self, key: int) -> str | None:
+        if self._dict is not None:
+            return self._dict.get(key)
+        keys = self._keys
+        i = bisect.bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return None
+        start = self._strings_offset + self._offsets[i]
+        (length,) = struct.unpack_from("<H", self._mmap, start)
+        return self._mmap[start + 2:start + 2 + length].decode("utf-8")
+
+    def _lookup(self, mac: str) -> str | None:
+        if not self.loaded:
+            return None
+        value = parse_mac(mac)
+        if value is None:
+            return None
+        for bits in _PREFIX_BITS:
+            vendor = self._find(_key(bits, value >> (48 - bits)))
+            if vendor is not None:
+                return vendor
+        return None
+
+    def lookup_many(self, macs: list[str]) -> dict[str, str | None]:
+        lookup = self.lookup
+        return {mac: lookup(mac) for mac in macs}
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._keys.release()
+            self._offsets.release()
+            self._keys = self._offsets = None
+            self._mmap.close()
+            self._mmap = None
+
+
+vendor_index = VendorIndex()
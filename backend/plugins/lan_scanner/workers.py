@@ -0,0 +1,30 @@
+"""The plugin's ``parse`` process pool and the work sent to it.
+
+Decoding scapy's ARP replies, parsing the kernel neighbour table and vendor
+lookups for a discovered batch run in worker processes, so a large scan does
+not hold the GIL the API's event loop needs. Functions run here take and
+return plain picklable values and load what they need themselves.
+"""
+
+from core.workers import WorkerPool, create_pool
+from plugins.lan_scanner.vendors import vendor_index
+
+PARSE_POOL = "parse"
+
+
+def parse_pool() -> WorkerPool:
+    """The process pool ``lan_scanner.parse``, as sized by the manifest once the plugin initialized."""
+    return create_pool(f"lan_scanner.{PARSE_POOL}", "process")
+
+
+_attached = False
+
+
+def lookup_vendors(macs: list[str]) -> dict[str, str | None]:
+    """``vendor_index.lookup_many`` in a worker, mapping the app's index on first use."""
+    global _attached
+    if not _attached and not vendor_index.loaded:
+        # Once per process: with no vendor list, lookups just return None
+        vendor_index.attach()
+    _attached = True
+    return vendor_index.lookup_many(macs)
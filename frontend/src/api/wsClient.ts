@@ -14,6 +14,13 @@ class WSClient {
   private connect() {
     this.ws = new WebSocket(this.url)
 
+    this.ws.onopen = () => {
+      // The server only forwards events this client has subscribed to
+      if (this.listeners.size > 0) {
+        this.send({ action: 'subscribe', topics: [...this.listeners.keys()] })
+      }
+    }
+
     this.ws.onmessage = (event) => {
       try {
         const msg = JSON.parse(event.data)
@@ -35,13 +42,25 @@ class WSClient {
     }
   }
 
+  private send(message: Record<string, unknown>) {
+    if (this.connected) {
+      this.ws!.send(JSON.stringify(message))
+    }
+  }
+
   subscribe(event: string, callback: WSListener): () => void {
     if (!this.listeners.has(event)) {
       this.listeners.set(event, new Set())
+      this.send({ action: 'subscribe', topics: [event] })
     }
     this.listeners.get(event)!.add(callback)
     return () => {
-      this.listeners.get(event)?.delete(callback)
+      const callbacks = this.listeners.get(event)
+      callbacks?.delete(callback)
+      if (callbacks?.size === 0) {
+        this.listeners.delete(event)
+        this.send({ action: 'unsubscribe', topics: [event] })
+      }
     }
   }
 
@@ -37,7 +37,9 @@ export function DataTable({ columns, data }: DataTableProps) {
     ? [...data].sort((a, b) => {
         const va = String(a[sortKey] ?? '')
         const vb = String(b[sortKey] ?? '')
-        return sortAsc ? va.localeCompare(vb) : vb.localeCompare(va)
+        // numeric collation orders IP addresses (10.0.0.2 before 10.0.0.10)
+        const cmp = va.localeCompare(vb, undefined, { numeric: true })
+        return sortAsc ? cmp : -cmp
       })
     : data
 
@@ -1,12 +1,34 @@
 import { useState, useEffect, useCallback } from 'react'
 import { apiFetch } from '../../api/client'
 import { useWebSocket } from '../../hooks/useWebSocket'
+import { useDeviceDeltas } from '../../hooks/useDeviceDeltas'
 import { Card } from '../common/Card'
 import { DataTable } from '../common/DataTable'
 import { LoadingSpinner } from '../common/LoadingSpinner'
 import type { WidgetConfig } from '../../types'
 
+function DeltaTableWidget({ config }: { config: WidgetConfig }) {
+  const { data, loading } = useDeviceDeltas(
+    config.data_endpoint.replace('/api', ''),
+    config.delta_event!,
+    config.refresh_event,
+  )
+
+  if (loading) return <LoadingSpinner />
+
+  return (
+    <Card title={config.title}>
+      <DataTable columns={config.columns || []} data={data} />
+    </Card>
+  )
+}
+
 export function TableWidget({ config }: { config: WidgetConfig }) {
+  if (config.delta_event) return <DeltaTableWidget config={config} />
+  return <FetchTableWidget config={config} />
+}
+
+function FetchTableWidget({ config }: { config: WidgetConfig }) {
   const [data, setData] = useState<Record<string, unknown>[]>([])
   const [loading, setLoading] = useState(true)
 
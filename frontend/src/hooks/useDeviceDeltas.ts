@@ -0,0 +1,104 @@
+import { useCallback, useEffect, useRef, useState } from 'react'
+import { apiFetch } from '../api/client'
+import { useWebSocket } from './useWebSocket'
+
+type Row = Record<string, unknown>
+
+interface DeviceChange {
+  seq: number
+  op: 'new' | 'update' | 'offline' | 'seen'
+  mac_address?: string
+  fields?: Row
+  last_seen?: string
+  macs?: string[]
+}
+
+interface DeviceChangesResponse {
+  epoch: string
+  seq: number
+  full: boolean
+  devices: Row[]
+  changes: DeviceChange[]
+}
+
+interface DeviceDeltaEvent {
+  epoch: string
+  from_seq: number
+  seq: number
+  changes: DeviceChange[]
+}
+
+/**
+ * Keeps a device list in sync from `<endpoint>?since=<seq>` plus pushed delta
+ * events, refetching a full snapshot only when the server says so.
+ */
+export function useDeviceDeltas(endpoint: string, deltaEvent: string, resyncEvent: string) {
+  const rows = useRef(new Map<string, Row>())
+  const cursor = useRef({ epoch: '', seq: 0 })
+  const syncing = useRef(false)
+  const [data, setData] = useState<Row[]>([])
+  const [loading, setLoading] = useState(true)
+
+  const publish = () => setData([...rows.current.values()])
+
+  const applyChanges = (changes: DeviceChange[]) => {
+    for (const change of changes) {
+      if (change.seq <= cursor.current.seq) continue
+      if (change.op === 'seen') {
+        change.macs?.forEach((mac) => {
+          const row = rows.current.get(mac)
+          if (row) rows.current.set(mac, { ...row, last_seen: change.last_seen })
+        })
+      } else if (change.mac_address) {
+        const row = change.op === 'new' ? {} : rows.current.get(change.mac_address)
+        if (row) rows.current.set(change.mac_address, { ...row, ...change.fields })
+      }
+      cursor.current.seq = change.seq
+    }
+  }
+
+  const catchUp = useCallback(async () => {
+    if (syncing.current) return
+    syncing.current = true
+    try {
+      const { epoch, seq } = cursor.current
+      const query = `since=${seq}` + (epoch ? `&epoch=${epoch}` : '')
+      const result = await apiFetch<DeviceChangesResponse>(`${endpoint}?${query}`)
+      if (result.full) {
+        rows.current = new Map(result.devices.map((d) => [String(d.mac_address), d]))
+        cursor.current = { epoch: result.epoch, seq: result.seq }
+      } else {
+        applyChanges(result.changes)
+      }
+      publish()
+    } catch {
+      // keep old data
+    } finally {
+      syncing.current = false
+      setLoading(false)
+    }
+  }, [endpoint])
+
+  const onDelta = useCallback(
+    (payload: Record<string, unknown>) => {
+      const delta = payload as unknown as DeviceDeltaEvent
+      if (delta.epoch !== cursor.current.epoch || delta.from_seq > cursor.current.seq + 1) {
+        // Missed changes (reconnect, restart): fetch only what is missing
+        catchUp()
+        return
+      }
+      applyChanges(delta.changes)
+      publish()
+    },
+    [catchUp],
+  )
+
+  useEffect(() => {
+    catchUp()
+  }, [catchUp])
+
+  useWebSocket(deltaEvent, onDelta)
+  useWebSocket(resyncEvent, catchUp)
+
+  return { data, loading }
+}
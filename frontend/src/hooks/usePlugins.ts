@@ -1,5 +1,6 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useCallback } from 'react'
 import { apiFetch } from '../api/client'
+import { useWebSocket } from './useWebSocket'
 import type { PluginManifest } from '../types'
 
 export function usePlugins() {
@@ -7,7 +8,7 @@ export function usePlugins() {
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState<string | null>(null)
 
-  const fetchPlugins = async () => {
+  const fetchPlugins = useCallback(async () => {
     try {
       const data = await apiFetch<PluginManifest[]>('/plugins')
       setPlugins(data.sort((a, b) => a.frontend.sidebar_order - b.frontend.sidebar_order))
@@ -17,11 +18,14 @@ export function usePlugins() {
     } finally {
       setLoading(false)
     }
-  }
+  }, [])
 
   useEffect(() => {
     fetchPlugins()
-  }, [])
+  }, [fetchPlugins])
+
+  // Plugins reloaded, enabled or disabled at runtime
+  useWebSocket('system:plugins_changed', fetchPlugins)
 
   return { plugins, loading, error, refresh: fetchPlugins }
 }
@@ -10,6 +10,7 @@ export interface WidgetConfig {
   title: string
   data_endpoint: string
   refresh_event: string
+  delta_event?: string
   columns?: WidgetColumn[]
   chart_type?: 'line' | 'bar' | 'area'
 }